@@ -0,0 +1,91 @@
+"""Benchmark of the ``fastq-extract`` minimizer prefilter.
+
+Simulates a random genome, a panel of marker sites on it, and reads from it, and compares the
+throughput of the batch engine with and without the prefilter.  The panel is *dense* if most
+reads contain a marker k-mer and *sparse* if few do, as for whole-genome reads and a panel of
+some thousand sites.
+
+Run with ``python benchmarks/prefilter.py`` after installing ``qctk``, e.g., with
+``pip install -e .``.
+"""
+
+import random
+import time
+
+import numpy as np
+
+from qctk.common import revcomp
+from qctk.config import DEFAULT_MINIMIZER_LENGTH, DEFAULT_MINIMIZER_WINDOW
+from qctk.fastq.engines import BatchEngine
+from qctk.fastq.index import MarkerIndex
+from qctk.fastq.minimizer import MinimizerPrefilter
+from qctk.models.fastq import KmerInfo
+from qctk.models.vcf import Site
+
+#: Genome length, number of sites, and number of reads of the scenarios.
+SCENARIOS = {"dense": (2000000, 10000, 20000), "sparse": (100000000, 10000, 20000)}
+
+#: Read length, k-mer length, and batch size.
+READ_LENGTH, KMER_LENGTH, BATCH_SIZE = 150, 21, 4096
+
+
+def simulate(genome_length, num_sites, num_reads, rng):
+    """Return the k-mer infos of ``num_sites`` random SNVs and ``num_reads`` reads from both
+    strands of a random genome of ``genome_length``.
+    """
+    bases = np.random.RandomState(rng.randrange(2 ** 32)).randint(4, size=genome_length)
+    genome = np.frombuffer(b"ACGT", dtype=np.uint8)[bases].tobytes().decode("ascii")
+    half = KMER_LENGTH // 2
+    kmer_infos = []
+    for pos in rng.sample(range(half, genome_length - half), num_sites):
+        ref = genome[pos]
+        alt = rng.choice([base for base in "ACGT" if base != ref])
+        kmer_infos.append(
+            KmerInfo(
+                site=Site("GRCh37", "1", pos + 1, ref, alt),
+                ref_kmer=genome[pos - half : pos + half + 1],
+            )
+        )
+    reads = []
+    for i in range(num_reads):
+        begin = rng.randrange(genome_length - READ_LENGTH)
+        read = genome[begin : begin + READ_LENGTH]
+        reads.append((revcomp(read) if i % 2 else read).encode("ascii"))
+    return kmer_infos, reads
+
+
+def reads_per_second(engine, index, reads, repeats=5):
+    """Return the best throughput of counting ``reads`` with ``engine`` over ``repeats`` runs."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        engine.count(reads, index.new_counts())
+        best = min(best, time.perf_counter() - start)
+    return len(reads) / best
+
+
+def main():
+    rng = random.Random(42)
+    for name, (genome_length, num_sites, num_reads) in SCENARIOS.items():
+        kmer_infos, reads = simulate(genome_length, num_sites, num_reads, rng)
+        index = MarkerIndex.from_kmer_infos(kmer_infos)
+        engine = BatchEngine(index, BATCH_SIZE)
+        prefilter = MinimizerPrefilter(
+            engine, DEFAULT_MINIMIZER_LENGTH, DEFAULT_MINIMIZER_WINDOW, BATCH_SIZE
+        )
+        plain = reads_per_second(engine, index, reads)
+        filtered = reads_per_second(prefilter, index, reads)
+        print(
+            "%-6s  batch: %8.0f reads/s  with prefilter: %8.0f reads/s (%.2fx, %.0f%% rejected)"
+            % (
+                name,
+                plain,
+                filtered,
+                filtered / plain,
+                100.0 * prefilter.take_stats().rejection_rate,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
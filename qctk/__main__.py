@@ -9,7 +9,10 @@ from .config import StorageEngine
 from .bam.extract import bam_extract_config_parser
 from .fastq.kmers import fastq_kmers_config_parser
 from .fastq.extract import fastq_extract_config_parser
+from .fastq.batch import fastq_extract_batch_config_parser
+from .fastq.verify import fastq_verify_config_parser
 from .compare.compare import compare_compare_config_parser
+from .recall.recall import recall_config_parser
 
 
 def main(argv=None):
@@ -35,7 +38,10 @@ def main(argv=None):
     bam_extract_config_parser(subparser)
     fastq_kmers_config_parser(subparser)
     fastq_extract_config_parser(subparser)
+    fastq_extract_batch_config_parser(subparser)
+    fastq_verify_config_parser(subparser)
     compare_compare_config_parser(subparser)
+    recall_config_parser(subparser)
 
     args = parser.parse_args(argv)
     logger.info("Options: %s" % vars(args))
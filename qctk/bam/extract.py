@@ -34,12 +34,19 @@ def calls_to_site_stats(
         for record in reader:
             key = "-".join(map(str, (genome_release, record.CHROM, record.POS)))
             dp = record.INFO.get("DP")
+            ads = record.calls[0].data.get("AD")
             if record.ALT:
-                ad = record.calls[0].data.get("AD")[1]
+                ad = ads[1]
             else:
-                ad = record.calls[0].data.get("AD")[0]
+                ad = ads[0]
             gt = vcf.Genotype.from_value(record.calls[0].data.get("GT"))
-            variant_stats[key] = vcf.VariantStats(genotype=gt, total_cov=dp, alt_cov=ad,)
+            variant_stats[key] = vcf.VariantStats(
+                genotype=gt,
+                total_cov=dp,
+                alt_cov=ad,
+                ref_count=ads[0],
+                alt_count=ads[1] if record.ALT else 0,
+            )
 
     return [vcf.SiteStats(site=site, stats=variant_stats[site.short_notation],) for site in sites]
 
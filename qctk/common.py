@@ -1,4 +1,5 @@
 import enum
+import itertools
 import pathlib
 import typing
 
@@ -49,9 +50,24 @@ def revcomp(nts: str) -> str:
 
     Characters not in "ACGTacgt" will be kept as identical.
     """
-    return "".join(map(lambda x: _RC.get(x, x), nts))
+    return "".join(map(lambda x: _RC.get(x, x), reversed(nts)))
 
 
 def flatten_list(lst: typing.List[typing.List[typing.Any]]) -> typing.List[typing.Any]:
     """Flatten the given list of list of values into a list of values."""
     return [item for sublist in lst for item in sublist]
+
+
+def batched(iterable: typing.Iterable[typing.Any], size: int) -> typing.Iterator[typing.List]:
+    """Yield lists of up to ``size`` consecutive elements from ``iterable``.
+
+    Raises ``ValueError`` if ``size`` is smaller than one.
+    """
+    if size < 1:
+        raise ValueError("Batch size must be at least 1, got %d" % size)
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -18,6 +18,49 @@ DEFAULT_THRESHOLD = 0.1
 #: The default minimal coverage.
 DEFAULT_MIN_COV = 5
 
+#: Default minimal number of allele observations at a site for ``recall`` to call its genotype.
+DEFAULT_RECALL_MIN_COV = 1
+
+#: Default number of reads to scan at once in batch k-mer counting.
+DEFAULT_BATCH_SIZE = 4096
+
+#: Default number of threads for decompressing BGZF input.
+DEFAULT_DECOMPRESS_THREADS = 4
+
+#: Default number of items that may wait between two stages of the ``fastq-extract`` pipeline.
+DEFAULT_QUEUE_DEPTH = 8
+
+#: Default length ``m`` of the ``m``-mers of the ``fastq-extract`` prefilter.
+DEFAULT_MINIMIZER_LENGTH = 15
+
+#: Default number ``w`` of consecutive ``m``-mers that the prefilter samples one of.
+DEFAULT_MINIMIZER_WINDOW = 7
+
+#: Default number of reads between two checks of the ``fastq-extract`` early stop conditions.
+DEFAULT_CHECKPOINT_READS = 1000000
+
+#: Default interval in seconds between two logs of the ``fastq-extract`` metrics.
+DEFAULT_METRICS_SECONDS = 60.0
+
+#: Default number of evenly spaced chunks read from BGZF input by the ``chunks`` reader.
+DEFAULT_SAMPLE_CHUNKS = 256
+
+#: Default number of FASTQ records read per chunk by the ``chunks`` reader.
+DEFAULT_CHUNK_RECORDS = 10000
+
+#: Default confidence at which ``fastq-verify`` decides on match or mismatch.
+DEFAULT_VERIFY_CONFIDENCE = 0.999
+
+#: Default fraction of discordant genotype calls expected by ``fastq-verify`` for the same sample.
+DEFAULT_VERIFY_ERROR_RATE = 0.05
+
+#: Default fraction of discordant genotype calls expected by ``fastq-verify`` for different
+#: samples.
+DEFAULT_VERIFY_MISMATCH_RATE = 0.5
+
+#: Default number of reads between two checks of the ``fastq-verify`` test statistic.
+DEFAULT_VERIFY_CHECKPOINT_READS = 100000
+
 
 #: Enumeration of the supported storage engines.
 class StorageEngine(enum.Enum):
@@ -0,0 +1,165 @@
+"""Aho-Corasick automaton over the marker k-mers.
+
+All reference and alternative k-mers are inserted into the automaton in both orientations.  As
+all patterns have the same length, a pattern can only end in its own trie leaf and the output
+of each state is at most one marker k-mer.  The transitions are completed into a dense table
+(a deterministic automaton) such that scanning a read costs one table lookup per base.
+"""
+
+import collections
+import hashlib
+import os
+import pathlib
+import typing
+
+import attr
+from logzero import logger
+import numpy as np
+
+from .encode import ENCODE_TABLE, INVALID, decode_kmer, revcomp_code
+from .index import MarkerIndex
+
+
+_TAhoCorasickAutomaton = typing.TypeVar("AhoCorasickAutomaton")
+
+#: Suffix of the file names of serialized automata.
+AUTOMATON_SUFFIX = ".aho.npz"
+
+
+def index_digest(index: MarkerIndex) -> str:
+    """Return a digest of the marker codes, used to check that a serialized automaton matches."""
+    digest = hashlib.sha256(index.codes.tobytes())
+    digest.update(str(index.kmer_length).encode("ascii"))
+    return digest.hexdigest()
+
+
+@attr.s(auto_attribs=True, frozen=True, eq=False)
+class AhoCorasickAutomaton:
+    """Deterministic Aho-Corasick automaton over the marker k-mers of a ``MarkerIndex``."""
+
+    #: Transition table with shape ``(num_states, 5)``, column ``INVALID`` leads to the root.
+    transitions: np.ndarray
+    #: Per state, slot of the matched k-mer in ``MarkerIndex.codes`` or ``-1``.
+    outputs: np.ndarray
+    #: Digest of the marker index that the automaton was built for.
+    digest: str
+
+    @property
+    def num_states(self) -> int:
+        return len(self.outputs)
+
+    @classmethod
+    def from_index(cls, index: MarkerIndex) -> _TAhoCorasickAutomaton:
+        kmer_length = index.kmer_length
+        goto = [[-1] * 4]
+        outputs = [-1]
+        for slot, code in enumerate(index.codes.tolist()):
+            for pattern in {code, revcomp_code(code, kmer_length)}:
+                state = 0
+                for c in decode_kmer(pattern, kmer_length).encode("ascii"):
+                    x = ENCODE_TABLE[c]
+                    if goto[state][x] == -1:
+                        goto[state][x] = len(goto)
+                        goto.append([-1] * 4)
+                        outputs.append(-1)
+                    state = goto[state][x]
+                outputs[state] = slot
+
+        # Compute failure links in BFS order and complete the transitions.
+        fail = [0] * len(goto)
+        queue = collections.deque()
+        for x in range(4):
+            if goto[0][x] == -1:
+                goto[0][x] = 0
+            else:
+                queue.append(goto[0][x])
+        while queue:
+            state = queue.popleft()
+            for x in range(4):
+                child = goto[state][x]
+                if child == -1:
+                    goto[state][x] = goto[fail[state]][x]
+                else:
+                    fail[child] = goto[fail[state]][x]
+                    queue.append(child)
+
+        transitions = np.zeros((len(goto), INVALID + 1), dtype=np.int32)
+        transitions[:, :4] = goto
+        return AhoCorasickAutomaton(
+            transitions=transitions,
+            outputs=np.array(outputs, dtype=np.int32),
+            digest=index_digest(index),
+        )
+
+    def save(self, path: typing.Union[str, pathlib.Path]) -> None:
+        """Write the automaton to the ``.npz`` file at ``path``."""
+        with open(str(path), "wb") as outputf:
+            np.savez(
+                outputf, transitions=self.transitions, outputs=self.outputs, digest=self.digest
+            )
+
+    @classmethod
+    def load(cls, path: typing.Union[str, pathlib.Path]) -> _TAhoCorasickAutomaton:
+        """Load automaton from the ``.npz`` file at ``path``."""
+        with np.load(str(path)) as data:
+            return AhoCorasickAutomaton(
+                transitions=data["transitions"],
+                outputs=data["outputs"],
+                digest=str(data["digest"]),
+            )
+
+
+def user_cache_dir() -> pathlib.Path:
+    """Return the directory for cached files of the user, used if the k-mer infos directory is
+    not writable.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or str(pathlib.Path.home() / ".cache")
+    return pathlib.Path(base) / "qctk"
+
+
+def automaton_cache_paths(kmer_infos_paths: typing.Sequence[str]) -> typing.List[pathlib.Path]:
+    """Return the candidate paths of the automaton for the panels in ``kmer_infos_paths``.
+
+    The automaton of a single panel is cached next to its k-mer infos, that of several panels
+    next to the first one under a name derived from all paths.  The second candidate is in
+    ``user_cache_dir()``, keyed by the absolute paths.
+    """
+    paths = [os.path.abspath(path) for path in kmer_infos_paths]
+    key = hashlib.sha256("\n".join(paths).encode("utf-8")).hexdigest()[:16]
+    if len(paths) == 1:
+        local = pathlib.Path(paths[0] + AUTOMATON_SUFFIX)
+    else:
+        local = pathlib.Path("%s.%s%s" % (paths[0], key, AUTOMATON_SUFFIX))
+    return [
+        local,
+        user_cache_dir() / ("%s.%s%s" % (os.path.basename(paths[0]), key, AUTOMATON_SUFFIX)),
+    ]
+
+
+def load_or_build_automaton(index: MarkerIndex) -> AhoCorasickAutomaton:
+    """Load the automaton cached for the source paths of ``index`` or build and store it.
+
+    See ``automaton_cache_paths()`` for the cache locations.  Nothing is cached for an index that
+    was not built from k-mer infos files.
+    """
+    cache_paths = automaton_cache_paths(index.source_paths) if index.source_paths else []
+    for cache_path in cache_paths:
+        if cache_path.exists():
+            automaton = AhoCorasickAutomaton.load(cache_path)
+            if automaton.digest == index_digest(index):
+                logger.info("Loaded Aho-Corasick automaton from %s", cache_path)
+                return automaton
+            logger.warning("Ignoring stale Aho-Corasick automaton in %s", cache_path)
+
+    logger.info("Building Aho-Corasick automaton...")
+    automaton = AhoCorasickAutomaton.from_index(index)
+    logger.info("Automaton has %s states", "{:,}".format(automaton.num_states))
+    for cache_path in cache_paths:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            automaton.save(cache_path)
+            logger.info("Wrote Aho-Corasick automaton to %s", cache_path)
+            break
+        except OSError as e:
+            logger.warning("Could not write Aho-Corasick automaton to %s: %s", cache_path, e)
+    return automaton
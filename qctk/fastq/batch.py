@@ -0,0 +1,201 @@
+"""Implementation of ``fastq-extract-batch``: fingerprint many samples listed in a sample sheet.
+
+The k-mer infos are loaded and the marker index and counting engine are built once.  The samples
+are then distributed over a pool of ``num_procs`` worker processes that inherit the engine from
+the parent process (copy-on-write after fork), and each worker writes the statistics of a sample
+as soon as it is finished.
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import pathlib
+import typing
+
+import attr
+from logzero import logger
+
+from .config import FastqExtractBatchConfig
+from .engines import build_engine
+from .extract import (
+    add_checkpoint_arguments,
+    add_counting_arguments,
+    add_partition_arguments,
+    add_stop_arguments,
+    check_counting_arguments,
+    extract_sample_stats,
+    write_sample_results,
+)
+from .index import MarkerIndex
+from .panels import MarkerPanel, load_panels, merge_panels, panel_paths
+from .readers import STDIN_PATH
+
+#: The configuration, marker panels, marker index, and engine of a worker process, set up by
+#: ``_init_worker()``.
+_worker_state = {}
+
+
+def read_sample_sheet(path: str) -> typing.List[typing.Tuple[str, typing.List[str]]]:
+    """Read the sample sheet at ``path`` and return the pairs of sample ID and input files.
+
+    Each line holds a sample ID followed by one or more input file paths, separated by tabs.
+    Empty lines, lines starting with ``#``, and a header line starting with ``sample_id`` are
+    skipped.
+    """
+    result = []
+    seen = set()
+    with open(path, "rt") as inputf:
+        for line_no, line in enumerate(inputf, 1):
+            if not line.strip() or line.startswith("#") or line.startswith("sample_id\t"):
+                continue
+            sample_id, *input_files = [field.strip() for field in line.rstrip("\n").split("\t")]
+            input_files = [input_file for input_file in input_files if input_file]
+            if not input_files:
+                raise ValueError("No input files for sample %s in line %d" % (sample_id, line_no))
+            elif sample_id in seen:
+                raise ValueError("Duplicate sample %s in line %d" % (sample_id, line_no))
+            elif STDIN_PATH in input_files:
+                raise ValueError("Cannot read sample %s from stdin in batch mode" % sample_id)
+            seen.add(sample_id)
+            result.append((sample_id, input_files))
+    return result
+
+
+def _extract_sample(
+    config: FastqExtractBatchConfig,
+    panels: typing.List[MarkerPanel],
+    index: MarkerIndex,
+    engine,
+    sample: typing.Tuple[str, typing.List[str]],
+) -> typing.Optional[typing.List[pathlib.Path]]:
+    """Fingerprint one ``sample`` and write its statistics, return ``None`` on failure."""
+    sample_id, input_files = sample
+    config = attr.evolve(config, sample_id=sample_id, input_files=input_files, num_procs=1)
+    try:
+        sample_stats, result = extract_sample_stats(config, panels, index, engine)
+        return write_sample_results(config, sample_stats, result)
+    except Exception as e:
+        logger.error("Could not process sample %s: %s", sample_id, e)
+        return None
+
+
+def _init_worker(
+    config: FastqExtractBatchConfig, panels: typing.List[MarkerPanel], index: MarkerIndex, engine
+) -> None:
+    _worker_state["config"] = config
+    _worker_state["panels"] = panels
+    _worker_state["index"] = index
+    _worker_state["engine"] = engine
+
+
+def _extract_sample_in_worker(
+    sample: typing.Tuple[str, typing.List[str]]
+) -> typing.Tuple[str, typing.Optional[typing.List[pathlib.Path]]]:
+    return (
+        sample[0],
+        _extract_sample(
+            _worker_state["config"],
+            _worker_state["panels"],
+            _worker_state["index"],
+            _worker_state["engine"],
+            sample,
+        ),
+    )
+
+
+def fastq_extract_batch_run(config: FastqExtractBatchConfig) -> int:
+    """Extract fingerprint information for all samples of a sample sheet.
+
+    Entry point from configuration.
+    """
+    logger.info("Running fastq-extract-batch")
+    logger.info("Configuration: %s", config)
+
+    if not config.common.storage_path:
+        logger.error("--storage-path must be provided!")
+        return 1
+    try:
+        samples = read_sample_sheet(config.sample_sheet)
+    except (OSError, ValueError) as e:
+        logger.error("Could not read sample sheet %s: %s", config.sample_sheet, e)
+        return 1
+
+    # TODO: storage plug and play
+    pathlib.Path(config.common.storage_path).mkdir(parents=True, exist_ok=True)
+
+    logger.info("Loading kmers...")
+    try:
+        panels = load_panels(config)
+    except ValueError as e:
+        logger.error("Could not load k-mer panels: %s", e)
+        return 1
+    if not check_counting_arguments(config, panels):
+        return 1
+    index = MarkerIndex.from_kmer_infos(
+        merge_panels(panels), config.mismatches, panel_paths(panels)
+    )
+    engine = build_engine(config, index)
+
+    logger.info("Analyzing FASTQ data of %d samples...", len(samples))
+    num_failed = 0
+    with contextlib.ExitStack() as stack:
+        if config.num_procs <= 1:
+            results = (
+                (sample[0], _extract_sample(config, panels, index, engine, sample))
+                for sample in samples
+            )
+        else:
+            pool = stack.enter_context(
+                multiprocessing.Pool(
+                    config.num_procs,
+                    initializer=_init_worker,
+                    initargs=(config, panels, index, engine),
+                )
+            )
+            results = pool.imap_unordered(_extract_sample_in_worker, samples)
+        for sample_id, paths_json in results:
+            if paths_json:
+                logger.info(
+                    "Wrote statistics of sample %s to %s",
+                    sample_id,
+                    ", ".join(map(str, paths_json)),
+                )
+            else:
+                num_failed += 1
+
+    if num_failed:
+        logger.error("Processing failed for %d of %d samples", num_failed, len(samples))
+        return 1
+    logger.info("All done. Have a nice day!")
+    return 0
+
+
+def fastq_extract_batch_main(args: argparse.Namespace) -> int:
+    """Extract fingerprint information for all samples of a sample sheet.
+
+    Entry point from argparse Namespace.
+    """
+    return fastq_extract_batch_run(FastqExtractBatchConfig.from_namespace(args))
+
+
+def fastq_extract_batch_config_parser(subparsers: argparse._SubParsersAction) -> None:
+    """Add command "fastq-extract-batch" to argument parser."""
+    parser = subparsers.add_parser(
+        "fastq-extract-batch",
+        help="Extract fingerprint information from the FASTQ files of many samples, building "
+        "the marker index once.",
+    )
+    parser.add_argument(
+        "--hidden-cmd", dest="cmd", default=fastq_extract_batch_main, help=argparse.SUPPRESS
+    )
+
+    parser.add_argument(
+        "--sample-sheet",
+        required=True,
+        help="Path to TSV file with one line per sample: the sample ID followed by the paths to "
+        "its FASTQ or SAM/BAM/CRAM files",
+    )
+    add_counting_arguments(parser)
+    add_partition_arguments(parser)
+    add_stop_arguments(parser)
+    add_checkpoint_arguments(parser)
@@ -0,0 +1,31 @@
+"""Vectorized genotype calling from the per-site reference and alternative depths."""
+
+import typing
+
+import numpy as np
+
+from ..models.vcf import Genotype
+
+
+#: Genotypes by the codes returned by ``genotype_codes()``, ``None`` is a no-call.
+GENOTYPE_CODES = (None, Genotype.REF, Genotype.HET, Genotype.HOM)
+
+
+def genotype_codes(threshold: float, ref_depths: np.ndarray, alt_depths: np.ndarray) -> np.ndarray:
+    """Return the index in ``GENOTYPE_CODES`` of the genotype call at each site."""
+    total_depths = ref_depths.astype(np.int64) + alt_depths
+    frac = alt_depths / np.maximum(total_depths, 1)
+    return np.select(
+        [total_depths == 0, frac < threshold, frac > 1.0 - threshold], [0, 1, 3], default=2
+    )
+
+
+def call_genotypes(
+    threshold: float, ref_depths: np.ndarray, alt_depths: np.ndarray
+) -> typing.List[typing.Optional[Genotype]]:
+    """Call genotypes from the per-site ref and alt depths with a simple alt fraction threshold.
+
+    Sites without coverage are no-calls (``None``).
+    """
+    codes = genotype_codes(threshold, ref_depths, alt_depths)
+    return [GENOTYPE_CODES[code] for code in codes.tolist()]
@@ -0,0 +1,219 @@
+"""Checkpoints of ``fastq-extract`` for resuming interrupted runs.
+
+Each pipeline periodically writes the counts of its input chunk to a small ``.npz`` file,
+together with the batches of the chunk that these counts cover.  Batches are numbered in input
+order; as several threads may count out of order, the progress is stored as the number of
+leading batches that were counted plus the numbers of the further counted batches.  A
+checkpoint is written to a temporary file that is then renamed over the previous one, so an
+interrupted write never corrupts it.
+
+For BGZF input (see ``readers.is_splittable()``), the virtual offset following each counted
+batch is stored too, and a rerun with ``resume`` starts from the stored counts and reads the
+input from the virtual offset following the leading counted batches.  Other input, such as
+plain gzip files and streams, is read and parsed from the start and the counted batches are
+skipped.  Only the further counted batches are skipped for BGZF input.  Checkpoints are
+removed once the sample statistics are written.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import typing
+
+from logzero import logger
+import numpy as np
+
+from .aho import index_digest
+from .config import FastqExtractConfig
+from .index import MarkerIndex
+from .partitions import Partition
+from .readers import InputChunk, VirtualOffset, is_stream
+from ..models.vcf import sample_path
+
+
+def checkpointing_enabled(config: FastqExtractConfig) -> bool:
+    """Return whether checkpoints are written or read."""
+    return config.checkpoint_seconds is not None or config.resume
+
+
+def checkpoint_dir(config: FastqExtractConfig) -> pathlib.Path:
+    """Return the directory with the checkpoints of the sample of ``config``."""
+    path_stats = sample_path(config.common.storage_path, config.sample_id)
+    return path_stats.with_name(path_stats.name.replace("-stats.json", "-checkpoint"))
+
+
+def checkpoint_path(config: FastqExtractConfig, chunk: InputChunk) -> pathlib.Path:
+    """Return the path to the checkpoint of ``chunk``."""
+    key = [chunk.path, chunk.part, chunk.num_parts]
+    if chunk.mate_path is not None:
+        key.append(chunk.mate_path)
+    key = json.dumps(key).encode("utf-8")
+    return checkpoint_dir(config) / (hashlib.sha256(key).hexdigest()[:16] + ".npz")
+
+
+def checkpoint_digest(config: FastqExtractConfig, index: MarkerIndex, chunk: InputChunk) -> str:
+    """Return a digest of everything that determines the batches of ``chunk``, their counts,
+    and when reading stops early, used to check that a checkpoint can be resumed from.
+    """
+    key = [
+        index_digest(index),
+        chunk.path,
+        chunk.part,
+        chunk.num_parts,
+        config.batch_size,
+        config.sample_fraction,
+        config.reader,
+        config.sample_chunks,
+        config.chunk_records,
+        config.partition_by,
+        config.threshold,
+        config.min_cov,
+        config.saturation_fraction,
+        config.stable_checkpoints,
+        config.checkpoint_reads,
+    ]
+    for path in chunk.paths:
+        if not is_stream(path):
+            stat = os.stat(path)
+            key += [path, stat.st_size, stat.st_mtime_ns]
+    return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+#: Virtual offsets of the input files of a chunk, ``None`` for input other than BGZF.
+Offsets = typing.Optional[typing.Tuple[VirtualOffset, ...]]
+
+
+class ChunkProgress:
+    """The batches of an input chunk that were counted."""
+
+    def __init__(
+        self,
+        num_reads: int = 0,
+        done_prefix: int = 0,
+        done_batches: typing.Optional[typing.Dict[int, Offsets]] = None,
+        complete: bool = False,
+        offsets: Offsets = None,
+    ):
+        #: Number of reads in the counted batches.
+        self.num_reads = num_reads
+        #: Number of leading batches that were counted.
+        self.done_prefix = done_prefix
+        #: Numbers of the further batches that were counted, with the offsets following them.
+        self.done_batches = dict(done_batches or {})
+        #: Whether all batches of the chunk were counted.
+        self.complete = complete
+        #: Offsets following the leading batches that were counted, where reading resumes.
+        self.offsets = offsets
+
+    def is_done(self, batch_no: int) -> bool:
+        return self.complete or batch_no < self.done_prefix or batch_no in self.done_batches
+
+    def add(self, batch_no: int, num_reads: int, offsets: Offsets = None) -> None:
+        """Mark batch ``batch_no`` with ``num_reads`` reads and followed by ``offsets`` as
+        counted.
+        """
+        self.num_reads += num_reads
+        self.done_batches[batch_no] = offsets
+        while self.done_prefix in self.done_batches:
+            self.offsets = self.done_batches.pop(self.done_prefix)
+            self.done_prefix += 1
+
+
+def _offsets_array(offsets: typing.Iterable[Offsets]) -> np.ndarray:
+    """Return the rows of block and data offsets of ``offsets``, empty rows for ``None``."""
+    rows = [
+        [] if row is None else [value for offset in row for value in (offset.block, offset.data)]
+        for row in offsets
+    ]
+    return np.array(rows, dtype=np.int64).reshape((len(rows), max(map(len, rows), default=0)))
+
+
+def _array_offsets(row: np.ndarray) -> Offsets:
+    """Return the offsets of a row of ``_offsets_array()``."""
+    if not len(row):
+        return None
+    return tuple(VirtualOffset(int(block), int(data)) for block, data in row.reshape((-1, 2)))
+
+
+def write_checkpoint(
+    path: pathlib.Path,
+    digest: str,
+    counts: np.ndarray,
+    progress: ChunkProgress,
+    partitions: typing.Optional[typing.Dict[str, Partition]] = None,
+) -> None:
+    """Atomically write the checkpoint with ``counts``, ``progress``, and the read group
+    ``partitions`` to ``path``.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path_tmp = path.with_name(path.name + ".tmp")
+    names = sorted(partitions or {})
+    with path_tmp.open("wb") as outputf:
+        np.savez_compressed(
+            outputf,
+            digest=digest,
+            counts=counts,
+            num_reads=progress.num_reads,
+            done_prefix=progress.done_prefix,
+            done_batches=np.array(sorted(progress.done_batches), dtype=np.int64),
+            done_offsets=_offsets_array(
+                progress.done_batches[batch_no] for batch_no in sorted(progress.done_batches)
+            ),
+            complete=progress.complete,
+            offsets=_offsets_array([progress.offsets])[0],
+            partition_names=np.array(names, dtype=str),
+            partition_counts=np.array(
+                [partitions[name].counts for name in names], dtype=counts.dtype
+            ).reshape((len(names),) + counts.shape),
+            partition_reads=np.array(
+                [partitions[name].num_reads for name in names], dtype=np.int64
+            ),
+        )
+        outputf.flush()
+        os.fsync(outputf.fileno())
+    os.replace(str(path_tmp), str(path))
+
+
+def read_checkpoint(
+    path: pathlib.Path, digest: str
+) -> typing.Optional[typing.Tuple[np.ndarray, ChunkProgress, typing.Dict[str, Partition]]]:
+    """Return the counts, progress, and read group partitions of the checkpoint at ``path``.
+
+    Return ``None`` if there is no checkpoint or it was written for different input or
+    options than given by ``digest``.
+    """
+    if not path.exists():
+        return None
+    with np.load(str(path)) as data:
+        if str(data["digest"]) != digest:
+            logger.warning("Ignoring stale checkpoint %s", path)
+            return None
+        return (
+            data["counts"],
+            ChunkProgress(
+                num_reads=int(data["num_reads"]),
+                done_prefix=int(data["done_prefix"]),
+                done_batches={
+                    batch_no: _array_offsets(row)
+                    for batch_no, row in zip(data["done_batches"].tolist(), data["done_offsets"])
+                },
+                complete=bool(data["complete"]),
+                offsets=_array_offsets(data["offsets"]),
+            ),
+            {
+                name: Partition(counts, int(num_reads))
+                for name, counts, num_reads in zip(
+                    data["partition_names"].tolist(),
+                    data["partition_counts"],
+                    data["partition_reads"].tolist(),
+                )
+            },
+        )
+
+
+def remove_checkpoints(config: FastqExtractConfig) -> None:
+    """Remove the checkpoints of the sample of ``config``."""
+    if checkpointing_enabled(config):
+        shutil.rmtree(str(checkpoint_dir(config)), ignore_errors=True)
@@ -1,6 +1,7 @@
 """Configuration for the commands implemented in the ``fastq`` module."""
 
 import argparse
+import enum
 import types
 import typing
 
@@ -8,12 +9,93 @@ import attr
 import cattr
 
 from ..common import GenomeRelease, DEFAULT_GENOME_RELEASE, flatten_list
-from ..config import CommonConfig, DEFAULT_KMER_LENGTH, DEFAULT_THRESHOLD
+from ..config import (
+    CommonConfig,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHECKPOINT_READS,
+    DEFAULT_CHUNK_RECORDS,
+    DEFAULT_DECOMPRESS_THREADS,
+    DEFAULT_KMER_LENGTH,
+    DEFAULT_METRICS_SECONDS,
+    DEFAULT_MIN_COV,
+    DEFAULT_MINIMIZER_LENGTH,
+    DEFAULT_MINIMIZER_WINDOW,
+    DEFAULT_QUEUE_DEPTH,
+    DEFAULT_SAMPLE_CHUNKS,
+    DEFAULT_THRESHOLD,
+    DEFAULT_VERIFY_CHECKPOINT_READS,
+    DEFAULT_VERIFY_CONFIDENCE,
+    DEFAULT_VERIFY_ERROR_RATE,
+    DEFAULT_VERIFY_MISMATCH_RATE,
+)
 
 
 _TBaseConfig = typing.TypeVar("_BaseConfig")
 
 
+def _as_list(value: typing.Union[None, str, typing.Iterable[str]]) -> typing.List[str]:
+    """Convert a single value or ``None`` for an option that accepts several values to a list."""
+    if value is None:
+        return []
+    elif isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class KmerEngine(enum.Enum):
+    """The k-mer counting engines available in ``fastq-extract``."""
+
+    #: Roll 2-bit codes over a block of reads in lock-step with NumPy.
+    ROLLING = "rolling"
+    #: Scan blocks of reads with vectorized NumPy operations.
+    BATCH = "batch"
+    #: Scan blocks of reads with an Aho-Corasick automaton over the marker k-mers.
+    AHO_CORASICK = "aho-corasick"
+
+
+#: The default k-mer counting engine.
+DEFAULT_KMER_ENGINE = KmerEngine.BATCH
+
+
+class ReaderStrategy(enum.Enum):
+    """The strategies for reading input files in ``fastq-extract``."""
+
+    #: Use ``mmap`` for uncompressed input files and ``sequential`` otherwise.
+    AUTO = "auto"
+    #: Read all records of the input files.
+    SEQUENTIAL = "sequential"
+    #: Read a fixed number of records from evenly spaced chunks of BGZF input files.
+    CHUNKS = "chunks"
+    #: Parse uncompressed input files through a memory map.
+    MMAP = "mmap"
+
+
+#: The default reader strategy.
+DEFAULT_READER_STRATEGY = ReaderStrategy.AUTO
+
+
+class PartitionKey(enum.Enum):
+    """The keys for partitioning the counts of ``fastq-extract`` besides the whole sample."""
+
+    #: One partition per input file, or per pair of files for paired-end input.
+    FILE = "file"
+    #: One partition per flow cell lane, parsed from Illumina read names.
+    READ_GROUP = "read-group"
+
+
+class StopCondition(enum.Enum):
+    """The reasons for ``fastq-extract`` to stop reading its input."""
+
+    #: All input was read.
+    EXHAUSTED = "exhausted"
+    #: The target fraction of sites reached the minimal coverage.
+    COVERAGE = "coverage"
+    #: The genotype calls did not change over the configured number of checkpoints.
+    STABLE_CALLS = "stable-calls"
+    #: ``fastq-verify`` reached a decision.
+    DECIDED = "decided"
+
+
 @attr.s(auto_attribs=True, frozen=True)
 class _BaseConfig:
     """Base class for the ``fastq-*`` configuration."""
@@ -48,6 +130,9 @@ class FastqKmersConfig(_BaseConfig):
     #: The genome release to select the sites VCF file for, by default GRCh37 will be used.
     genome_release: str = GenomeRelease.GRCH37.value
 
+    #: Number of worker processes to generate the k-mers of the contigs with.
+    num_procs: int = 1
+
 
 @attr.s(auto_attribs=True, frozen=True)
 class FastqExtractConfig(_BaseConfig):
@@ -59,19 +144,137 @@ class FastqExtractConfig(_BaseConfig):
     #: List with input FASTQ files to analyze.
     input_files: typing.List[str]
 
-    #: The kmer info file to use for the analysis.  If ``None`` then the sites kmer file
-    #: shipping with ``qctk`` will be used according to ``genome_release``.
-    kmer_infos: typing.Optional[str]
+    #: The kmer info files to use for the analysis, one per marker panel.  If empty then the
+    #: sites kmer files shipping with ``qctk`` will be used according to ``genome_release``.
+    kmer_infos: typing.List[str] = attr.ib(converter=_as_list)
 
-    #: The genome release to select the sites VCF file for, by default GRCh37 will be used.
-    genome_release: str = DEFAULT_GENOME_RELEASE.value
+    #: The genome releases to select the sites kmer files for, one panel per release.
+    genome_release: typing.List[str] = attr.ib(
+        default=attr.Factory(lambda: [DEFAULT_GENOME_RELEASE.value]), converter=_as_list
+    )
 
     #: The default threshold to use.
     threshold: float = DEFAULT_THRESHOLD
 
+    #: The k-mer counting engine to use.
+    engine: str = DEFAULT_KMER_ENGINE.value
+
+    #: Number of mismatches to tolerate in the marker k-mers, ``0`` or ``1``.
+    mismatches: int = 0
+
+    #: Whether consecutive input files are the R1 and R2 files of paired-end reads, counting
+    #: each marker allele at most once per fragment.
+    paired: bool = False
+
+    #: Number of reads to scan at once with the batch engine.
+    batch_size: int = DEFAULT_BATCH_SIZE
+
+    #: Degree of parallelism.
+    num_procs: int = 1
+
+    #: Number of threads per process for decompressing BGZF input.
+    decompress_threads: int = DEFAULT_DECOMPRESS_THREADS
+
+    #: Number of items that may wait between two pipeline stages.
+    queue_depth: int = DEFAULT_QUEUE_DEPTH
+
+    #: Number of counting threads per process.
+    count_threads: int = 1
+
+    #: Whether to skip reads that share no sampled ``m``-mer with the marker k-mers.
+    minimizer_prefilter: bool = False
+
+    #: Length ``m`` of the ``m``-mers of the prefilter.
+    minimizer_length: int = DEFAULT_MINIMIZER_LENGTH
+
+    #: The prefilter samples one of each ``w`` consecutive ``m``-mers.
+    minimizer_window: int = DEFAULT_MINIMIZER_WINDOW
+
+    #: Fraction of the reads to keep by hashing their names, ``None`` to keep all.
+    sample_fraction: typing.Optional[float] = None
+
+    #: The reader strategy to use.
+    reader: str = DEFAULT_READER_STRATEGY.value
+
+    #: Number of evenly spaced chunks to read with the ``chunks`` reader.
+    sample_chunks: int = DEFAULT_SAMPLE_CHUNKS
+
+    #: Number of records to read per chunk with the ``chunks`` reader.
+    chunk_records: int = DEFAULT_CHUNK_RECORDS
+
+    #: Interval in seconds between two logs of the metrics of each input file.
+    metrics_seconds: float = DEFAULT_METRICS_SECONDS
+
+    #: Also write the statistics of each partition of the reads by this key, ``None`` to only
+    #: write those of the whole sample.
+    partition_by: typing.Optional[str] = None
+
+    #: Minimal depth for a site to count as covered for ``saturation_fraction``.
+    min_cov: int = DEFAULT_MIN_COV
+
+    #: Stop reading input once this fraction of sites is covered, ``None`` to disable.
+    saturation_fraction: typing.Optional[float] = None
+
+    #: Stop reading input once the genotype calls did not change over this many consecutive
+    #: checkpoints, ``None`` to disable.
+    stable_checkpoints: typing.Optional[int] = None
+
+    #: Number of reads between two checks of the early stop conditions.
+    checkpoint_reads: int = DEFAULT_CHECKPOINT_READS
+
+    #: Write a checkpoint for resuming every this many seconds, ``None`` to disable.
+    checkpoint_seconds: typing.Optional[float] = None
+
+    #: Whether to resume from the checkpoints of a previous run.
+    resume: bool = False
+
     @classmethod
     def from_namespace(
         cls, ns: typing.Union[argparse.Namespace, types.SimpleNamespace]
     ) -> _TBaseConfig:
         ns.input_files = flatten_list(ns.input_files)
         return cattr.structure({"common": vars(ns), **vars(ns)}, cls)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class FastqVerifyConfig(FastqExtractConfig):
+    """Configuration for the ``fastq-verify`` command.
+
+    ``sample_id`` is the sample that the input files are expected to belong to.
+    """
+
+    #: Confidence at which to decide on match or mismatch.
+    confidence: float = DEFAULT_VERIFY_CONFIDENCE
+
+    #: Fraction of discordant genotype calls expected when the input belongs to the sample.
+    error_rate: float = DEFAULT_VERIFY_ERROR_RATE
+
+    #: Fraction of discordant genotype calls expected when the input belongs to another sample.
+    mismatch_rate: float = DEFAULT_VERIFY_MISMATCH_RATE
+
+    #: Number of reads between two checks of the test statistic.
+    checkpoint_reads: int = DEFAULT_VERIFY_CHECKPOINT_READS
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class FastqExtractBatchConfig(FastqExtractConfig):
+    """Configuration for the ``fastq-extract-batch`` command.
+
+    ``sample_id`` and ``input_files`` are set per sample from the sample sheet and ``num_procs``
+    is the number of samples processed concurrently.
+    """
+
+    #: Path to the sample sheet, a TSV file with the sample ID and input files of each sample.
+    sample_sheet: str = attr.ib(kw_only=True)
+
+    #: Unused, set per sample from the sample sheet.
+    sample_id: typing.Optional[str] = None
+
+    #: Unused, set per sample from the sample sheet.
+    input_files: typing.List[str] = attr.Factory(list)
+
+    @classmethod
+    def from_namespace(
+        cls, ns: typing.Union[argparse.Namespace, types.SimpleNamespace]
+    ) -> _TBaseConfig:
+        return cattr.structure({"common": vars(ns), **vars(ns)}, cls)
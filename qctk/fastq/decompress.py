@@ -0,0 +1,271 @@
+"""Threaded decompression of gzip and BGZF compressed input files.
+
+BGZF files are a series of independent gzip members of at most 64 KiB.  The block boundaries
+can be found from the block headers without inflating, so blocks are inflated in parallel by a
+thread pool (``zlib`` releases the GIL while inflating).  Plain gzip files are inflated on the
+calling thread, which is the ``decompress`` stage of the ``fastq-extract`` pipeline.
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import struct
+import time
+import typing
+import zlib
+
+import attr
+from logzero import logger
+
+
+#: Magic bytes and flags of a gzip header with ``FEXTRA`` set.
+_GZIP_FEXTRA_MAGIC = b"\x1f\x8b\x08\x04"
+
+#: Size of the fixed part of the gzip header, up to and including ``XLEN``.
+_GZIP_HEADER_SIZE = 12
+
+#: Size of the gzip member trailer (``CRC32`` and ``ISIZE``).
+_GZIP_TRAILER_SIZE = 8
+
+#: Size of the chunks read from plain gzip files.
+_GZIP_CHUNK_SIZE = 1024 * 1024
+
+#: Number of decompressed chunks that may be queued per decompression thread.
+CHUNKS_PER_THREAD = 4
+
+
+@attr.s(auto_attribs=True)
+class DecompressStats:
+    """Statistics of decompressing one input file."""
+
+    #: Number of compressed bytes read.
+    bytes_in: int = 0
+    #: Number of decompressed bytes produced.
+    bytes_out: int = 0
+    #: Time spent inflating, summed over all threads, in seconds.
+    inflate_seconds: float = 0.0
+    #: Wall-clock time from opening the file to the last chunk, in seconds.
+    wall_seconds: float = 0.0
+
+    def log(self, path: str) -> None:
+        """Log the decompression throughput."""
+        mb_out = self.bytes_out / 1024 / 1024
+        logger.info(
+            "Decompressed %s: %.1f MB -> %.1f MB, %.2f s inflating (%.1f MB/s), "
+            "%.2f s wall-clock (%.1f MB/s)",
+            path,
+            self.bytes_in / 1024 / 1024,
+            mb_out,
+            self.inflate_seconds,
+            mb_out / self.inflate_seconds if self.inflate_seconds else 0.0,
+            self.wall_seconds,
+            mb_out / self.wall_seconds if self.wall_seconds else 0.0,
+        )
+
+
+#: Number of bytes at the start of a file that ``is_bgzf_header()`` needs at most.
+BGZF_PROBE_SIZE = 1024
+
+
+def is_bgzf_header(data: bytes) -> bool:
+    """Return whether ``data`` starts with a BGZF block header."""
+    if len(data) < _GZIP_HEADER_SIZE or not data.startswith(_GZIP_FEXTRA_MAGIC):
+        return False
+    (xlen,) = struct.unpack("<H", data[10:12])
+    return _bgzf_block_size(data[_GZIP_HEADER_SIZE : _GZIP_HEADER_SIZE + xlen]) is not None
+
+
+def is_bgzf(path: str) -> bool:
+    """Return whether the file at ``path`` starts with a BGZF block header."""
+    with open(path, "rb") as inputf:
+        return is_bgzf_header(inputf.read(BGZF_PROBE_SIZE))
+
+
+@contextlib.contextmanager
+def open_source(source: typing.Union[str, typing.BinaryIO]) -> typing.Iterator[typing.BinaryIO]:
+    """Open ``source`` for binary reading if it is a path, file objects are passed through."""
+    if isinstance(source, str):
+        with open(source, "rb") as inputf:
+            yield inputf
+    else:
+        yield source
+
+
+def _bgzf_block_size(extra: bytes) -> typing.Optional[int]:
+    """Return total block size from the ``BC`` subfield in gzip ``extra`` field, if any."""
+    pos = 0
+    while pos + 4 <= len(extra):
+        si1, si2, slen = struct.unpack("<BBH", extra[pos : pos + 4])
+        if si1 == 66 and si2 == 67 and slen == 2:
+            return struct.unpack("<H", extra[pos + 4 : pos + 6])[0] + 1
+        pos += 4 + slen
+    return None
+
+
+def iter_bgzf_blocks(
+    inputf: typing.BinaryIO, offset: typing.Optional[int] = None
+) -> typing.Iterator[typing.Tuple[int, bytes, bytes]]:
+    """Yield ``(offset, deflate_data, trailer)`` for each BGZF block in ``inputf`` without
+    inflating, see ``inflate_block()`` for checking the ``trailer``.
+
+    Offsets are counted from ``offset``, by default the current position of ``inputf``, such
+    that streams that cannot ``tell()`` are supported.  A warning is logged if the input does not
+    end with the empty BGZF end-of-file marker block, which hints at truncated input.
+    """
+    offset = inputf.tell() if offset is None else offset
+    last_size = None
+    while True:
+        header = inputf.read(_GZIP_HEADER_SIZE)
+        if not header:
+            break
+        if len(header) < _GZIP_HEADER_SIZE or not header.startswith(_GZIP_FEXTRA_MAGIC):
+            raise ValueError("Invalid BGZF block header at offset %d" % offset)
+        (xlen,) = struct.unpack("<H", header[10:12])
+        block_size = _bgzf_block_size(inputf.read(xlen))
+        if block_size is None:
+            raise ValueError("Missing BGZF block size at offset %d" % offset)
+        data_size = block_size - _GZIP_HEADER_SIZE - xlen - _GZIP_TRAILER_SIZE
+        data = inputf.read(data_size)
+        trailer = inputf.read(_GZIP_TRAILER_SIZE)
+        if len(data) != data_size or len(trailer) != _GZIP_TRAILER_SIZE:
+            raise ValueError("Truncated BGZF block at offset %d" % offset)
+        yield offset, data, trailer
+        (last_size,) = struct.unpack("<I", trailer[4:])
+        offset += block_size
+    if last_size != 0:
+        logger.warning(
+            "BGZF input %s has no end-of-file marker block, it may be truncated",
+            getattr(inputf, "name", "<stream>"),
+        )
+
+
+#: Size of the window searched for a BGZF block header, larger than the maximal block size.
+_BGZF_SCAN_SIZE = 2 * 65536
+
+
+def _is_bgzf_block_at(inputf: typing.BinaryIO, offset: int) -> bool:
+    """Return whether a BGZF block starts at ``offset`` and is followed by another one or EOF."""
+    inputf.seek(offset)
+    header = inputf.read(_GZIP_HEADER_SIZE)
+    if len(header) < _GZIP_HEADER_SIZE or not header.startswith(_GZIP_FEXTRA_MAGIC):
+        return False
+    (xlen,) = struct.unpack("<H", header[10:12])
+    block_size = _bgzf_block_size(inputf.read(xlen))
+    if block_size is None:
+        return False
+    inputf.seek(offset + block_size)
+    following = inputf.read(len(_GZIP_FEXTRA_MAGIC))
+    return not following or following == _GZIP_FEXTRA_MAGIC
+
+
+def find_bgzf_block(inputf: typing.BinaryIO, offset: int) -> typing.Optional[int]:
+    """Return the offset of the first BGZF block starting at or after ``offset``, if any."""
+    inputf.seek(offset)
+    window = inputf.read(_BGZF_SCAN_SIZE)
+    pos = window.find(_GZIP_FEXTRA_MAGIC)
+    while pos != -1:
+        if _is_bgzf_block_at(inputf, offset + pos):
+            return offset + pos
+        pos = window.find(_GZIP_FEXTRA_MAGIC, pos + 1)
+    return None
+
+
+def inflate_block(data: bytes, trailer: bytes, offset: int = 0) -> typing.Tuple[bytes, float]:
+    """Inflate the deflate ``data`` of the BGZF block at ``offset``, return the block and the
+    time taken.
+
+    Raises ``ValueError`` if the block does not match the CRC32 and size in its ``trailer``.
+    """
+    start = time.perf_counter()
+    result = zlib.decompress(data, -15)
+    crc, size = struct.unpack("<II", trailer)
+    if zlib.crc32(result) != crc or len(result) & 0xFFFFFFFF != size:
+        raise ValueError("Corrupt BGZF block at offset %d (CRC32 or size mismatch)" % offset)
+    return result, time.perf_counter() - start
+
+
+def iter_bgzf_offset_chunks(
+    source: typing.Union[str, typing.BinaryIO],
+    num_threads: int,
+    stats: typing.Optional[DecompressStats] = None,
+    begin: int = 0,
+) -> typing.Iterator[typing.Tuple[int, bytes]]:
+    """Yield the offsets and decompressed BGZF blocks of the file at path or file object
+    ``source`` in order, starting with the block at offset ``begin`` of a path.
+
+    Up to ``num_threads`` blocks are inflated concurrently, the number of blocks in flight is
+    bounded to keep memory use flat.
+    """
+    stats = stats or DecompressStats()
+    start = time.perf_counter()
+    max_pending = num_threads * CHUNKS_PER_THREAD
+    with open_source(source) as inputf, concurrent.futures.ThreadPoolExecutor(
+        max_workers=num_threads
+    ) as executor:
+        if begin:
+            inputf.seek(begin)
+        pending = collections.deque()
+        for offset, data, trailer in iter_bgzf_blocks(inputf, begin):
+            stats.bytes_in += len(data)
+            pending.append((offset, executor.submit(inflate_block, data, trailer, offset)))
+            if len(pending) >= max_pending:
+                offset, future = pending.popleft()
+                yield offset, _finish_block(future, stats)
+        while pending:
+            offset, future = pending.popleft()
+            yield offset, _finish_block(future, stats)
+    stats.wall_seconds = time.perf_counter() - start
+
+
+def iter_bgzf_chunks(
+    source: typing.Union[str, typing.BinaryIO],
+    num_threads: int,
+    stats: typing.Optional[DecompressStats] = None,
+) -> typing.Iterator[bytes]:
+    """Yield the decompressed BGZF blocks of the file at path or file object ``source`` in order,
+    see ``iter_bgzf_offset_chunks()``.
+    """
+    for _, block in iter_bgzf_offset_chunks(source, num_threads, stats):
+        yield block
+
+
+def _finish_block(future: concurrent.futures.Future, stats: DecompressStats) -> bytes:
+    block, seconds = future.result()
+    stats.bytes_out += len(block)
+    stats.inflate_seconds += seconds
+    return block
+
+
+def inflate_gzip_chunks(
+    source: typing.Union[str, typing.BinaryIO], stats: typing.Optional[DecompressStats] = None
+) -> typing.Iterator[bytes]:
+    """Yield decompressed chunks of the (multi-member) gzip file at path or file object
+    ``source`` on this thread.
+
+    Raises ``EOFError`` if the input ends within a gzip member, e.g., for truncated downloads.
+    """
+    stats = stats or DecompressStats()
+    start = time.perf_counter()
+    decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    in_member = False  # whether the current member consumed input without reaching its end
+    with open_source(source) as inputf:
+        while True:
+            data = inputf.read(_GZIP_CHUNK_SIZE)
+            if not data:
+                break
+            stats.bytes_in += len(data)
+            while data:
+                begin = time.perf_counter()
+                chunk = decomp.decompress(data)
+                in_member = not decomp.eof
+                if decomp.eof:  # start next gzip member
+                    data = decomp.unused_data
+                    decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                else:
+                    data = b""
+                stats.inflate_seconds += time.perf_counter() - begin
+                stats.bytes_out += len(chunk)
+                yield chunk
+    if in_member:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+    stats.wall_seconds = time.perf_counter() - start
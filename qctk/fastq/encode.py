@@ -0,0 +1,157 @@
+"""Packed 2-bit encoding of nucleotide k-mers into integers.
+
+The bases ``A``, ``C``, ``G``, ``T`` are encoded as ``0``, ``1``, ``2``, ``3`` such that the
+complement of a base code ``x`` is ``3 - x``.  A k-mer of length ``k <= 32`` thus fits into an
+unsigned 64 bit integer with the first base in the most significant bits.  The *canonical* code of
+a k-mer is the minimum of its forward and its reverse complement code.
+"""
+
+import typing
+
+import numpy as np
+
+#: Largest k-mer length that fits into an unsigned 64 bit integer.
+MAX_KMER_LENGTH = 32
+
+#: Constants of the ``splitmix64`` finalizer.
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+#: Code used in ``ENCODE_TABLE`` for characters that are not in ``"ACGTacgt"``.
+INVALID = 4
+
+
+def _build_encode_table() -> bytes:
+    table = bytearray([INVALID] * 256)
+    for code, base in enumerate("ACGT"):
+        table[ord(base)] = code
+        table[ord(base.lower())] = code
+    return bytes(table)
+
+
+#: Lookup table from byte value to 2-bit base code, ``INVALID`` for non-``ACGT`` characters.
+ENCODE_TABLE = _build_encode_table()
+
+#: ``ENCODE_TABLE`` as a NumPy array for vectorized lookup.
+ENCODE_ARRAY = np.frombuffer(ENCODE_TABLE, dtype=np.uint8)
+
+
+def splitmix64(values: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Hash the ``np.uint64`` ``values`` with the ``splitmix64`` finalizer seeded by ``seed``."""
+    z = values + np.uint64((_GOLDEN * (seed + 1)) % 2 ** 64)
+    z = (z ^ (z >> np.uint64(30))) * _MIX1
+    z = (z ^ (z >> np.uint64(27))) * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+def to_bytes(seq: typing.Union[str, bytes, bytearray, memoryview]) -> typing.ByteString:
+    """Return ``seq`` as a bytes-like object, encoding ``str`` as ASCII."""
+    if isinstance(seq, str):
+        return seq.encode("ascii")
+    else:
+        return seq
+
+
+def flatten_fragments(
+    fragments: typing.List[typing.Tuple[typing.Any, ...]]
+) -> typing.Tuple[typing.List[typing.Any], np.ndarray]:
+    """Return the reads of the paired-end ``fragments`` and the fragment number of each read."""
+    reads = [seq for fragment in fragments for seq in fragment]
+    lengths = np.fromiter(map(len, fragments), dtype=np.int64, count=len(fragments))
+    return reads, np.repeat(np.arange(len(fragments)), lengths)
+
+
+def encode_kmer(kmer: str) -> typing.Optional[int]:
+    """Return the forward 2-bit code of ``kmer`` or ``None`` if it contains non-``ACGT``."""
+    if len(kmer) > MAX_KMER_LENGTH:
+        raise ValueError("k-mer length %d exceeds maximum of %d" % (len(kmer), MAX_KMER_LENGTH))
+    code = 0
+    for c in to_bytes(kmer):
+        x = ENCODE_TABLE[c]
+        if x == INVALID:
+            return None
+        code = (code << 2) | x
+    return code
+
+
+def decode_kmer(code: int, kmer_length: int) -> str:
+    """Return the upper case string for the 2-bit ``code`` of a k-mer of length ``kmer_length``."""
+    return "".join("ACGT"[(code >> (2 * (kmer_length - i - 1))) & 3] for i in range(kmer_length))
+
+
+def revcomp_code(code: int, kmer_length: int) -> int:
+    """Return the 2-bit code of the reverse complement of the k-mer with the given ``code``."""
+    result = 0
+    for _ in range(kmer_length):
+        result = (result << 2) | (3 - (code & 3))
+        code >>= 2
+    return result
+
+
+def revcomp_codes(codes: np.ndarray, kmer_length: int) -> np.ndarray:
+    """Return the 2-bit codes of the reverse complements of the ``np.uint64`` ``codes``."""
+    result = np.zeros_like(codes)
+    codes = codes.copy()
+    for _ in range(kmer_length):
+        result = (result << np.uint64(2)) | (np.uint64(3) - (codes & np.uint64(3)))
+        codes >>= np.uint64(2)
+    return result
+
+
+def canonical_code(code: int, kmer_length: int) -> int:
+    """Return the canonical code, the minimum of forward and reverse complement code."""
+    return min(code, revcomp_code(code, kmer_length))
+
+
+def _join_windows(
+    left: np.ndarray, right: np.ndarray, left_length: int, right_length: int
+) -> np.ndarray:
+    """Return the codes of the windows of length ``left_length + right_length`` from the codes of
+    the ``left`` windows and the ``right`` windows starting ``left_length`` positions later.
+    """
+    num_windows = len(right) - left_length
+    right = right[left_length : left_length + num_windows]
+    return (left[:num_windows] << np.uint64(2 * right_length)) | right
+
+
+def _fold_windows(bases: np.ndarray, kmer_length: int) -> np.ndarray:
+    """Return the forward codes of all k-mer windows of the ``np.uint64`` base codes ``bases``.
+
+    The windows of each power of two length are built from two windows of half the length and
+    those of the lengths in the binary representation of ``kmer_length`` are joined, so only
+    ``O(log k)`` passes over ``bases`` are needed.
+    """
+    result, result_length = None, 0
+    part, part_length = bases, 1
+    while True:
+        if kmer_length & part_length:
+            if result is None:
+                result, result_length = part, part_length
+            else:
+                result = _join_windows(result, part, result_length, part_length)
+                result_length += part_length
+        if 2 * part_length > kmer_length:
+            return result
+        part = _join_windows(part, part, part_length, part_length)
+        part_length *= 2
+
+
+def forward_codes(buf: np.ndarray, kmer_length: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Return forward codes of all k-mer windows of the ``uint8`` buffer ``buf``.
+
+    The second array holds the sorted positions of the non-``ACGT`` characters in ``buf``, the
+    codes of windows that overlap them are meaningless, see ``valid_windows()``.
+    """
+    bases = np.take(ENCODE_ARRAY, buf)
+    invalid = np.flatnonzero(bases == INVALID)
+    if len(buf) < kmer_length:
+        return np.zeros(0, dtype=np.uint64), invalid
+    return _fold_windows((bases & 3).astype(np.uint64), kmer_length), invalid
+
+
+def valid_windows(windows: np.ndarray, invalid: np.ndarray, kmer_length: int) -> np.ndarray:
+    """Return the sorted ``windows`` that do not overlap any of the sorted ``invalid`` positions."""
+    next_invalid = np.searchsorted(invalid, windows)
+    overlap = np.append(invalid, np.iinfo(np.int64).max)[next_invalid] < windows + kmer_length
+    return windows[~overlap]
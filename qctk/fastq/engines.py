@@ -0,0 +1,249 @@
+"""Counting engines for marker k-mers in read sequences.
+
+An engine is constructed from a ``MarkerIndex`` and adds the number of occurrences of each
+marker k-mer in a batch of read sequences to a counts matrix from ``MarkerIndex.new_counts()``.
+For paired-end input, ``count_fragments()`` takes a batch of fragments, i.e., tuples of the mate
+sequences, and counts each marker allele at most once per fragment so that overlapping mates do
+not count the same molecule twice.
+"""
+
+import typing
+
+import numpy as np
+
+from .aho import AhoCorasickAutomaton, load_or_build_automaton
+from .config import FastqExtractConfig, KmerEngine
+from .encode import (
+    ENCODE_ARRAY,
+    INVALID,
+    flatten_fragments,
+    forward_codes,
+    revcomp_codes,
+    to_bytes,
+    valid_windows,
+)
+from .index import MarkerIndex
+from .minimizer import MinimizerPrefilter
+from ..common import batched
+from ..config import DEFAULT_BATCH_SIZE
+
+
+#: Type of sequences accepted by the engines.
+Sequence = typing.Union[str, bytes, bytearray, memoryview]
+
+
+def _lock_step(
+    seqs: typing.List[typing.ByteString],
+) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray, typing.List[int]]:
+    """Prepare advancing all ``seqs`` in lock-step, one base position at a time.
+
+    Returns the read numbers sorted by decreasing length, the base codes of all reads
+    concatenated, the start of each read in this order, and the number of reads that are still
+    running at each position.  The running reads are always a prefix of the order, so short reads
+    are not padded to the longest one.
+    """
+    lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+    order = np.argsort(-lengths, kind="stable")
+    bases = np.take(ENCODE_ARRAY, np.frombuffer(b"".join(seqs), dtype=np.uint8))
+    starts = (np.cumsum(lengths) - lengths)[order]
+    max_length = int(lengths.max()) if len(seqs) else 0
+    num_active = len(seqs) - np.searchsorted(np.sort(lengths), np.arange(max_length), side="right")
+    return order, bases, starts, num_active.tolist()
+
+
+class RollingEngine:
+    """Count marker k-mers by rolling 2-bit codes over the reads.
+
+    The forward and reverse complement codes of all reads of a block are rolled in lock-step,
+    one base position at a time, so each base costs constant time and the per-base work runs in
+    NumPy instead of the interpreter.  A non-``ACGT`` character resets the length of the valid
+    run of a read, such that no window overlapping it is looked up.  The canonical codes are
+    checked against the code filter of the ``MarkerIndex`` and the remaining ones are looked up
+    with its minimal perfect hash function.
+    """
+
+    #: Name of the engine for selection on the command line.
+    name = KmerEngine.ROLLING.value
+
+    def __init__(self, index: MarkerIndex, batch_size: int = DEFAULT_BATCH_SIZE):
+        #: The marker index.
+        self.index = index
+        #: Number of reads to roll over at once.
+        self.batch_size = batch_size
+
+    def count(self, sequences: typing.Iterable[Sequence], counts: np.ndarray) -> None:
+        """Add marker k-mer occurrences in ``sequences`` to ``counts``."""
+        for batch in batched(sequences, self.batch_size):
+            self.index.add_hits(counts, self.block_hits(batch)[1])
+
+    def count_fragments(
+        self, fragments: typing.Iterable[typing.Tuple[Sequence, ...]], counts: np.ndarray
+    ) -> None:
+        """Add marker k-mer occurrences in ``fragments`` to ``counts``, once per fragment."""
+        for batch in batched(fragments, self.batch_size):
+            reads, fragment_nos = flatten_fragments(batch)
+            read_nos, slots = self.block_hits(reads)
+            self.index.add_fragment_hits(counts, fragment_nos[read_nos], slots)
+
+    def block_hits(self, sequences: typing.List[Sequence]) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Return the read number and slot of each marker k-mer occurrence in ``sequences``."""
+        seqs = list(map(to_bytes, sequences))
+        order, bases, starts, num_active = _lock_step(seqs)
+        kmer_length = self.index.kmer_length
+        mask = np.uint64((1 << (2 * kmer_length)) - 1)
+        shift = np.uint64(2 * (kmer_length - 1))
+        fwd = np.zeros(len(seqs), dtype=np.uint64)
+        rev = np.zeros(len(seqs), dtype=np.uint64)
+        run = np.zeros(len(seqs), dtype=np.int64)
+        read_nos = [np.zeros(0, dtype=np.int64)]
+        codes = [np.zeros(0, dtype=np.uint64)]
+        for j, active in enumerate(num_active):
+            x = bases[starts[:active] + j]
+            run = np.where(x == INVALID, 0, run[:active] + 1)
+            x = (x & 3).astype(np.uint64)
+            fwd = ((fwd[:active] << np.uint64(2)) | x) & mask
+            rev = (rev[:active] >> np.uint64(2)) | ((np.uint64(3) - x) << shift)
+            if j + 1 >= kmer_length:
+                canonical = np.minimum(fwd, rev)
+                found = np.flatnonzero((run >= kmer_length) & self.index.may_contain(canonical))
+                read_nos.append(order[found])
+                codes.append(canonical[found])
+        positions, slots = self.index.locate(np.concatenate(codes))
+        return np.concatenate(read_nos)[positions], slots
+
+
+class BatchEngine:
+    """Count marker k-mers by scanning blocks of reads with vectorized NumPy operations.
+
+    The reads of a block are concatenated into one ``uint8`` buffer, separated by ``N``
+    characters so no window spans two reads.  The forward codes of all windows are computed at
+    once by joining the strided views of the buffer, see ``forward_codes()``.  The code filter of
+    the ``MarkerIndex`` drops most of them, only the remaining ones are canonicalized, looked up
+    with the minimal perfect hash function and tallied with ``np.bincount``.
+    """
+
+    #: Name of the engine for selection on the command line.
+    name = KmerEngine.BATCH.value
+
+    def __init__(self, index: MarkerIndex, batch_size: int = DEFAULT_BATCH_SIZE):
+        #: The marker index.
+        self.index = index
+        #: Number of reads to scan at once.
+        self.batch_size = batch_size
+
+    def count(self, sequences: typing.Iterable[Sequence], counts: np.ndarray) -> None:
+        """Add marker k-mer occurrences in ``sequences`` to ``counts``."""
+        for batch in batched(sequences, self.batch_size):
+            self.count_block(batch, counts)
+
+    def window_hits(self, buf: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Return the start and slot of each marker k-mer occurrence in ``buf``."""
+        kmer_length = self.index.kmer_length
+        codes, invalid = forward_codes(buf, kmer_length)
+        windows = np.flatnonzero(self.index.may_contain(codes))
+        windows = valid_windows(windows, invalid, kmer_length)
+        codes = codes[windows]
+        positions, slots = self.index.locate(
+            np.minimum(codes, revcomp_codes(codes, kmer_length))
+        )
+        return windows[positions], slots
+
+    def count_block(self, sequences: typing.List[Sequence], counts: np.ndarray) -> None:
+        """Add marker k-mer occurrences in the block of ``sequences`` to ``counts``."""
+        buf = np.frombuffer(b"N".join(map(to_bytes, sequences)), dtype=np.uint8)
+        self.index.add_hits(counts, self.window_hits(buf)[1])
+
+    def count_fragments(
+        self, fragments: typing.Iterable[typing.Tuple[Sequence, ...]], counts: np.ndarray
+    ) -> None:
+        """Add marker k-mer occurrences in ``fragments`` to ``counts``, once per fragment."""
+        for batch in batched(fragments, self.batch_size):
+            reads, fragment_nos = flatten_fragments(batch)
+            read_nos, slots = self.block_hits(reads)
+            self.index.add_fragment_hits(counts, fragment_nos[read_nos], slots)
+
+    def block_hits(self, sequences: typing.List[Sequence]) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Return the read number and slot of each marker k-mer occurrence in ``sequences``."""
+        seqs = list(map(to_bytes, sequences))
+        windows, slots = self.window_hits(np.frombuffer(b"N".join(seqs), dtype=np.uint8))
+        read_starts = np.cumsum([0] + [len(seq) + 1 for seq in seqs[:-1]])
+        return np.searchsorted(read_starts, windows, side="right") - 1, slots
+
+
+class AhoCorasickEngine:
+    """Count marker k-mers with an Aho-Corasick automaton.
+
+    All reads of a block are advanced through the automaton in lock-step, one base position at
+    a time (see ``_lock_step()``).  Only states that complete a marker k-mer produce a hit.
+    """
+
+    #: Name of the engine for selection on the command line.
+    name = KmerEngine.AHO_CORASICK.value
+
+    def __init__(
+        self,
+        index: MarkerIndex,
+        automaton: AhoCorasickAutomaton,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        #: The marker index.
+        self.index = index
+        #: The automaton built from ``index``.
+        self.automaton = automaton
+        #: Number of reads to scan at once.
+        self.batch_size = batch_size
+
+    def count(self, sequences: typing.Iterable[Sequence], counts: np.ndarray) -> None:
+        """Add marker k-mer occurrences in ``sequences`` to ``counts``."""
+        for batch in batched(sequences, self.batch_size):
+            self.count_block(batch, counts)
+
+    def count_block(self, sequences: typing.List[Sequence], counts: np.ndarray) -> None:
+        """Add marker k-mer occurrences in the block of ``sequences`` to ``counts``."""
+        self.index.add_hits(counts, self.block_hits(sequences)[1])
+
+    def count_fragments(
+        self, fragments: typing.Iterable[typing.Tuple[Sequence, ...]], counts: np.ndarray
+    ) -> None:
+        """Add marker k-mer occurrences in ``fragments`` to ``counts``, once per fragment."""
+        for batch in batched(fragments, self.batch_size):
+            reads, fragment_nos = flatten_fragments(batch)
+            read_nos, slots = self.block_hits(reads)
+            self.index.add_fragment_hits(counts, fragment_nos[read_nos], slots)
+
+    def block_hits(self, sequences: typing.List[Sequence]) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Return the read number and slot of each marker k-mer occurrence in ``sequences``."""
+        seqs = list(map(to_bytes, sequences))
+        order, codes, starts, num_active = _lock_step(seqs)
+        transitions = self.automaton.transitions
+        outputs = self.automaton.outputs
+        states = np.zeros(len(seqs), dtype=np.int32)
+        read_nos = [np.zeros(0, dtype=np.int64)]
+        hits = [np.zeros(0, dtype=outputs.dtype)]
+        for j, active in enumerate(num_active):
+            states = transitions[states[:active], codes[starts[:active] + j]]
+            matched = outputs[states]
+            found = np.flatnonzero(matched >= 0)
+            read_nos.append(order[found])
+            hits.append(matched[found])
+        return np.concatenate(read_nos), np.concatenate(hits)
+
+
+def build_engine(config: FastqExtractConfig, index: MarkerIndex):
+    """Construct the engine selected in ``config`` for ``index``.
+
+    The engine is wrapped in a ``MinimizerPrefilter`` if enabled in ``config``.
+    """
+    engine = KmerEngine(config.engine)
+    if engine == KmerEngine.BATCH:
+        result = BatchEngine(index, config.batch_size)
+    elif engine == KmerEngine.AHO_CORASICK:
+        automaton = load_or_build_automaton(index)
+        result = AhoCorasickEngine(index, automaton, config.batch_size)
+    else:
+        result = RollingEngine(index, config.batch_size)
+    if config.minimizer_prefilter:
+        result = MinimizerPrefilter(
+            result, config.minimizer_length, config.minimizer_window, config.batch_size
+        )
+    return result
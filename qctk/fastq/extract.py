@@ -4,98 +4,153 @@ sites.
 
 import argparse
 import hashlib
-import itertools
 import json
 import pathlib
 import typing
 
 import cattr
 from logzero import logger
-import pysam
+import numpy as np
 
-from .config import GenomeRelease, FastqExtractConfig, DEFAULT_GENOME_RELEASE, DEFAULT_THRESHOLD
-from ..common import revcomp
-from ..models.fastq import read_kmer_infos, KmerInfo
-from ..models.vcf import SiteStats, VariantStats, Genotype, SampleStats, Sample, write_site_stats
+from .config import (
+    GenomeRelease,
+    FastqExtractConfig,
+    KmerEngine,
+    PartitionKey,
+    ReaderStrategy,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHECKPOINT_READS,
+    DEFAULT_CHUNK_RECORDS,
+    DEFAULT_DECOMPRESS_THREADS,
+    DEFAULT_KMER_ENGINE,
+    DEFAULT_METRICS_SECONDS,
+    DEFAULT_MIN_COV,
+    DEFAULT_MINIMIZER_LENGTH,
+    DEFAULT_MINIMIZER_WINDOW,
+    DEFAULT_QUEUE_DEPTH,
+    DEFAULT_READER_STRATEGY,
+    DEFAULT_SAMPLE_CHUNKS,
+    DEFAULT_THRESHOLD,
+)
+from .calling import call_genotypes
+from .checkpoint import remove_checkpoints
+from .index import MarkerIndex
+from .metrics import write_metrics
+from .panels import MarkerPanel, load_panels, merge_panels, panel_paths, panel_sample_ids
+from .parallel import CountResult, count_inputs
+from .readers import STDIN_PATH, is_alignment_file
+from ..models.vcf import SiteStats, VariantStats, SampleStats, Sample, write_site_stats
 
-#: Genome release to file name.
-_KMER_FILES = {
-    GenomeRelease.GRCH37: "kmers.GRCh37.tsv.gz",
-    GenomeRelease.GRCH38: "kmers.hg38.tsv.gz",
-}
 
+def _call_sample_stats(
+    config: FastqExtractConfig,
+    panels: typing.List[MarkerPanel],
+    index: MarkerIndex,
+    sample_id: str,
+    counts: np.ndarray,
+    num_reads: int,
+    stop_condition: str,
+) -> typing.List[SampleStats]:
+    """Call the genotypes from ``counts`` and return the statistics of each panel."""
+    ref_depths, alt_depths = index.site_depths(counts)
+    genotypes = call_genotypes(config.threshold, ref_depths, alt_depths)
+    # Scale the depths of subsampled input to the full input.
+    scale = 1.0 / (config.sample_fraction or 1.0)
+    total_covs = np.rint((ref_depths + alt_depths) * scale).astype(int)
+    alt_covs = np.rint(alt_depths * scale).astype(int)
+    site_stats = [
+        SiteStats(
+            site=kmer_info.site,
+            stats=VariantStats(
+                genotype=genotype,
+                total_cov=total_cov,
+                alt_cov=alt_cov,
+                ref_count=ref_count,
+                alt_count=alt_count,
+            ),
+        )
+        for kmer_info, genotype, total_cov, alt_cov, ref_count, alt_count in zip(
+            merge_panels(panels),
+            genotypes,
+            total_covs.tolist(),
+            alt_covs.tolist(),
+            ref_depths.tolist(),
+            alt_depths.tolist(),
+        )
+    ]
+    return [
+        SampleStats(
+            sample=Sample(name=panel_sample_id),
+            site_stats=site_stats[panel.sites],
+            num_reads=num_reads,
+            stop_condition=stop_condition,
+        )
+        for panel_sample_id, panel in zip(panel_sample_ids(sample_id, panels), panels)
+    ]
 
-class KmerCounter:
-    """Helper class for iplementing k-mer counting."""
 
-    def __init__(self, kmers):
-        self.fwd = tuple(kmers)
-        self.rev = tuple(map(revcomp, kmers))
-        self.counts = {k: 0 for k in itertools.chain(self.fwd, self.rev)}
+def extract_sample_stats(
+    config: FastqExtractConfig, panels: typing.List[MarkerPanel], index: MarkerIndex, engine=None,
+) -> typing.Tuple[typing.List[SampleStats], CountResult]:
+    """Count the marker k-mers in the input files of ``config`` and call the genotypes.
 
-    def tally(self, kmer: str) -> None:
-        if kmer in self.counts:
-            self.counts[kmer] += 1
+    ``index`` must have been built from the merged k-mer infos of ``panels``; a prebuilt
+    ``engine`` over ``index`` can be passed in to share it between samples.  Returns the sample
+    statistics of each panel, followed by those of each partition stored as
+    ``<sample_id>.<partition>``, and the counting result.
+    """
+    result = count_inputs(config, index, engine=engine)
+    logger.info(
+        "Counted %s reads for sample %s (%s)",
+        "{:,}".format(result.num_reads),
+        config.sample_id,
+        result.stop_condition.value,
+    )
+    stop_condition = result.stop_condition.value
+    sample_stats = _call_sample_stats(
+        config, panels, index, config.sample_id, result.counts, result.num_reads, stop_condition
+    )
+    for name, partition in sorted(result.partitions.items()):
+        logger.info("Counted %s reads in partition %s", "{:,}".format(partition.num_reads), name)
+        sample_stats += _call_sample_stats(
+            config,
+            panels,
+            index,
+            "%s.%s" % (config.sample_id, name),
+            partition.counts,
+            partition.num_reads,
+            stop_condition,
+        )
+    return sample_stats, result
 
 
-def _call_genotype(threshold: float, ref_depth: int, alt_depth: int) -> Genotype:
-    total_depth = ref_depth + alt_depth
-    if total_depth == 0:
-        return None
-    frac = alt_depth / total_depth
-    if frac < threshold:
-        return Genotype.REF
-    elif frac > 1.0 - threshold:
-        return Genotype.HOM
-    else:
-        return Genotype.HET
+def write_sample_results(
+    config: FastqExtractConfig, sample_stats: typing.List[SampleStats], result: CountResult
+) -> typing.List[pathlib.Path]:
+    """Write the statistics of each panel and partition and the metrics of the sample of
+    ``config``, remove its checkpoints, and return the paths to the statistics.
+    """
+    paths_json = [
+        write_site_stats(stats, config.common.storage_path, stats.sample.name)
+        for stats in sample_stats
+    ]
+    result.metrics.log("sample %s" % config.sample_id)
+    path_metrics = write_metrics(
+        config.common.storage_path, config.sample_id, result.metrics, result.chunk_metrics
+    )
+    logger.info("Wrote metrics to %s", path_metrics)
+    remove_checkpoints(config)
+    return paths_json
 
 
 def _fastq_extract_impl(
-    config: FastqExtractConfig, kmer_infos: typing.List[KmerInfo]
-) -> pathlib.Path:
-    kmers = []
-    for kmer_info in kmer_infos:
-        kmers.append(kmer_info.ref_kmer)
-        kmers.append(kmer_info.alt_kmer)
-    kmer_length = len(kmers[-1])
-
-    counter = KmerCounter(kmers)
-    for fastq_path in config.input_files:
-        logger.debug("Processing FASTQ file: %s", fastq_path)
-        with pysam.FastxFile(fastq_path) as inputf:
-            for record in inputf:
-                seq_length = len(record.sequence)
-                for i in range(seq_length - kmer_length + 1):
-                    kmer = record.sequence[i : i + kmer_length]
-                    if len(kmer) != kmer_length:
-                        raise ValueError(
-                            "Kmer of invalid length (%d): %s, should be %d"
-                            % (len(kmer), kmer, kmer_length)
-                        )
-                    else:
-                        counter.tally(kmer)
-
-    site_stats = []
-    for kmer_info in kmer_infos:
-        ref_kmer = kmer_info.ref_kmer
-        ref_depth = counter.counts[ref_kmer] + counter.counts[revcomp(ref_kmer)]
-        alt_kmer = kmer_info.alt_kmer
-        alt_depth = counter.counts[alt_kmer] + counter.counts[revcomp(alt_kmer)]
-        site_stats.append(
-            SiteStats(
-                site=kmer_info.site,
-                stats=VariantStats(
-                    genotype=_call_genotype(config.threshold, ref_depth, alt_depth),
-                    total_cov=ref_depth + alt_depth,
-                    alt_cov=alt_depth,
-                ),
-            )
-        )
-
-    sample_stats = SampleStats(sample=Sample(name=config.sample_id), site_stats=site_stats,)
-
-    return write_site_stats(sample_stats, config.common.storage_path, config.sample_id)
+    config: FastqExtractConfig, panels: typing.List[MarkerPanel]
+) -> typing.List[pathlib.Path]:
+    index = MarkerIndex.from_kmer_infos(
+        merge_panels(panels), config.mismatches, panel_paths(panels)
+    )
+    sample_stats, result = extract_sample_stats(config, panels, index)
+    return write_sample_results(config, sample_stats, result)
 
 
 def fastq_extract_run(config: FastqExtractConfig) -> int:
@@ -114,17 +169,18 @@ def fastq_extract_run(config: FastqExtractConfig) -> int:
     pathlib.Path(config.common.storage_path).mkdir(parents=True, exist_ok=True)
 
     logger.info("Loading kmers...")
-    genome_release = (
-        config.genome_release if config.genome_release else DEFAULT_GENOME_RELEASE.value
-    )
-    if config.kmer_infos:
-        path_kmer_infos = config.kmer_infos
-    else:
-        path_kmer_infos = _KMER_FILES[GenomeRelease.from_value(genome_release)]
-    kmer_infos = read_kmer_infos(path=path_kmer_infos)
+    try:
+        panels = load_panels(config)
+    except ValueError as e:
+        logger.error("Could not load k-mer panels: %s", e)
+        return 1
+    if not check_counting_arguments(config, panels):
+        return 1
+    if len(panels) > 1:
+        logger.info("Counting %d panels: %s", len(panels), ", ".join(p.name for p in panels))
 
     logger.info("Analyzing FASTQ data...")
-    _fastq_extract_impl(config, kmer_infos)
+    _fastq_extract_impl(config, panels)
 
     logger.info("All done. Have a nice day!")
     return 0
@@ -138,6 +194,247 @@ def fastq_extract_main(args: argparse.Namespace) -> int:
     return fastq_extract_run(FastqExtractConfig.from_namespace(args))
 
 
+def check_counting_arguments(config: FastqExtractConfig, panels: typing.List[MarkerPanel]) -> bool:
+    """Check the input, counting, and sampling arguments shared by the commands counting the
+    marker k-mers of ``panels``, log an error and return ``False`` if they are invalid.
+    """
+    if config.batch_size < 1:
+        logger.error("--batch-size must be at least 1, got %d!", config.batch_size)
+        return False
+    if config.decompress_threads < 1:
+        logger.error("--decompress-threads must be at least 1, got %d!", config.decompress_threads)
+        return False
+    if config.queue_depth < 1:
+        logger.error("--queue-depth must be at least 1, got %d!", config.queue_depth)
+        return False
+    if config.count_threads < 1:
+        logger.error("--count-threads must be at least 1, got %d!", config.count_threads)
+        return False
+    if config.minimizer_prefilter:
+        kmer_length = len(panels[0].kmer_infos[0].ref_kmer)
+        if config.minimizer_length < 1 or config.minimizer_window < 1:
+            logger.error("--minimizer-length and --minimizer-window must be at least 1!")
+            return False
+        if config.minimizer_window + config.minimizer_length - 1 > kmer_length:
+            logger.error(
+                "--minimizer-window + --minimizer-length - 1 must not exceed the k-mer length "
+                "%d, got %d + %d - 1!",
+                kmer_length,
+                config.minimizer_window,
+                config.minimizer_length,
+            )
+            return False
+    if config.sample_chunks < 1 or config.chunk_records < 1:
+        logger.error("--sample-chunks and --chunk-records must be at least 1!")
+        return False
+    if config.sample_fraction is not None and not 0.0 < config.sample_fraction <= 1.0:
+        logger.error("--sample-fraction must be in (0, 1]!")
+        return False
+    if config.saturation_fraction is not None and not 0.0 < config.saturation_fraction <= 1.0:
+        logger.error("--saturation-fraction must be in (0, 1]!")
+        return False
+    if config.stable_checkpoints is not None and config.stable_checkpoints < 1:
+        logger.error("--stable-checkpoints must be at least 1, got %d!", config.stable_checkpoints)
+        return False
+    if config.input_files.count(STDIN_PATH) > 1:
+        logger.error("stdin can only be given once in --input-files!")
+        return False
+    if config.paired and (len(config.input_files) % 2 or STDIN_PATH in config.input_files):
+        logger.error("--paired needs pairs of R1 and R2 files in --input-files, not stdin!")
+        return False
+    if config.paired and any(map(is_alignment_file, config.input_files)):
+        logger.error("--paired needs FASTQ files in --input-files, not SAM/BAM/CRAM!")
+        return False
+    if config.paired and config.reader == ReaderStrategy.CHUNKS.value:
+        logger.error("--paired cannot be combined with --reader chunks!")
+        return False
+    return True
+
+
+def add_counting_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments for selecting the marker k-mers and counting them to ``parser``."""
+    parser.add_argument(
+        "--kmer-infos",
+        nargs="+",
+        default=[],
+        help="Path(s) to site kmers TSV files to use, one panel per file counted in the same "
+        "pass; if blank pick defaults by --genome-release",
+    )
+    parser.add_argument(
+        "--genome-release",
+        nargs="+",
+        default=[GenomeRelease.GRCH37.value],
+        help="Name(s) of the genome releases to use (e.g., for built-in VCF file), one panel per "
+        "release, default: %s" % GenomeRelease.GRCH37.value,
+    )
+    parser.add_argument(
+        "--threshold",
+        default=DEFAULT_THRESHOLD,
+        type=float,
+        help="Simple threshold to use for het/hom alt calls, default: %s" % DEFAULT_THRESHOLD,
+    )
+    parser.add_argument(
+        "--engine",
+        default=DEFAULT_KMER_ENGINE.value,
+        choices=[e.value for e in KmerEngine],
+        help="The k-mer counting engine to use, default: %s" % DEFAULT_KMER_ENGINE.value,
+    )
+    parser.add_argument(
+        "--mismatches",
+        type=int,
+        default=0,
+        choices=[0, 1],
+        help="Number of mismatches to tolerate in the marker k-mers; with 1, the k-mers at "
+        "Hamming distance 1 of exactly one marker allele are counted for it, default: 0",
+    )
+    parser.add_argument(
+        "--paired",
+        default=False,
+        action="store_true",
+        help="Read consecutive --input-files as the R1 and R2 files of paired-end reads and count "
+        "each marker allele at most once per fragment",
+    )
+    parser.add_argument(
+        "--batch-size",
+        default=DEFAULT_BATCH_SIZE,
+        type=int,
+        help="Number of reads to scan at once with the batch engine, default: %d"
+        % DEFAULT_BATCH_SIZE,
+    )
+    parser.add_argument(
+        "--num-procs", type=int, default=1, help="Number of processors to use",
+    )
+    parser.add_argument(
+        "--decompress-threads",
+        type=int,
+        default=DEFAULT_DECOMPRESS_THREADS,
+        help="Number of threads per process for decompressing BGZF input, default: %d"
+        % DEFAULT_DECOMPRESS_THREADS,
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=DEFAULT_QUEUE_DEPTH,
+        help="Number of chunks/batches that may wait between pipeline stages, default: %d"
+        % DEFAULT_QUEUE_DEPTH,
+    )
+    parser.add_argument(
+        "--count-threads", type=int, default=1, help="Number of counting threads per process",
+    )
+    parser.add_argument(
+        "--minimizer-prefilter",
+        default=False,
+        action="store_true",
+        help="Skip reads that share no sampled m-mer with the marker k-mers, pays off if most "
+        "reads contain no marker k-mer, e.g., whole-genome reads and a panel of some thousand "
+        "sites",
+    )
+    parser.add_argument(
+        "--minimizer-length",
+        type=int,
+        default=DEFAULT_MINIMIZER_LENGTH,
+        help="Length m of the m-mers of the prefilter, default: %d" % DEFAULT_MINIMIZER_LENGTH,
+    )
+    parser.add_argument(
+        "--minimizer-window",
+        type=int,
+        default=DEFAULT_MINIMIZER_WINDOW,
+        help="The prefilter samples one of each w consecutive m-mers, w + m - 1 must not exceed "
+        "the k-mer length, default: %d" % DEFAULT_MINIMIZER_WINDOW,
+    )
+    parser.add_argument(
+        "--sample-fraction",
+        type=float,
+        help="Only count this fraction of the reads, selected by a hash of the read name such "
+        "that mates are kept together, default: count all reads",
+    )
+    parser.add_argument(
+        "--reader",
+        default=DEFAULT_READER_STRATEGY.value,
+        choices=[e.value for e in ReaderStrategy],
+        help="How to read the input files, 'chunks' only reads --chunk-records records from "
+        "each of --sample-chunks evenly spaced chunks of BGZF files, 'mmap' parses uncompressed "
+        "files through a memory map, and 'auto' uses 'mmap' for uncompressed files, default: %s"
+        % DEFAULT_READER_STRATEGY.value,
+    )
+    parser.add_argument(
+        "--sample-chunks",
+        type=int,
+        default=DEFAULT_SAMPLE_CHUNKS,
+        help="Number of chunks to read with --reader chunks, default: %d" % DEFAULT_SAMPLE_CHUNKS,
+    )
+    parser.add_argument(
+        "--chunk-records",
+        type=int,
+        default=DEFAULT_CHUNK_RECORDS,
+        help="Number of records per chunk with --reader chunks, default: %d"
+        % DEFAULT_CHUNK_RECORDS,
+    )
+    parser.add_argument(
+        "--metrics-seconds",
+        type=float,
+        default=DEFAULT_METRICS_SECONDS,
+        help="Interval in seconds between two logs of the throughput metrics of each input file, "
+        "default: %s" % DEFAULT_METRICS_SECONDS,
+    )
+
+
+def add_partition_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments for partitioning the counts to ``parser``."""
+    parser.add_argument(
+        "--partition-by",
+        choices=[e.value for e in PartitionKey],
+        help="Also write the statistics of each input file or read group (flow cell lane from "
+        "Illumina read names) as '<sample-id>.<partition>', default: only the whole sample",
+    )
+
+
+def add_stop_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments for stopping to read input early to ``parser``."""
+    parser.add_argument(
+        "--min-cov",
+        type=int,
+        default=DEFAULT_MIN_COV,
+        help="Minimal depth to call a site covered for --saturation-fraction, default: %d"
+        % DEFAULT_MIN_COV,
+    )
+    parser.add_argument(
+        "--saturation-fraction",
+        type=float,
+        help="Stop reading input once this fraction of sites, in (0, 1], reaches --min-cov, "
+        "default: read all input",
+    )
+    parser.add_argument(
+        "--stable-checkpoints",
+        type=int,
+        help="Stop reading input once the genotype calls did not change over this many "
+        "consecutive checkpoints, default: read all input",
+    )
+    parser.add_argument(
+        "--checkpoint-reads",
+        type=int,
+        default=DEFAULT_CHECKPOINT_READS,
+        help="Number of reads between two checks of the early stop conditions, default: %d"
+        % DEFAULT_CHECKPOINT_READS,
+    )
+
+
+def add_checkpoint_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments for checkpointing and resuming to ``parser``."""
+    parser.add_argument(
+        "--checkpoint-seconds",
+        type=float,
+        help="Write the partial counts for resuming every this many seconds, default: do not "
+        "write checkpoints",
+    )
+    parser.add_argument(
+        "--resume",
+        default=False,
+        action="store_true",
+        help="Continue from the checkpoints of a previous run with the same input and options",
+    )
+
+
 def fastq_extract_config_parser(subparsers: argparse._SubParsersAction) -> None:
     """Add command "fastq-extract" to argument parser."""
     parser = subparsers.add_parser(
@@ -148,28 +445,20 @@ def fastq_extract_config_parser(subparsers: argparse._SubParsersAction) -> None:
     )
 
     parser.add_argument(
-        "--sample-id", required=True, help="ID of the sample under analysis",
+        "--sample-id",
+        required=True,
+        help="ID of the sample under analysis, with several panels the statistics of each are "
+        "stored as '<sample-id>.<genome release>'",
     )
     parser.add_argument(
         "--input-files",
         action="append",
         nargs="+",
         required=True,
-        help="Path(s) to FASTQ files to process",
-    )
-    parser.add_argument(
-        "--kmer-infos",
-        help="Path to site kmers TSV file to use, if blank pick default by --genome-release",
-    )
-    parser.add_argument(
-        "--genome-release",
-        default=GenomeRelease.GRCH37.value,
-        help="Name of the genome release to use (e.g., for built-in VCF file), default: %s"
-        % GenomeRelease.GRCH37.value,
-    )
-    parser.add_argument(
-        "--threshold",
-        default=DEFAULT_THRESHOLD,
-        type=float,
-        help="Simple threshold to use for het/hom alt calls, default: %s" % DEFAULT_THRESHOLD,
+        help="Path(s) to FASTQ or SAM/BAM/CRAM files to process, '-' reads FASTQ from stdin, "
+        "named pipes are supported",
     )
+    add_counting_arguments(parser)
+    add_partition_arguments(parser)
+    add_stop_arguments(parser)
+    add_checkpoint_arguments(parser)
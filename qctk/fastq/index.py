@@ -0,0 +1,220 @@
+"""Marker k-mer index used by the ``fastq-extract`` counting engines."""
+
+import typing
+
+import attr
+import numpy as np
+
+from .encode import canonical_code, encode_kmer, revcomp_codes
+from .mphf import MinimalPerfectHash
+from ..models.fastq import KmerInfo
+
+
+_TMarkerIndex = typing.TypeVar("MarkerIndex")
+
+#: Column of the reference allele in the counts matrix.
+REF = 0
+
+#: Column of the alternative allele in the counts matrix.
+ALT = 1
+
+#: Odd multiplier for hashing codes into the code filter (Fibonacci hashing).
+_FILTER_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+#: Bounds on the number of hash bits of the code filter, about 64 entries per code in between.
+_MIN_FILTER_BITS = 16
+_MAX_FILTER_BITS = 24
+
+
+def _filter_positions(codes: np.ndarray, num_bits: int) -> np.ndarray:
+    """Return the positions of the ``np.uint64`` ``codes`` in a code filter of ``num_bits``."""
+    return (codes * _FILTER_MULTIPLIER) >> np.uint64(64 - num_bits)
+
+
+def build_code_filter(codes: np.ndarray, kmer_length: int) -> np.ndarray:
+    """Return the code filter of the canonical ``codes``.
+
+    The filter is a ``bool`` table over the hashed forward and reverse complement codes, such
+    that forward codes of read windows can be checked without first computing their canonical
+    code.  At about 64 entries per code, it passes some percent of the codes that are not in
+    ``codes``.
+    """
+    codes = np.concatenate((codes, revcomp_codes(codes, kmer_length)))
+    num_bits = min(_MAX_FILTER_BITS, max(_MIN_FILTER_BITS, len(codes).bit_length() + 6))
+    result = np.zeros(1 << num_bits, dtype=bool)
+    result[_filter_positions(codes, num_bits)] = True
+    return result
+
+
+def hamming_neighbours(
+    codes: np.ndarray, cells: np.ndarray, kmer_length: int
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Return the canonical codes at Hamming distance 1 from the canonical ``codes`` and their
+    counts matrix cells.
+
+    Neighbours are dropped if they are in ``codes`` themselves or if they are neighbours of codes
+    counted in different cells, e.g., the third base at the position of a SNV is one mismatch
+    away from both the reference and the alternative k-mer.
+    """
+    shifts = np.arange(kmer_length, dtype=np.uint64) * np.uint64(2)
+    flips = (np.arange(1, 4, dtype=np.uint64)[None, :] << shifts[:, None]).ravel()
+    neighbours = (codes[:, None] ^ flips[None, :]).ravel()
+    neighbours = np.minimum(neighbours, revcomp_codes(neighbours, kmer_length))
+    neighbour_cells = np.repeat(cells, len(flips))
+    order = np.lexsort((neighbour_cells, neighbours))
+    neighbours, neighbour_cells = neighbours[order], neighbour_cells[order]
+    unique, first, num = np.unique(neighbours, return_index=True, return_counts=True)
+    first_cells = neighbour_cells[first]
+    keep = (first_cells == neighbour_cells[first + num - 1]) & ~np.isin(unique, codes)
+    return unique[keep], first_cells[keep]
+
+
+@attr.s(auto_attribs=True, frozen=True, eq=False)
+class MarkerIndex:
+    """Table of the canonical 2-bit codes of all marker k-mers.
+
+    Reference and alternative k-mers are stored once per canonical code, so a k-mer and its
+    reverse complement share a single entry.  A minimal perfect hash function maps each code to
+    a *slot*, ``codes`` holds the code of each slot for verifying lookups.  Counts are kept in an
+    ``np.int32`` matrix with one row per site and the columns ``REF`` and ``ALT``; ``cells``
+    gives the flat position in this matrix that a slot is counted in.
+
+    To tolerate one mismatch, the index also holds the unambiguous Hamming neighbours of the
+    marker k-mers (see ``hamming_neighbours()``), counted in the cells of their marker k-mers.
+    Lookups cost the same, the tolerance only costs table memory.
+
+    Most read windows are not marker k-mers.  The ``code_filter`` drops the majority of them with
+    a single table lookup on their forward code, before the canonical code is computed and
+    looked up in the minimal perfect hash function (see ``build_code_filter()``).
+    """
+
+    #: The k-mer length.
+    kmer_length: int
+    #: Number of marker sites.
+    num_sites: int
+    #: The minimal perfect hash function over ``codes``.
+    mphf: MinimalPerfectHash
+    #: Canonical code of each slot (``np.uint64``).
+    codes: np.ndarray
+    #: Flat counts matrix cell of each slot.
+    cells: np.ndarray
+    #: Pairs of ``(cell, source cell)`` for k-mers shared by several site alleles; the cell
+    #: receives the count of the source cell that the shared k-mer is counted in.
+    shared_cells: np.ndarray
+    #: Filter on forward codes of marker k-mers in both orientations, see ``may_contain()``.
+    code_filter: np.ndarray
+    #: Number of slots holding Hamming neighbours of marker k-mers.
+    num_neighbours: int = 0
+    #: Paths of the k-mer infos files that the index was built from, empty if not from files.
+    source_paths: typing.Tuple[str, ...] = ()
+
+    @property
+    def num_kmers(self) -> int:
+        """Number of distinct canonical k-mers, including Hamming neighbours."""
+        return len(self.codes)
+
+    @classmethod
+    def from_kmer_infos(
+        cls,
+        kmer_infos: typing.List[KmerInfo],
+        mismatches: int = 0,
+        source_paths: typing.Sequence[str] = (),
+    ) -> _TMarkerIndex:
+        """Build the index of the reference and alternative k-mers of ``kmer_infos``.
+
+        With ``mismatches=1``, k-mers with one mismatch to a marker k-mer are counted as well.
+        ``source_paths`` are the files that ``kmer_infos`` were read from, if any.
+        """
+        if mismatches not in (0, 1):
+            raise ValueError("Only 0 or 1 mismatches are supported, not %d" % mismatches)
+        if not kmer_infos:
+            raise ValueError("Cannot build marker index from empty k-mer list")
+        kmer_length = len(kmer_infos[0].ref_kmer)
+
+        code_cells = {}  # canonical code => list of cells
+        for site_no, kmer_info in enumerate(kmer_infos):
+            for allele, kmer in ((REF, kmer_info.ref_kmer), (ALT, kmer_info.alt_kmer)):
+                if len(kmer) != kmer_length:
+                    raise ValueError(
+                        "Kmer of invalid length (%d): %s, should be %d"
+                        % (len(kmer), kmer, kmer_length)
+                    )
+                code = encode_kmer(kmer)
+                if code is not None:
+                    cell = 2 * site_no + allele
+                    code_cells.setdefault(canonical_code(code, kmer_length), []).append(cell)
+
+        keys = np.array(list(code_cells.keys()), dtype=np.uint64)
+        key_cells = np.array([cell_list[0] for cell_list in code_cells.values()], dtype=np.int64)
+        num_neighbours = 0
+        if mismatches:
+            neighbours, neighbour_cells = hamming_neighbours(keys, key_cells, kmer_length)
+            num_neighbours = len(neighbours)
+            keys = np.concatenate((keys, neighbours))
+            key_cells = np.concatenate((key_cells, neighbour_cells))
+        mphf = MinimalPerfectHash.build(keys)
+        slots = mphf.lookup(keys)
+        codes = np.zeros(len(keys), dtype=np.uint64)
+        codes[slots] = keys
+        cells = np.zeros(len(keys), dtype=np.int64)
+        cells[slots] = key_cells
+        shared_cells = np.array(
+            [(cell, cell_list[0]) for cell_list in code_cells.values() for cell in cell_list[1:]],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        return MarkerIndex(
+            kmer_length=kmer_length,
+            num_sites=len(kmer_infos),
+            mphf=mphf,
+            codes=codes,
+            cells=cells,
+            shared_cells=shared_cells,
+            code_filter=build_code_filter(codes, kmer_length),
+            num_neighbours=num_neighbours,
+            source_paths=tuple(source_paths),
+        )
+
+    def may_contain(self, codes: np.ndarray) -> np.ndarray:
+        """Return a mask of the forward ``codes`` that may be marker k-mers in either orientation.
+
+        All marker k-mers pass, most other codes are rejected.
+        """
+        num_bits = len(self.code_filter).bit_length() - 1
+        return self.code_filter[_filter_positions(codes, num_bits)]
+
+    def locate(self, codes: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Return the positions of the ``codes`` that are marker k-mers and their slots."""
+        if not self.num_kmers:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        slots = self.mphf.lookup(codes)
+        positions = np.flatnonzero(self.codes[slots] == codes)
+        return positions, slots[positions]
+
+    def new_counts(self) -> np.ndarray:
+        """Return a zero-initialized ``(num_sites, 2)`` counts matrix."""
+        return np.zeros((self.num_sites, 2), dtype=np.int32)
+
+    def add_hits(self, counts: np.ndarray, slots: np.ndarray) -> None:
+        """Add one count for each element of the array of matched ``slots`` to ``counts``."""
+        hits = np.bincount(self.cells[slots], minlength=counts.size)
+        counts += hits.reshape(counts.shape).astype(np.int32)
+
+    def add_fragment_hits(
+        self, counts: np.ndarray, fragments: np.ndarray, slots: np.ndarray
+    ) -> None:
+        """Add one count for each distinct counts matrix cell hit by each fragment to ``counts``.
+
+        ``fragments`` holds the fragment number of each element of ``slots``; a cell hit by both
+        mates of a fragment, or several times by one mate, is counted only once for it.
+        """
+        keys = np.unique(fragments.astype(np.int64) * counts.size + self.cells[slots])
+        hits = np.bincount(keys % counts.size, minlength=counts.size)
+        counts += hits.reshape(counts.shape).astype(np.int32)
+
+    def site_depths(self, counts: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Return per-site reference and alternative depths from the ``counts`` matrix."""
+        flat = counts.ravel().copy()
+        if len(self.shared_cells):
+            flat[self.shared_cells[:, 0]] = flat[self.shared_cells[:, 1]]
+        result = flat.reshape(counts.shape)
+        return result[:, REF], result[:, ALT]
@@ -1,42 +1,118 @@
 """Implementation of ``fastq-kmers``: build kmers TSV file from reference FASTA and a variants
 VCF file.
+
+The sites are grouped by chromosome and sorted by position, and the k-mers of each contig are
+sliced from the reference at once (see ``reference.ReferenceReader``).  With ``num_procs``
+worker processes, each worker opens the reference itself and handles one contig at a time, so
+at most about one contig per worker is held in memory.  The k-mers are written in the order of
+the sites in the input VCF file, as other commands pair the sites of samples by their index.
 """
 
 import argparse
+import contextlib
+import multiprocessing
 import pathlib
 import gzip
 import typing
 
 from logzero import logger
+import numpy as np
 import pysam
 
 from .config import FastqKmersConfig, DEFAULT_KMER_LENGTH, GenomeRelease, DEFAULT_GENOME_RELEASE
+from .reference import ReferenceReader
 from ..common import SITES_VCFS
 from ..models import vcf, fastq
 
+#: The reference reader of a worker process, set up by ``_init_worker()``.
+_worker_state = {}
+
+
+def group_sites(sites: typing.List[vcf.Site]) -> typing.Dict[str, typing.List[int]]:
+    """Return the indices of ``sites`` grouped by chromosome, in order of first occurrence, and
+    sorted by position.
+    """
+    result = {}
+    for i, site in enumerate(sites):
+        result.setdefault(site.chromosome, []).append(i)
+    for indices in result.values():
+        indices.sort(key=lambda i: sites[i].position)
+    return result
+
+
+def contig_kmers(
+    reader: ReferenceReader, chromosome: str, sites: typing.List[vcf.Site], delta: int
+) -> typing.List[str]:
+    """Return the k-mers centered on ``sites`` of ``chromosome``, checking the reference bases."""
+    length = 2 * delta + 1
+    starts = np.array([site.position - delta - 1 for site in sites], dtype=np.int64)
+    kmers = reader.kmers(chromosome, starts, length)
+    references = np.array(
+        [ord(site.reference) if len(site.reference) == 1 else 0 for site in sites], dtype=np.uint8
+    )
+    mismatches = np.flatnonzero(kmers[:, delta] != references)
+    if len(mismatches):  # pragma: no cover
+        site = sites[mismatches[0]]
+        raise Exception(
+            "Expected %s:%d to be %s but is %s!"
+            % (site.chromosome, site.position, site.reference, chr(kmers[mismatches[0], delta]))
+        )
+    data = kmers.tobytes().decode("ascii")
+    return [data[i : i + length] for i in range(0, len(data), length)]
+
+
+def _init_worker(reference: str) -> None:
+    _worker_state["reader"] = ReferenceReader(reference)
+
+
+def _contig_kmers_in_worker(
+    args: typing.Tuple[str, typing.List[vcf.Site], int]
+) -> typing.List[str]:
+    chromosome, sites, delta = args
+    return contig_kmers(_worker_state["reader"], chromosome, sites, delta)
+
 
 def _fastq_kmers_run(
     config: FastqKmersConfig, sites: typing.Iterable[vcf.Site], outputf: typing.TextIO
 ) -> int:
     delta = config.kmer_length // 2
-    with pysam.FastaFile(config.common.reference) as fastaf:
-        print("#" + "\t".join(fastq.KmerInfo.headers()), file=outputf)
-        for siteno, site in enumerate(sites):
-            kmer = fastaf.fetch(site.chromosome, site.position - delta - 1, site.position + delta)
-            if not kmer[delta] == site.reference:  # pragma: no cover
-                raise Exception(
-                    "Expected %s:%d to be %s but is %s!"
-                    % (site.chromosome, site.position, site.reference, kmer[delta])
+    sites = list(sites)
+    groups = group_sites(sites)
+    tasks = [
+        (chromosome, [sites[i] for i in indices], delta) for chromosome, indices in groups.items()
+    ]
+    with contextlib.ExitStack() as stack:
+        if config.num_procs <= 1:
+            reader = stack.enter_context(ReferenceReader(config.common.reference))
+            results = (contig_kmers(reader, *task) for task in tasks)
+        else:
+            logger.info(
+                "Generating kmers of %d contigs with %d processes", len(groups), config.num_procs
+            )
+            # Build the FASTA index before the workers open the file.
+            pysam.FastaFile(config.common.reference).close()
+            pool = stack.enter_context(
+                multiprocessing.Pool(
+                    config.num_procs, initializer=_init_worker, initargs=(config.common.reference,)
                 )
-            arr = (
-                config.genome_release,
-                site.chromosome,
-                site.position,
-                site.reference,
-                site.alternative,
-                kmer,
             )
-            print("\t".join(map(str, arr)), file=outputf)
+            results = pool.imap(_contig_kmers_in_worker, tasks)
+        # Write the sites in input order, e.g., ``compare`` pairs the sites of samples by index.
+        site_kmers = [None] * len(sites)
+        for indices, kmers in zip(groups.values(), results):
+            for i, kmer in zip(indices, kmers):
+                site_kmers[i] = kmer
+    print("#" + "\t".join(fastq.KmerInfo.headers()), file=outputf)
+    for site, kmer in zip(sites, site_kmers):
+        arr = (
+            config.genome_release,
+            site.chromosome,
+            site.position,
+            site.reference,
+            site.alternative,
+            kmer,
+        )
+        print("\t".join(map(str, arr)), file=outputf)
     return 0
 
 
@@ -117,3 +193,9 @@ def fastq_kmers_config_parser(subparsers: argparse._SubParsersAction) -> None:
     parser.add_argument(
         "--max-sites", type=int, help="Maximal number of sites to read, no limit if unset."
     )
+    parser.add_argument(
+        "--num-procs",
+        type=int,
+        default=1,
+        help="Number of processes to generate the k-mers of the contigs with",
+    )
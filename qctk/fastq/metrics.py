@@ -0,0 +1,136 @@
+"""Throughput and hit-rate metrics of ``fastq-extract``.
+
+Each pipeline collects the metrics of its input chunk and logs them every ``metrics_seconds``
+seconds.  At the end of a run, the metrics of all chunks and their totals are written to a JSON
+file next to the sample statistics, for capacity planning and for catching regressions.
+"""
+
+import json
+import pathlib
+import resource
+import sys
+import typing
+
+import attr
+import cattr
+from logzero import logger
+
+from ..models.vcf import sample_path
+
+
+@attr.s(auto_attribs=True)
+class CountMetrics:
+    """Metrics of counting the marker k-mers of one input chunk or of a whole run."""
+
+    #: Number of reads counted.
+    num_reads: int = 0
+    #: Number of bases in the counted reads.
+    num_bases: int = 0
+    #: Number of bytes read from the input files, compressed size for compressed input.
+    bytes_in: int = 0
+    #: Time spent decompressing, summed over all threads, in seconds.
+    decompress_seconds: float = 0.0
+    #: Number of k-mer windows in the counted reads.
+    num_windows: int = 0
+    #: Number of windows that hit a marker k-mer.
+    num_hits: int = 0
+    #: Wall-clock time, in seconds.
+    wall_seconds: float = 0.0
+
+    @property
+    def reads_per_second(self) -> float:
+        return self.num_reads / self.wall_seconds if self.wall_seconds else 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of the windows that hit a marker k-mer."""
+        return self.num_hits / self.num_windows if self.num_windows else 0.0
+
+    def add(self, other: "CountMetrics") -> None:
+        """Add the counters of ``other``, keeping the wall-clock time."""
+        self.num_reads += other.num_reads
+        self.num_bases += other.num_bases
+        self.bytes_in += other.bytes_in
+        self.decompress_seconds += other.decompress_seconds
+        self.num_windows += other.num_windows
+        self.num_hits += other.num_hits
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """Return the metrics including the derived rates."""
+        return {
+            **cattr.unstructure(self),
+            "reads_per_second": self.reads_per_second,
+            "hit_rate": self.hit_rate,
+        }
+
+    def log(self, label: str) -> None:
+        """Log the metrics of ``label``."""
+        logger.info(
+            "Metrics for %s: %s reads, %s bases, %.1f MB read, %.2f s decompressing, %s windows, "
+            "%s hits (%.4f%%), %.2f s wall-clock (%s reads/s)",
+            label,
+            "{:,}".format(self.num_reads),
+            "{:,}".format(self.num_bases),
+            self.bytes_in / 1024 / 1024,
+            self.decompress_seconds,
+            "{:,}".format(self.num_windows),
+            "{:,}".format(self.num_hits),
+            100.0 * self.hit_rate,
+            self.wall_seconds,
+            "{:,.0f}".format(self.reads_per_second),
+        )
+
+
+@attr.s(auto_attribs=True)
+class ChunkMetrics(CountMetrics):
+    """Metrics of counting one input chunk."""
+
+    #: Path to the input file.
+    path: str = ""
+    #: Index of the part of the input file.
+    part: int = 0
+    #: Number of parts that the input file is split into.
+    num_parts: int = 1
+    #: Path to the mate file of paired-end input.
+    mate_path: typing.Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        path = self.path if self.mate_path is None else "%s + %s" % (self.path, self.mate_path)
+        if self.num_parts == 1:
+            return path
+        return "%s (part %d/%d)" % (path, self.part + 1, self.num_parts)
+
+
+def peak_rss_bytes() -> typing.Dict[str, int]:
+    """Return the peak resident set size of this process and of its largest child process."""
+    # ``ru_maxrss`` is in kilobytes on Linux but in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "peak_child_rss_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def metrics_path(storage_path: str, sample_id: str) -> pathlib.Path:
+    """Return the path to the metrics file next to the statistics of ``sample_id``."""
+    path_stats = sample_path(storage_path, sample_id)
+    return path_stats.with_name(path_stats.name.replace("-stats.json", "-metrics.json"))
+
+
+def write_metrics(
+    storage_path: str, sample_id: str, total: CountMetrics, chunks: typing.List[ChunkMetrics],
+) -> pathlib.Path:
+    """Write the ``total`` metrics of the run and the metrics of its ``chunks`` next to the
+    statistics of ``sample_id`` and return the path.
+    """
+    output_path = metrics_path(storage_path, sample_id)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "sample": sample_id,
+        "run": {**total.to_dict(), **peak_rss_bytes()},
+        "files": [chunk.to_dict() for chunk in chunks],
+    }
+    with output_path.open("wt") as outputf:
+        json.dump(data, outputf, indent=2)
+    return output_path
@@ -0,0 +1,206 @@
+"""Prefilter that skips reads sharing no sampled ``m``-mer with the marker k-mers.
+
+The ``(w, m)``-minimizer scheme picks one ``m``-mer out of each window of ``w`` consecutive
+``m``-mers.  Picking the one with the smallest hash needs the codes of all ``m``-mers of a read
+and ``w`` passes for the window minima, which costs more than looking up all k-mers of the read
+with the code filter of the ``MarkerIndex``.  The prefilter thus picks the ``m``-mer at a fixed
+position instead: it samples the ``m``-mer starting at every ``w``-th position of a block of
+reads.  With ``w + m - 1 <= k``, each occurrence of a marker k-mer spans ``w`` consecutive
+``m``-mer starts, one of which is sampled.  The panel holds all ``m``-mers of the marker k-mers
+in both orientations, so every read containing a marker k-mer has a sampled ``m``-mer in the
+panel.  Reads without any such ``m``-mer are rejected without looking up their k-mers.
+
+The panel is a ``bool`` table over the hashed ``m``-mer codes, like the code filter of the
+``MarkerIndex``, and passes some reads without marker k-mers as well.  The prefilter pays off
+if most reads contain no marker k-mer, e.g., for whole-genome reads and a panel of some
+thousand sites.  If most reads contain a marker k-mer, the engine has to look at them anyway and
+the prefilter only adds work.
+"""
+
+import threading
+import typing
+
+import attr
+from logzero import logger
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from .encode import (
+    ENCODE_ARRAY,
+    decode_kmer,
+    flatten_fragments,
+    forward_codes,
+    revcomp_codes,
+    to_bytes,
+)
+from .index import MarkerIndex
+from ..common import batched
+from ..config import DEFAULT_BATCH_SIZE
+
+
+#: Odd multiplier for hashing ``m``-mer codes into the panel table (Fibonacci hashing).
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+#: Bounds on the number of hash bits of the panel table, about 64 entries per ``m``-mer in between.
+_MIN_PANEL_BITS = 16
+_MAX_PANEL_BITS = 26
+
+
+def _panel_positions(codes: np.ndarray, num_bits: int) -> np.ndarray:
+    """Return the positions of the ``np.uint64`` ``codes`` in a panel table of ``num_bits``."""
+    return (codes * _HASH_MULTIPLIER) >> np.uint64(64 - num_bits)
+
+
+def sampled_codes(
+    buf: np.ndarray, minimizer_length: int, window: int
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Return the starts and forward codes of the ``m``-mers at every ``window``-th position of
+    the ``uint8`` buffer ``buf``.
+
+    Non-``ACGT`` characters are encoded as ``A``, which can only let more reads pass.
+    """
+    bases = np.take(ENCODE_ARRAY, buf) & np.uint8(3)
+    num_samples = max(0, (len(buf) - minimizer_length) // window + 1)
+    # One row per sampled ``m``-mer, its bases are folded into the codes column by column.
+    rows = as_strided(
+        bases, shape=(num_samples, minimizer_length), strides=(window, 1), writeable=False
+    )
+    codes = rows[:, 0].astype(np.uint64)
+    for offset in range(1, minimizer_length):
+        codes <<= np.uint64(2)
+        codes |= rows[:, offset]
+    return np.arange(num_samples) * window, codes
+
+
+def panel_table(index: MarkerIndex, minimizer_length: int, window: int) -> np.ndarray:
+    """Return the ``bool`` table of the hashed ``m``-mers of all marker k-mers in ``index``, in
+    both orientations.
+    """
+    kmer_length = index.kmer_length
+    span = window + minimizer_length - 1
+    if span > kmer_length:
+        raise ValueError(
+            "Minimizer window span %d (w + m - 1) exceeds k-mer length %d" % (span, kmer_length)
+        )
+    kmers = "".join(decode_kmer(code, kmer_length) for code in index.codes.tolist())
+    buf = np.frombuffer(kmers.encode("ascii"), dtype=np.uint8)
+    codes, _ = forward_codes(buf, minimizer_length)
+    # Only keep ``m``-mers that lie completely within one k-mer.
+    codes = codes[np.arange(len(codes)) % kmer_length <= kmer_length - minimizer_length]
+    codes = np.concatenate((codes, revcomp_codes(codes, minimizer_length)))
+    num_bits = min(_MAX_PANEL_BITS, max(_MIN_PANEL_BITS, len(codes).bit_length() + 6))
+    result = np.zeros(1 << num_bits, dtype=bool)
+    result[_panel_positions(codes, num_bits)] = True
+    return result
+
+
+@attr.s(auto_attribs=True)
+class PrefilterStats:
+    """Statistics of the minimizer prefilter."""
+
+    #: Number of reads seen.
+    reads_in: int = 0
+    #: Number of reads passed to the engine.
+    reads_passed: int = 0
+
+    @property
+    def rejection_rate(self) -> float:
+        return 1.0 - self.reads_passed / self.reads_in if self.reads_in else 0.0
+
+    def log(self, path: str) -> None:
+        """Log the rejection rate."""
+        logger.info(
+            "Minimizer prefilter for %s rejected %s of %s reads (%.1f%%)",
+            path,
+            "{:,}".format(self.reads_in - self.reads_passed),
+            "{:,}".format(self.reads_in),
+            100.0 * self.rejection_rate,
+        )
+
+
+class MinimizerPrefilter:
+    """Wrap a counting engine such that only reads sharing a sampled ``m``-mer with the panel
+    reach it.
+    """
+
+    def __init__(
+        self, engine, minimizer_length: int, window: int, batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        #: The wrapped engine.
+        self.engine = engine
+        #: The marker index.
+        self.index = engine.index
+        #: The minimizer length ``m``.
+        self.minimizer_length = minimizer_length
+        #: The number of consecutive ``m``-mers per window ``w``.
+        self.window = window
+        #: Number of reads to filter at once.
+        self.batch_size = batch_size
+        #: Table of the hashed panel ``m``-mers, see ``panel_table()``.
+        self.panel = panel_table(self.index, minimizer_length, window)
+        #: Statistics since the last call to ``take_stats()``.
+        self.stats = PrefilterStats()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, e.g., when sending the engine to spawned worker processes.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.engine.name
+
+    def select(self, sequences: typing.List[typing.Any]) -> typing.List[typing.ByteString]:
+        """Return the ``sequences`` that share at least one sampled ``m``-mer with the panel."""
+        seqs = list(map(to_bytes, sequences))
+        return [seqs[i] for i in self.hit_reads(seqs).tolist()]
+
+    def hit_reads(self, seqs: typing.List[typing.ByteString]) -> np.ndarray:
+        """Return the sorted numbers of the ``seqs`` that share a sampled ``m``-mer with the
+        panel.
+        """
+        buf = np.frombuffer(b"N".join(seqs), dtype=np.uint8)
+        starts, codes = sampled_codes(buf, self.minimizer_length, self.window)
+        num_bits = len(self.panel).bit_length() - 1
+        hit_starts = starts[self.panel[_panel_positions(codes, num_bits)]]
+        read_starts = np.concatenate(([0], np.cumsum([len(seq) + 1 for seq in seqs])[:-1]))
+        return np.unique(np.searchsorted(read_starts, hit_starts, side="right") - 1)
+
+    def count(self, sequences: typing.Iterable[typing.Any], counts: np.ndarray) -> None:
+        """Add marker k-mer occurrences in the selected ``sequences`` to ``counts``."""
+        for batch in batched(sequences, self.batch_size):
+            selected = self.select(batch)
+            with self._lock:
+                self.stats.reads_in += len(batch)
+                self.stats.reads_passed += len(selected)
+            if selected:
+                self.engine.count(selected, counts)
+
+    def count_fragments(
+        self, fragments: typing.Iterable[typing.Tuple[typing.Any, ...]], counts: np.ndarray
+    ) -> None:
+        """Add marker k-mer occurrences in the selected ``fragments`` to ``counts``, once per
+        fragment.
+
+        A fragment is selected if any of its mates shares a sampled ``m``-mer with the panel.
+        """
+        for batch in batched(fragments, self.batch_size):
+            reads, fragment_nos = flatten_fragments(batch)
+            selected = np.unique(fragment_nos[self.hit_reads(list(map(to_bytes, reads)))])
+            with self._lock:
+                self.stats.reads_in += len(reads)
+                self.stats.reads_passed += int(np.isin(fragment_nos, selected).sum())
+            if len(selected):
+                self.engine.count_fragments([batch[i] for i in selected.tolist()], counts)
+
+    def take_stats(self) -> PrefilterStats:
+        """Return the statistics collected so far and reset them."""
+        with self._lock:
+            result, self.stats = self.stats, PrefilterStats()
+        return result
@@ -0,0 +1,88 @@
+"""Minimal perfect hash function over the canonical marker k-mer codes.
+
+The construction follows BBHash: at each level, the remaining keys are hashed into a bit array
+of ``gamma`` times their number.  Keys that do not collide set their bit and are done, the others
+are passed on to the next level.  The hash value of a key is the number of set bits before its
+bit over all levels, so the ``n`` keys map to ``range(n)`` without collisions.  Construction and
+lookup are vectorized over arrays of codes.
+
+Codes that are not keys map to an arbitrary slot, so lookups must be verified against the key
+stored in the slot.
+"""
+
+import typing
+
+import attr
+import numpy as np
+
+from .encode import splitmix64
+
+
+_TMinimalPerfectHash = typing.TypeVar("MinimalPerfectHash")
+
+#: Default ratio of bit array size to number of keys per level.
+DEFAULT_GAMMA = 2.0
+
+#: Maximal number of levels before construction is given up.
+_MAX_LEVELS = 64
+
+
+@attr.s(auto_attribs=True, frozen=True, eq=False)
+class MinimalPerfectHash:
+    """Minimal perfect hash function built over a set of ``np.uint64`` keys."""
+
+    #: Number of keys.
+    num_keys: int
+    #: Start of each level in ``bits`` plus the total length as the last element.
+    level_offsets: np.ndarray
+    #: The bit arrays of all levels, concatenated.
+    bits: np.ndarray
+    #: Number of set bits in ``bits`` before each position.
+    ranks: np.ndarray
+
+    @classmethod
+    def build(cls, keys: np.ndarray, gamma: float = DEFAULT_GAMMA) -> _TMinimalPerfectHash:
+        keys = np.asarray(keys, dtype=np.uint64)
+        if len(np.unique(keys)) != len(keys):
+            raise ValueError("Keys of minimal perfect hash must be unique")
+        remaining = keys
+        level_bits = []
+        while len(remaining):
+            if len(level_bits) == _MAX_LEVELS:  # pragma: no cover
+                raise ValueError("Could not build minimal perfect hash")
+            size = max(1, int(gamma * len(remaining)))
+            pos = (splitmix64(remaining, len(level_bits)) % np.uint64(size)).astype(np.int64)
+            unique = np.bincount(pos, minlength=size)[pos] == 1
+            bits = np.zeros(size, dtype=bool)
+            bits[pos[unique]] = True
+            level_bits.append(bits)
+            remaining = remaining[~unique]
+        bits = np.concatenate(level_bits) if level_bits else np.zeros(0, dtype=bool)
+        ranks = (np.cumsum(bits) - bits).astype(np.int64)
+        level_offsets = np.cumsum([0] + [len(b) for b in level_bits]).astype(np.int64)
+        return MinimalPerfectHash(
+            num_keys=len(keys), level_offsets=level_offsets, bits=bits, ranks=ranks
+        )
+
+    @property
+    def num_levels(self) -> int:
+        return len(self.level_offsets) - 1
+
+    def lookup(self, codes: np.ndarray) -> np.ndarray:
+        """Return the slot in ``range(num_keys)`` of each of the ``codes``.
+
+        Slots of codes that are not keys are arbitrary (``0`` if they fall through all levels).
+        """
+        codes = np.asarray(codes, dtype=np.uint64)
+        result = np.zeros(len(codes), dtype=np.int64)
+        pending = np.arange(len(codes))
+        for level in range(self.num_levels):
+            if not len(pending):
+                break
+            offset = self.level_offsets[level]
+            size = np.uint64(self.level_offsets[level + 1] - offset)
+            pos = offset + (splitmix64(codes[pending], level) % size).astype(np.int64)
+            found = self.bits[pos]
+            result[pending[found]] = self.ranks[pos[found]]
+            pending = pending[~found]
+        return result
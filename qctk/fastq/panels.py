@@ -0,0 +1,94 @@
+"""Marker panels of ``fastq-extract``.
+
+A panel is the set of marker k-mers for the sites of one genome release.  Several panels are
+counted in a single pass over the reads by concatenating their k-mer infos and building one
+``MarkerIndex`` from them.  The sites of each panel occupy a contiguous range of rows of the
+counts matrix, which tags each counted k-mer with its panel.  K-mers shared by several panels,
+e.g., at sites that GRCh37 and GRCh38 have in common, are looked up once and their counts are
+copied to the rows of the other panels (see ``MarkerIndex.shared_cells``).
+"""
+
+import pathlib
+import typing
+
+import attr
+
+from .config import FastqExtractConfig
+from ..common import GenomeRelease
+from ..models.fastq import KmerInfo, read_kmer_infos
+
+#: Genome release to the k-mer infos file shipping with ``qctk``.
+KMER_FILES = {
+    GenomeRelease.GRCH37: pathlib.Path(__file__).parent.parent / "data" / "kmers.GRCh37.tsv.gz",
+    GenomeRelease.GRCH38: pathlib.Path(__file__).parent.parent / "data" / "kmers.hg38.tsv.gz",
+}
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class MarkerPanel:
+    """The marker k-mers of one genome release."""
+
+    #: Name of the panel, the genome release of its sites.
+    name: str
+    #: The k-mer infos of the panel.
+    kmer_infos: typing.List[KmerInfo]
+    #: Row of the first site of the panel in the counts matrix of all panels.
+    first_site: int = 0
+    #: Path of the k-mer infos file that the panel was loaded from.
+    path: typing.Optional[str] = None
+
+    @property
+    def sites(self) -> slice:
+        """The rows of the sites of the panel in the counts matrix of all panels."""
+        return slice(self.first_site, self.first_site + len(self.kmer_infos))
+
+
+def kmer_infos_paths(config: FastqExtractConfig) -> typing.List[str]:
+    """Return the paths of the k-mer infos of the panels, ``config.kmer_infos`` or the files for
+    ``config.genome_release``.
+    """
+    if config.kmer_infos:
+        return list(config.kmer_infos)
+    return [str(KMER_FILES[GenomeRelease.from_value(release)]) for release in config.genome_release]
+
+
+def load_panels(config: FastqExtractConfig) -> typing.List[MarkerPanel]:
+    """Load the panels from ``config.kmer_infos`` or the files for ``config.genome_release``.
+
+    Raises ``ValueError`` if several panels are for the same genome release.
+    """
+    result = []
+    first_site = 0
+    for path in kmer_infos_paths(config):
+        kmer_infos = read_kmer_infos(path=path)
+        if not kmer_infos:
+            raise ValueError("No k-mers in %s" % path)
+        name = kmer_infos[0].site.genome_release
+        if name in [panel.name for panel in result]:
+            raise ValueError("Several k-mer panels for genome release %s" % name)
+        result.append(
+            MarkerPanel(name=name, kmer_infos=kmer_infos, first_site=first_site, path=path)
+        )
+        first_site += len(kmer_infos)
+    return result
+
+
+def merge_panels(panels: typing.List[MarkerPanel]) -> typing.List[KmerInfo]:
+    """Return the k-mer infos of all ``panels``, in the order of the rows of the counts matrix."""
+    return [kmer_info for panel in panels for kmer_info in panel.kmer_infos]
+
+
+def panel_paths(panels: typing.List[MarkerPanel]) -> typing.List[str]:
+    """Return the k-mer infos paths of ``panels``, empty if any panel was not loaded from a file."""
+    paths = [panel.path for panel in panels]
+    return [] if None in paths else paths
+
+
+def panel_sample_ids(sample_id: str, panels: typing.List[MarkerPanel]) -> typing.List[str]:
+    """Return the IDs under which the statistics of ``sample_id`` are stored for each panel.
+
+    With a single panel, this is ``sample_id`` itself, otherwise the panel name is appended.
+    """
+    if len(panels) == 1:
+        return [sample_id]
+    return ["%s.%s" % (sample_id, panel.name) for panel in panels]
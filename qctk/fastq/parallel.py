@@ -0,0 +1,149 @@
+"""Parallel k-mer counting over input chunks for ``fastq-extract``."""
+
+import contextlib
+import multiprocessing
+import time
+import typing
+
+import attr
+from logzero import logger
+import numpy as np
+
+from .config import FastqExtractConfig, PartitionKey, StopCondition
+from .engines import build_engine
+from .index import MarkerIndex
+from .metrics import ChunkMetrics, CountMetrics
+from .partitions import Partition, file_partition_names, merge_partitions
+from .pipeline import Pipeline
+from .readers import STDIN_PATH, InputChunk, split_inputs
+from .saturation import MonitorServer, SaturationMonitor, saturation_enabled
+
+#: The configuration, engine, and monitor of a worker process, set up by ``_init_worker()``.
+_worker_state = {}
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class CountResult:
+    """The result of counting the marker k-mers in all input files."""
+
+    #: The counts matrix.
+    counts: np.ndarray
+    #: Number of reads counted.
+    num_reads: int
+    #: Why reading the input stopped.
+    stop_condition: StopCondition = StopCondition.EXHAUSTED
+    #: Metrics of each input chunk.
+    chunk_metrics: typing.List[ChunkMetrics] = attr.Factory(list)
+    #: Wall-clock time of counting, in seconds.
+    wall_seconds: float = 0.0
+    #: Counts per input file or read group, if partitioned.
+    partitions: typing.Dict[str, Partition] = attr.Factory(dict)
+
+    @property
+    def metrics(self) -> CountMetrics:
+        """The metrics summed over all chunks."""
+        result = CountMetrics(wall_seconds=self.wall_seconds)
+        for metrics in self.chunk_metrics:
+            result.add(metrics)
+        return result
+
+
+#: The result of ``count_chunk()``.
+ChunkResult = typing.Tuple[np.ndarray, int, ChunkMetrics, typing.Dict[str, Partition]]
+
+
+def count_chunk(config: FastqExtractConfig, engine, chunk: InputChunk, monitor=None) -> ChunkResult:
+    """Return the marker k-mer counts of ``chunk`` using ``engine``, the number of reads, the
+    metrics, and the counts per read group when partitioning by read group.
+
+    Nothing is read if ``monitor`` has already stopped.
+    """
+    if monitor is not None and monitor.stopped:
+        metrics = ChunkMetrics(
+            path=chunk.path, part=chunk.part, num_parts=chunk.num_parts, mate_path=chunk.mate_path
+        )
+        return engine.index.new_counts(), 0, metrics, {}
+    logger.debug(
+        "Processing FASTQ file: %s (part %d/%d)", chunk.path, chunk.part + 1, chunk.num_parts
+    )
+    pipeline = Pipeline(config, engine, chunk, monitor)
+    counts = pipeline.run()
+    return counts, pipeline.num_reads, pipeline.metrics, pipeline.partitions
+
+
+def _init_worker(config: FastqExtractConfig, engine, monitor) -> None:
+    _worker_state["config"] = config
+    _worker_state["engine"] = engine
+    _worker_state["monitor"] = monitor
+
+
+def _count_chunk_in_worker(chunk: InputChunk) -> ChunkResult:
+    return count_chunk(
+        _worker_state["config"], _worker_state["engine"], chunk, _worker_state["monitor"]
+    )
+
+
+def count_inputs(
+    config: FastqExtractConfig, index: MarkerIndex, monitor=None, engine=None
+) -> CountResult:
+    """Count marker k-mers in all input files of ``config``.
+
+    With ``config.num_procs > 1``, the input chunks are distributed over a process pool.  The
+    engine with its marker index is built once and inherited by the workers, and each worker
+    returns the counts matrix of its chunk which are summed up here.
+
+    Worker processes cannot read the standard input of the parent, so it is counted here while
+    the workers process the other chunks.
+
+    Checkpoints are reported to ``monitor`` which decides whether to stop reading early.  If no
+    monitor is given, a ``SaturationMonitor`` is used if early stop conditions are configured.
+    The ``engine`` over ``index`` is built unless given.
+
+    The counts are also partitioned by input file or read group if configured.
+    """
+    start = time.monotonic()
+    chunks = split_inputs(config)
+    engine = engine or build_engine(config, index)
+    if monitor is None and saturation_enabled(config):
+        monitor = SaturationMonitor(config, index)
+    if config.num_procs <= 1:
+        results = [count_chunk(config, engine, chunk, monitor) for chunk in chunks]
+    else:
+        logger.info("Counting %d input chunks with %d processes", len(chunks), config.num_procs)
+        with contextlib.ExitStack() as stack:
+            client = stack.enter_context(MonitorServer(monitor)).client if monitor else None
+            pool = stack.enter_context(
+                multiprocessing.Pool(
+                    config.num_procs, initializer=_init_worker, initargs=(config, engine, client)
+                )
+            )
+            pool_results = pool.imap_unordered(
+                _count_chunk_in_worker, [chunk for chunk in chunks if chunk.path != STDIN_PATH]
+            )
+            results = [
+                count_chunk(config, engine, chunk, monitor)
+                for chunk in chunks
+                if chunk.path == STDIN_PATH
+            ]
+            results += list(pool_results)
+
+    counts = index.new_counts()
+    num_reads = 0
+    chunk_metrics = []
+    partitions = {}
+    file_partitions = file_partition_names([chunk.path for chunk in chunks])
+    for chunk_counts, chunk_reads, metrics, chunk_partitions in results:
+        counts += chunk_counts
+        num_reads += chunk_reads
+        chunk_metrics.append(metrics)
+        if config.partition_by == PartitionKey.FILE.value:
+            chunk_partitions = {file_partitions[metrics.path]: Partition(chunk_counts, chunk_reads)}
+        merge_partitions(partitions, chunk_partitions)
+    return CountResult(
+        counts=counts,
+        num_reads=num_reads,
+        stop_condition=(monitor and monitor.stop_condition) or StopCondition.EXHAUSTED,
+        chunk_metrics=chunk_metrics,
+        wall_seconds=time.monotonic() - start,
+        partitions=partitions,
+    )
@@ -0,0 +1,62 @@
+"""Count partitions of ``fastq-extract``.
+
+Besides the counts of the whole sample, the counts can be partitioned by input file or by read
+group, i.e., flow cell lane parsed from the read names (see ``readers.read_group()``).  Each
+partition costs one more counts matrix and yields its own fingerprint, e.g., for detecting lane
+swaps, from the same pass over the reads.
+"""
+
+import os
+import typing
+
+import attr
+import numpy as np
+
+from .readers import STDIN_PATH
+
+#: Suffixes stripped from file names to name their partitions.
+_FILE_SUFFIXES = (".gz", ".bgz", ".fastq", ".fq", ".sam", ".bam", ".cram")
+
+
+@attr.s(auto_attribs=True)
+class Partition:
+    """The counts of the reads of one input file or read group."""
+
+    #: The counts matrix.
+    counts: np.ndarray
+    #: Number of reads counted.
+    num_reads: int = 0
+
+    def add(self, other: "Partition") -> None:
+        self.counts += other.counts
+        self.num_reads += other.num_reads
+
+
+def merge_partitions(
+    partitions: typing.Dict[str, Partition], other: typing.Dict[str, Partition]
+) -> None:
+    """Add the ``other`` partitions to ``partitions``, copying new ones."""
+    for name, partition in other.items():
+        if name in partitions:
+            partitions[name].add(partition)
+        else:
+            partitions[name] = Partition(partition.counts.copy(), partition.num_reads)
+
+
+def file_partition_names(paths: typing.List[str]) -> typing.Dict[str, str]:
+    """Return the partition name of each of the input ``paths``, its file name without the
+    FASTQ or SAM/BAM/CRAM and compression suffixes, made unique by appending a number.
+    """
+    result = {}
+    for path in paths:
+        if path in result:
+            continue
+        name = "stdin" if path == STDIN_PATH else os.path.basename(path)
+        while name.endswith(_FILE_SUFFIXES) and "." in name:
+            name = name.rsplit(".", 1)[0]
+        unique, i = name, 1
+        while unique in result.values():
+            i += 1
+            unique = "%s-%d" % (name, i)
+        result[path] = unique
+    return result
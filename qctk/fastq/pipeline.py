@@ -0,0 +1,494 @@
+"""Streaming decompress/parse/count pipeline for ``fastq-extract``.
+
+The stages run on their own threads and are connected by bounded queues so that memory use stays
+flat and I/O overlaps with counting:
+
+- ``decompress`` reads the input and produces decompressed chunks,
+- ``parse`` splits the chunks into FASTQ records and emits batches of sequences (uncompressed
+  input is parsed from a memory map and SAM/BAM/CRAM input is read with ``pysam``, both without
+  the ``decompress`` stage),
+- one or more ``count`` stages feed the batches to the engine, each into its own counts matrix.
+
+For paired-end input, the ``parse`` stage zips the R1 and R2 sequences in lockstep into
+fragments, which the ``count`` stages pass to ``count_fragments()`` of the engine.  Compressed
+R2 files are read by a second ``decompress-mate`` stage, uncompressed ones are parsed from a
+memory map on the ``parse`` thread like the R1 file.
+
+When partitioning by read group, the ``parse`` stage also parses the read group of each read
+from its name and the ``count`` stages count the reads of each read group of a batch separately,
+into ``partitions``.
+
+The time each stage spends waiting for input and for room in its output queue is recorded.  The
+stage that waits least is the bottleneck.
+
+With a saturation monitor, the ``count`` stages report their counts every ``checkpoint_reads``
+reads and the pipeline is stopped early once the monitor says so.  With checkpoints enabled, the
+counts and counted batches are written every ``checkpoint_seconds`` seconds and on completion,
+see ``checkpoint``.  For BGZF input, the ``parse`` stage then also passes the virtual offsets
+following each batch to the ``count`` stages, and a resumed pipeline starts decompressing at the
+offsets following the counted batches.  The metrics of the chunk are logged every
+``metrics_seconds`` seconds and on completion, see ``metrics``.
+"""
+
+import os
+import queue
+import threading
+import time
+import typing
+
+import attr
+from logzero import logger
+import numpy as np
+
+from .checkpoint import (
+    ChunkProgress,
+    checkpoint_digest,
+    checkpoint_path,
+    checkpointing_enabled,
+    read_checkpoint,
+    write_checkpoint,
+)
+from .config import FastqExtractConfig, PartitionKey
+from .decompress import DecompressStats
+from .encode import flatten_fragments
+from .metrics import ChunkMetrics
+from .minimizer import MinimizerPrefilter
+from .partitions import Partition, merge_partitions
+from .readers import (
+    InputChunk,
+    VirtualOffset,
+    is_alignment_file,
+    is_splittable,
+    iter_alignment_sequences,
+    iter_bgzf_part_chunks,
+    iter_fastq_sequences,
+    iter_input_chunks,
+    iter_mate_pairs,
+    iter_mmap_sequences,
+    read_group,
+    use_mmap,
+)
+from ..common import batched
+
+
+#: Marker put into a queue after the last item.
+_DONE = object()
+
+#: Interval in seconds at which blocked stages check whether the pipeline was aborted.
+_POLL_SECONDS = 0.1
+
+
+class PipelineAborted(Exception):
+    """Raised in a stage when another stage failed."""
+
+
+@attr.s(auto_attribs=True)
+class StageStats:
+    """Statistics of a pipeline stage."""
+
+    #: Name of the stage.
+    name: str
+    #: Number of items emitted (chunks, batches) or consumed (for the ``count`` stages).
+    items: int = 0
+    #: Time spent waiting for input, in seconds.
+    input_stall_seconds: float = 0.0
+    #: Time spent waiting for room in the output queue, in seconds.
+    output_stall_seconds: float = 0.0
+
+
+class _Pipe:
+    """Bounded queue between two stages that accounts for stall times."""
+
+    def __init__(self, maxsize: int, abort: threading.Event):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.abort = abort
+
+    def put(self, item: typing.Any, stats: StageStats) -> None:
+        start = time.perf_counter()
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                self.queue.put(item, timeout=_POLL_SECONDS)
+                break
+            except queue.Full:
+                pass
+        stats.output_stall_seconds += time.perf_counter() - start
+
+    def get(self, stats: StageStats) -> typing.Any:
+        start = time.perf_counter()
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                item = self.queue.get(timeout=_POLL_SECONDS)
+                break
+            except queue.Empty:
+                pass
+        stats.input_stall_seconds += time.perf_counter() - start
+        return item
+
+    def drain(self, stats: StageStats) -> typing.Iterator[typing.Any]:
+        """Yield items until ``_DONE`` is received."""
+        while True:
+            item = self.get(stats)
+            if item is _DONE:
+                return
+            yield item
+
+
+class Pipeline:
+    """Pipeline counting the marker k-mers of one input chunk."""
+
+    def __init__(self, config: FastqExtractConfig, engine, chunk: InputChunk, monitor=None):
+        #: The configuration.
+        self.config = config
+        #: The counting engine.
+        self.engine = engine
+        #: The input chunk to process.
+        self.chunk = chunk
+        #: Decompression statistics of the input file.
+        self.decompress_stats = DecompressStats()
+        #: Decompression statistics of the mate file of paired-end input.
+        self.mate_decompress_stats = DecompressStats()
+        #: Statistics of the stages, ``decompress-mate`` comes last for paired-end input.
+        self.stage_stats = [StageStats("decompress"), StageStats("parse")] + [
+            StageStats("count-%d" % i) for i in range(config.count_threads)
+        ]
+        if chunk.mate_path is not None:
+            self.stage_stats.append(StageStats("decompress-mate"))
+        #: Counts matrix per ``count`` stage.
+        self.counts = [engine.index.new_counts() for _ in range(config.count_threads)]
+        #: Whether the input is a SAM/BAM/CRAM file, skipping the ``decompress`` stage.
+        self._alignments = is_alignment_file(chunk.path)
+        #: Whether the input is parsed through a memory map, skipping the ``decompress`` stage.
+        self._mmap = all(use_mmap(config, path) for path in chunk.paths)
+        #: Virtual offsets following the last parsed record of each input file, only tracked for
+        #: BGZF input with checkpoints enabled.
+        self._positions: typing.Optional[typing.List[VirtualOffset]] = None
+        if checkpointing_enabled(config) and all(
+            is_splittable(config, path) for path in chunk.paths
+        ):
+            self._positions = [VirtualOffset() for _ in chunk.paths]
+        #: Optional ``SaturationMonitor`` or ``RemoteMonitor`` to report checkpoints to.
+        self.monitor = monitor
+        #: Number of reads counted.
+        self.num_reads = 0
+        #: Whether the monitor stopped the pipeline before the end of the input.
+        self.stopped = False
+        #: Whether to partition the counts by read group.
+        self._read_groups = config.partition_by == PartitionKey.READ_GROUP.value
+        #: Counts per read group, only with ``config.partition_by`` set to read groups.
+        self.partitions: typing.Dict[str, Partition] = {}
+        self._lock = threading.Lock()
+        self._pending_reads = 0
+        self._reported = engine.index.new_counts()
+        self._abort = threading.Event()
+        self._chunks = _Pipe(config.queue_depth, self._abort)
+        self._mate_chunks = _Pipe(config.queue_depth, self._abort)
+        self._batches = _Pipe(config.queue_depth, self._abort)
+        self._errors = []
+        #: Throughput and hit-rate metrics of the chunk, updated by ``update_metrics()``.
+        self.metrics = ChunkMetrics(
+            path=chunk.path, part=chunk.part, num_parts=chunk.num_parts, mate_path=chunk.mate_path
+        )
+        self._start_time = time.monotonic()
+        self._metrics_time = self._start_time
+        self._resumed_reads = 0
+        self._resumed_hits = 0
+        #: Counted batches, only tracked with checkpoints enabled.
+        self.progress: typing.Optional[ChunkProgress] = None
+        if checkpointing_enabled(config):
+            self._init_checkpoint()
+
+    def _init_checkpoint(self) -> None:
+        self._checkpoint_path = checkpoint_path(self.config, self.chunk)
+        self._checkpoint_digest = checkpoint_digest(self.config, self.engine.index, self.chunk)
+        self._checkpoint_time = time.monotonic()
+        self.progress = ChunkProgress()
+        checkpoint = None
+        if self.config.resume:
+            checkpoint = read_checkpoint(self._checkpoint_path, self._checkpoint_digest)
+        if checkpoint:
+            counts, self.progress, self.partitions = checkpoint
+            self.counts[0] += counts
+            self.num_reads = self._pending_reads = self.progress.num_reads
+            self._resumed_reads, self._resumed_hits = self.num_reads, int(counts.sum())
+            logger.info(
+                "Resuming %s (part %d/%d) after %s reads",
+                self.chunk.path,
+                self.chunk.part + 1,
+                self.chunk.num_parts,
+                "{:,}".format(self.num_reads),
+            )
+
+    def _write_checkpoint(self) -> None:
+        """Write the checkpoint, ``self._lock`` must be held."""
+        if self.config.checkpoint_seconds is not None:
+            write_checkpoint(
+                self._checkpoint_path,
+                self._checkpoint_digest,
+                sum(self.counts),
+                self.progress,
+                self.partitions,
+            )
+            self._checkpoint_time = time.monotonic()
+
+    def _decompress(
+        self, stats: StageStats, path: str, chunks: _Pipe, decompress_stats: DecompressStats
+    ) -> None:
+        if self._mmap or self._alignments:  # the parse stage reads the input directly
+            raw_chunks = []
+        elif self._positions is not None:
+            start = None
+            if self.progress.offsets is not None:
+                start = self.progress.offsets[self.chunk.paths.index(path)]
+            raw_chunks = iter_bgzf_part_chunks(
+                path,
+                self.chunk.part,
+                self.chunk.num_parts,
+                self.config.decompress_threads,
+                decompress_stats,
+                start,
+                offsets=True,
+            )
+        elif self.chunk.num_parts > 1:
+            raw_chunks = iter_bgzf_part_chunks(
+                path,
+                self.chunk.part,
+                self.chunk.num_parts,
+                self.config.decompress_threads,
+                decompress_stats,
+            )
+        else:
+            raw_chunks = iter_input_chunks(self.config, path, decompress_stats)
+        for raw_chunk in raw_chunks:
+            chunks.put(raw_chunk, stats)
+            stats.items += 1
+        chunks.put(_DONE, stats)
+
+    def _iter_sequences(
+        self, stats: StageStats, path: str, chunks: _Pipe, headers: bool = False
+    ) -> typing.Iterator[typing.Any]:
+        if self._alignments:
+            chunks.get(stats)  # _DONE
+            return iter_alignment_sequences(
+                path,
+                self.config.decompress_threads,
+                self.config.common.reference,
+                self.config.sample_fraction,
+                headers,
+            )
+        elif self._mmap:
+            chunks.get(stats)  # _DONE
+            return iter_mmap_sequences(path, self.config.sample_fraction, headers)
+        else:
+            position = None
+            if self._positions is not None:
+                position = self._positions[self.chunk.paths.index(path)]
+            return iter_fastq_sequences(
+                chunks.drain(stats), self.config.sample_fraction, headers, path, position
+            )
+
+    def _parse(self, stats: StageStats) -> None:
+        if self.chunk.mate_path is None:
+            sequences = self._iter_sequences(
+                stats, self.chunk.path, self._chunks, self._read_groups
+            )
+        else:
+            # The read names of the mates are compared, the read group is that of the first mate.
+            sequences = iter_mate_pairs(
+                self._iter_sequences(stats, self.chunk.path, self._chunks, True),
+                self._iter_sequences(stats, self.chunk.mate_path, self._mate_chunks, True),
+                self.chunk,
+            )
+            if not self._read_groups:
+                sequences = (fragment for _, fragment in sequences)
+        # Decompression starts after the leading counted batches if their offsets are known.
+        first_batch_no = 0
+        if self._positions is not None and self.progress.offsets is not None:
+            first_batch_no = self.progress.done_prefix
+        for batch_no, batch in enumerate(
+            batched(sequences, self.config.batch_size), first_batch_no
+        ):
+            if self.progress is not None and self.progress.is_done(batch_no):
+                continue
+            offsets = None
+            if self._positions is not None:
+                offsets = tuple(attr.evolve(position) for position in self._positions)
+            groups = None
+            if self._read_groups:
+                groups = [read_group(header) for header, _ in batch]
+                batch = [item for _, item in batch]
+            self._batches.put((batch_no, batch, groups, offsets), stats)
+            stats.items += 1
+        for _ in range(self.config.count_threads):
+            self._batches.put(_DONE, stats)
+
+    def _count(self, stats: StageStats, counts: np.ndarray) -> None:
+        if self.progress is None and not self._read_groups:
+            for _, batch, _, _ in self._batches.drain(stats):
+                self._count_batch(batch, counts)
+                stats.items += 1
+                self._add_reads(batch)
+            return
+        # Count each batch separately such that checkpoints never see partially counted batches.
+        batch_counts = self.engine.index.new_counts()
+        for batch_no, batch, groups, offsets in self._batches.drain(stats):
+            batch_counts.fill(0)
+            if groups is None:
+                self._count_batch(batch, batch_counts)
+                partitions = {}
+            else:
+                partitions = self._count_read_groups(batch, groups, batch_counts)
+            stats.items += 1
+            with self._lock:
+                counts += batch_counts
+                merge_partitions(self.partitions, partitions)
+                if self.progress is not None:
+                    self.progress.add(batch_no, len(batch) * len(self.chunk.paths), offsets)
+                    if (
+                        self.config.checkpoint_seconds is not None
+                        and time.monotonic() - self._checkpoint_time
+                        >= self.config.checkpoint_seconds
+                    ):
+                        self._write_checkpoint()
+            self._add_reads(batch)
+
+    def _count_batch(self, batch: typing.List, counts: np.ndarray) -> None:
+        if self.chunk.mate_path is None:
+            self.engine.count(batch, counts)
+        else:
+            self.engine.count_fragments(batch, counts)
+
+    def _count_read_groups(
+        self, batch: typing.List, groups: typing.List[str], counts: np.ndarray
+    ) -> typing.Dict[str, Partition]:
+        """Count the reads of each read group in ``batch`` separately, add all to ``counts``, and
+        return the partitions of the read groups.
+        """
+        group_batches = {}
+        for group, item in zip(groups, batch):
+            group_batches.setdefault(group, []).append(item)
+        result = {}
+        for group, group_batch in group_batches.items():
+            partition = Partition(
+                self.engine.index.new_counts(), len(group_batch) * len(self.chunk.paths)
+            )
+            self._count_batch(group_batch, partition.counts)
+            counts += partition.counts
+            result[group] = partition
+        return result
+
+    def _add_reads(self, batch: typing.List) -> None:
+        if self.chunk.mate_path is not None:
+            batch = flatten_fragments(batch)[0]
+        lengths = np.fromiter(map(len, batch), dtype=np.int64, count=len(batch))
+        num_windows = int(np.maximum(lengths - (self.engine.index.kmer_length - 1), 0).sum())
+        with self._lock:
+            self.num_reads += len(batch)
+            self.metrics.num_bases += int(lengths.sum())
+            self.metrics.num_windows += num_windows
+            if time.monotonic() - self._metrics_time >= self.config.metrics_seconds:
+                self.update_metrics()
+                self.metrics.log(self.metrics.label)
+            self._pending_reads += len(batch)
+            if self.monitor is None or self._pending_reads < self.config.checkpoint_reads:
+                return
+            counts = sum(self.counts)
+            delta, self._reported = counts - self._reported, counts
+            pending, self._pending_reads = self._pending_reads, 0
+            if self.monitor.checkpoint(delta, pending):
+                self.stopped = True
+                self._abort.set()
+
+    def update_metrics(self) -> None:
+        """Update the metrics that are derived from the pipeline state."""
+        self._metrics_time = time.monotonic()
+        self.metrics.wall_seconds = self._metrics_time - self._start_time
+        self.metrics.num_reads = self.num_reads - self._resumed_reads
+        self.metrics.num_hits = int(sum(self.counts).sum()) - self._resumed_hits
+        if self._mmap or self._alignments:
+            self.metrics.bytes_in = sum(map(os.path.getsize, self.chunk.paths))
+        else:
+            decompress_stats = [self.decompress_stats, self.mate_decompress_stats]
+            self.metrics.bytes_in = sum(stats.bytes_in for stats in decompress_stats)
+            self.metrics.decompress_seconds = sum(
+                stats.inflate_seconds for stats in decompress_stats
+            )
+
+    def _run_stage(self, func: typing.Callable, *args) -> None:
+        try:
+            func(*args)
+        except PipelineAborted:
+            pass
+        except Exception as e:
+            self._errors.append(e)
+            self._abort.set()
+
+    def run(self) -> np.ndarray:
+        """Run the pipeline and return the marker k-mer counts of the chunk."""
+        if self.progress is not None and self.progress.complete:
+            return sum(self.counts)
+        targets = [
+            (
+                self._decompress,
+                self.stage_stats[0],
+                self.chunk.path,
+                self._chunks,
+                self.decompress_stats,
+            ),
+            (self._parse, self.stage_stats[1]),
+        ]
+        targets += [
+            (self._count, stats, counts) for stats, counts in zip(self.stage_stats[2:], self.counts)
+        ]
+        if self.chunk.mate_path is not None:
+            targets.append(
+                (
+                    self._decompress,
+                    self.stage_stats[-1],
+                    self.chunk.mate_path,
+                    self._mate_chunks,
+                    self.mate_decompress_stats,
+                )
+            )
+        threads = [
+            threading.Thread(target=self._run_stage, args=target, daemon=True) for target in targets
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.progress is not None:
+            with self._lock:
+                self.progress.complete = not self.stopped and not self._errors
+                self._write_checkpoint()
+        if self._errors:
+            raise self._errors[0]
+        if self.stopped:
+            logger.info(
+                "Stopped reading %s after %s reads", self.chunk.path, "{:,}".format(self.num_reads)
+            )
+        if not self._mmap and not self._alignments:
+            self.decompress_stats.log(self.chunk.path)
+            if self.chunk.mate_path is not None:
+                self.mate_decompress_stats.log(self.chunk.mate_path)
+        self.log_stalls()
+        if isinstance(self.engine, MinimizerPrefilter):
+            self.engine.take_stats().log(self.chunk.path)
+        self.update_metrics()
+        self.metrics.log(self.metrics.label)
+        return sum(self.counts)
+
+    def log_stalls(self) -> None:
+        """Log the stall times of the stages."""
+        logger.info(
+            "Pipeline stalls for %s (input/output wait): %s",
+            self.chunk.path,
+            ", ".join(
+                "%s: %.2f s / %.2f s (%d items)"
+                % (stats.name, stats.input_stall_seconds, stats.output_stall_seconds, stats.items)
+                for stats in self.stage_stats
+            ),
+        )
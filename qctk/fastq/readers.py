@@ -0,0 +1,757 @@
+"""Readers that feed read sequences from input files to the ``fastq-extract`` engines."""
+
+import collections
+import concurrent.futures
+import itertools
+import mmap
+import os
+import stat
+import sys
+import time
+import typing
+import zlib
+
+import attr
+from logzero import logger
+import numpy as np
+import pysam
+
+from .config import FastqExtractConfig, ReaderStrategy
+from .encode import splitmix64
+from .decompress import (
+    BGZF_PROBE_SIZE,
+    CHUNKS_PER_THREAD,
+    DecompressStats,
+    find_bgzf_block,
+    is_bgzf,
+    is_bgzf_header,
+    inflate_block,
+    inflate_gzip_chunks,
+    iter_bgzf_blocks,
+    iter_bgzf_chunks,
+    iter_bgzf_offset_chunks,
+    open_source,
+)
+from ..common import batched
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class InputChunk:
+    """A part of an input file to be processed by one worker.
+
+    Only BGZF files are split into parts, by byte ranges at BGZF block boundaries, see
+    ``iter_bgzf_part_chunks()``.
+    """
+
+    #: Path to the input file.
+    path: str
+    #: Index of the part, in ``range(num_parts)``.
+    part: int = 0
+    #: Number of parts that the file is split into.
+    num_parts: int = 1
+    #: Path to the file with the second mates of the reads in ``path`` for paired-end input.
+    mate_path: typing.Optional[str] = None
+
+    @property
+    def paths(self) -> typing.List[str]:
+        """The input file and the mate file, if any."""
+        return [self.path] if self.mate_path is None else [self.path, self.mate_path]
+
+
+@attr.s(auto_attribs=True)
+class VirtualOffset:
+    """Position in a BGZF file, as the offset of a BGZF block and an offset into the data
+    decompressed from that block on.
+
+    Unlike the virtual offsets of ``htslib``, ``data`` may reach past the end of the block.
+    """
+
+    #: Offset of the BGZF block in the compressed file.
+    block: int = 0
+    #: Offset into the data decompressed from the block on.
+    data: int = 0
+
+
+#: Input path that denotes the standard input.
+STDIN_PATH = "-"
+
+
+def is_stream(path: str) -> bool:
+    """Return whether ``path`` is the standard input or a named pipe that can only be read once."""
+    if path == STDIN_PATH:
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def pair_inputs(paths: typing.List[str]) -> typing.List[typing.Tuple[str, str]]:
+    """Return the pairs of R1 and R2 files from the consecutive ``paths`` of paired-end input."""
+    if len(paths) % 2:
+        raise ValueError("Paired-end input needs an even number of files, got %d" % len(paths))
+    for path in paths:
+        if path == STDIN_PATH:
+            raise ValueError("Cannot read paired-end input from stdin")
+        elif is_alignment_file(path):
+            raise ValueError("Paired-end input must be FASTQ, not %s" % path)
+    return list(zip(paths[::2], paths[1::2]))
+
+
+def is_splittable(config: FastqExtractConfig, path: str) -> bool:
+    """Return whether the input file at ``path`` can be split into parts for several workers.
+
+    Only BGZF files can be split without each part decompressing all of the file.  Plain gzip
+    files, uncompressed files, and SAM/BAM/CRAM files are always read whole, and so are streams
+    and files read with the ``chunks`` strategy.
+    """
+    return (
+        config.reader != ReaderStrategy.CHUNKS.value
+        and not is_stream(path)
+        and is_gzip(path)
+        and is_bgzf(path)
+        and not is_alignment_file(path)
+        and not use_mmap(config, path)
+    )
+
+
+def split_inputs(config: FastqExtractConfig) -> typing.List[InputChunk]:
+    """Split the input files of ``config`` into chunks for ``config.num_procs`` workers.
+
+    BGZF files (see ``is_splittable()``) are split into byte ranges if there are fewer files
+    than workers, all other files are one chunk each.  With ``config.paired``, each pair of
+    consecutive files is one input whose chunk reads both; pairs are never split as the mates
+    must be read in lockstep.
+    """
+    if config.paired:
+        inputs = pair_inputs(config.input_files)
+    else:
+        inputs = [(path, None) for path in config.input_files]
+    num_parts = max(1, -(-config.num_procs // len(inputs)))
+    result = []
+    for path, mate_path in inputs:
+        path_parts = num_parts if mate_path is None and is_splittable(config, path) else 1
+        result += [
+            InputChunk(path=path, part=part, num_parts=path_parts, mate_path=mate_path)
+            for part in range(path_parts)
+        ]
+    return result
+
+
+#: Magic bytes at the start of gzip files.
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def is_gzip(path: str) -> bool:
+    """Return whether the file at ``path`` is gzip compressed."""
+    with open(path, "rb") as inputf:
+        return inputf.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+
+
+def _read_name(header: bytes) -> bytes:
+    """Return the read name from a FASTQ ``header`` line, without any ``/1`` or ``/2`` suffix."""
+    name = header.split(maxsplit=1)[0] if header.strip() else b""
+    return name[:-2] if name[-2:] in (b"/1", b"/2") else name
+
+
+#: Read group of reads whose names do not follow the Illumina conventions.
+UNKNOWN_READ_GROUP = "unknown"
+
+
+def read_group(header: bytes) -> str:
+    """Return the read group of a read from its FASTQ ``header`` line.
+
+    The read group is the flow cell and lane from Illumina read names, i.e.,
+    ``@<instrument>:<run>:<flowcell>:<lane>:<tile>:<x>:<y>`` gives ``<flowcell>-<lane>`` and the
+    older ``@<instrument>:<lane>:<tile>:<x>:<y>`` gives ``<instrument>-<lane>``.
+    """
+    fields = _read_name(header).lstrip(b"@").split(b":")
+    if len(fields) >= 7:
+        return (fields[2] + b"-" + fields[3]).decode("ascii", "replace")
+    elif len(fields) == 5:
+        return (fields[0] + b"-" + fields[1]).decode("ascii", "replace")
+    return UNKNOWN_READ_GROUP
+
+
+def sample_mask(headers: typing.List[bytes], sample_fraction: float) -> np.ndarray:
+    """Return the mask of the records with the FASTQ ``headers`` to keep when subsampling.
+
+    A record is kept if the hash of its read name falls below ``sample_fraction``, such that
+    mates of a pair are kept or dropped together.
+    """
+    if sample_fraction >= 1.0:
+        return np.ones(len(headers), dtype=bool)
+    crcs = np.fromiter(
+        (zlib.crc32(_read_name(header)) for header in headers), dtype=np.uint64, count=len(headers)
+    )
+    return splitmix64(crcs) < np.uint64(int(sample_fraction * 2 ** 64))
+
+
+def _not_fastq_error(path: typing.Optional[str]) -> ValueError:
+    return ValueError(
+        "%s is not a FASTQ file with 4-line records (FASTA and multi-line FASTQ are not "
+        "supported)" % (path or "Input")
+    )
+
+
+def _check_fastq_lines(
+    header_lines: typing.List[bytes], plus_lines: typing.List[bytes], path: typing.Optional[str]
+) -> None:
+    """Raise ``ValueError`` unless all ``header_lines`` start with ``@`` and all ``plus_lines``
+    with ``+``, i.e., the records are 4-line FASTQ records.
+    """
+    if any(line[:1] != b"@" for line in header_lines) or any(
+        line[:1] != b"+" for line in plus_lines
+    ):
+        raise _not_fastq_error(path)
+
+
+def iter_fastq_sequences(
+    chunks: typing.Iterable[typing.Any],
+    sample_fraction: typing.Optional[float] = None,
+    headers: bool = False,
+    path: typing.Optional[str] = None,
+    position: typing.Optional[VirtualOffset] = None,
+) -> typing.Iterator[typing.Any]:
+    """Yield the sequence lines from consecutive ``chunks`` of a FASTQ file.
+
+    Records must consist of exactly four lines, as written by all current sequencers, else
+    ``ValueError`` is raised naming ``path``.  If ``sample_fraction`` is given, only the records
+    selected by ``sample_mask()`` are yielded.  With ``headers``, pairs of header and sequence
+    line are yielded.
+
+    With ``position``, ``chunks`` are pairs of the virtual offset of a chunk of a BGZF file and
+    its data, as yielded by ``iter_bgzf_part_chunks()`` with ``offsets``, and ``position`` is
+    set to the virtual offset following each record before the record is yielded.
+    """
+    rest = b""
+    end = None  # virtual offset of the end of the last chunk
+    for chunk in chunks:
+        if position is not None:
+            offset, chunk = chunk
+            end = VirtualOffset(offset.block, offset.data + len(chunk))
+        lines = (rest + chunk).split(b"\n")
+        complete = (len(lines) - 1) // 4 * 4
+        _check_fastq_lines(lines[0:complete:4], lines[2:complete:4], path)
+        if position is not None:
+            # Record ends relative to the chunk, the first record may start in ``rest``.
+            lengths = np.fromiter(map(len, lines[:complete]), dtype=np.int64, count=complete)
+            ends = (np.cumsum(lengths + 1)[3::4] - len(rest) + offset.data).tolist()
+        rest = b"\n".join(lines[complete:])
+        sequences = lines[1:complete:4]
+        if headers:
+            sequences = zip(lines[0:complete:4], sequences)
+        if sample_fraction is not None:
+            mask = sample_mask(lines[0:complete:4], sample_fraction)
+            sequences = itertools.compress(sequences, mask)
+            if position is not None:
+                ends = itertools.compress(ends, mask)
+        if position is None:
+            yield from sequences
+        else:
+            for data, sequence in zip(ends, sequences):
+                position.block, position.data = offset.block, data
+                yield sequence
+    lines = rest.split(b"\n")
+    if len(lines) > 1 and rest.strip():  # ignore trailing blank lines
+        _check_fastq_lines(lines[:1], lines[2:3] if len(lines) > 2 else [b"+"], path)
+        if sample_fraction is None or sample_mask(lines[:1], sample_fraction)[0]:
+            if position is not None:
+                position.block, position.data = end.block, end.data
+            yield (lines[0], lines[1]) if headers else lines[1]
+
+
+#: Size of the windows of the memory map that line breaks are searched in at once.
+_MMAP_WINDOW_SIZE = 16 * 1024 * 1024
+
+
+def _iter_mmap_windows(
+    path: str,
+) -> typing.Iterator[typing.Tuple[memoryview, np.ndarray, np.ndarray, np.ndarray]]:
+    """Map the uncompressed FASTQ file at ``path`` and yield the view of the map and the header
+    starts, sequence starts, and sequence ends of the complete records in consecutive windows.
+    """
+    with open(path, "rb") as inputf:
+        if os.fstat(inputf.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(inputf.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    data = np.frombuffer(mm, dtype=np.uint8)
+    size = len(mm)
+    pos = 0  # start of the next record
+    window = _MMAP_WINDOW_SIZE
+    while pos < size:
+        end = min(size, pos + window)
+        arr = np.frombuffer(mm, dtype=np.uint8, count=end - pos, offset=pos)
+        breaks = np.flatnonzero(arr == ord("\n")) + pos
+        complete = len(breaks) // 4 * 4
+        if not complete:
+            if end == size:
+                break
+            window *= 2  # records longer than the window
+            continue
+        header_starts = np.concatenate(([pos], breaks[3 : complete - 1 : 4] + 1))
+        seq_starts = breaks[0:complete:4] + 1
+        seq_ends = breaks[1:complete:4]
+        if (data[header_starts] != ord("@")).any() or (
+            data[breaks[1:complete:4] + 1] != ord("+")
+        ).any():
+            raise _not_fastq_error(path)
+        if (breaks[3:complete:4] - breaks[2:complete:4] - 1 != seq_ends - seq_starts).any():
+            raise ValueError("Sequence and quality lengths differ in %s" % path)
+        yield view, header_starts, seq_starts, seq_ends
+        pos = int(breaks[complete - 1]) + 1
+    # Incomplete last record, e.g., without final line break.
+    tail = mm[pos:]
+    lines = tail.split(b"\n")
+    if len(lines) > 1 and tail.strip():  # ignore trailing blank lines
+        _check_fastq_lines(lines[:1], lines[2:3] if len(lines) > 2 else [b"+"], path)
+        seq_start = len(lines[0]) + 1
+        bounds = (0, seq_start, seq_start + len(lines[1]))
+        yield (memoryview(tail), *(np.array([bound]) for bound in bounds))
+
+
+def iter_mmap_sequences(
+    path: str, sample_fraction: typing.Optional[float] = None, headers: bool = False
+) -> typing.Iterator[typing.Any]:
+    """Yield the sequence lines of the uncompressed FASTQ file at ``path`` as ``memoryview``
+    slices of a memory map.
+
+    Line breaks are located with vectorized scans over windows of the memory map and no
+    objects are created for the header, ``+``, and quality lines unless needed.  See
+    ``iter_fastq_sequences()`` for ``sample_fraction`` and ``headers``.
+    """
+    for view, header_starts, seq_starts, seq_ends in _iter_mmap_windows(path):
+        if sample_fraction is not None or headers:
+            header_lines = [
+                view[begin : end - 1].tobytes()
+                for begin, end in zip(header_starts.tolist(), seq_starts.tolist())
+            ]
+        if sample_fraction is not None:
+            mask = sample_mask(header_lines, sample_fraction)
+            seq_starts, seq_ends = seq_starts[mask], seq_ends[mask]
+            if headers:
+                header_lines = list(itertools.compress(header_lines, mask))
+        sequences = (view[start:end] for start, end in zip(seq_starts.tolist(), seq_ends.tolist()))
+        if headers:
+            yield from zip(header_lines, sequences)
+        else:
+            yield from sequences
+
+
+#: Size of the chunks read from uncompressed files.
+_PLAIN_CHUNK_SIZE = 1024 * 1024
+
+
+def _read_plain_chunks(
+    source: typing.Union[str, typing.BinaryIO], stats: DecompressStats
+) -> typing.Iterator[bytes]:
+    with open_source(source) as inputf:
+        for chunk in iter(lambda: inputf.read(_PLAIN_CHUNK_SIZE), b""):
+            stats.bytes_in += len(chunk)
+            stats.bytes_out += len(chunk)
+            yield chunk
+
+
+class _PeekedStream:
+    """Binary stream that returns the already read ``head`` before the rest of ``stream``."""
+
+    def __init__(self, head: bytes, stream: typing.BinaryIO):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size: int) -> bytes:
+        if not self.head:
+            return self.stream.read(size)
+        data, self.head = self.head[:size], self.head[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+
+def iter_stream_chunks(
+    path: str, num_threads: int = 1, stats: typing.Optional[DecompressStats] = None
+) -> typing.Iterator[bytes]:
+    """Yield consecutive decompressed chunks of the standard input or named pipe at ``path``.
+
+    The stream is read exactly once: the compression format is detected from the first bytes
+    which are then replayed to the decompressor.  Only a bounded number of chunks is buffered.
+    """
+    stats = stats or DecompressStats()
+    if path == STDIN_PATH:
+        inputf = sys.stdin.buffer
+    else:
+        inputf = open(path, "rb")
+    try:
+        head = inputf.read(BGZF_PROBE_SIZE)
+        stream = _PeekedStream(head, inputf)
+        if is_bgzf_header(head):
+            yield from iter_bgzf_chunks(stream, num_threads, stats)
+        elif head.startswith(_GZIP_MAGIC):
+            yield from inflate_gzip_chunks(stream, stats)
+        else:
+            yield from _read_plain_chunks(stream, stats)
+    finally:
+        if path != STDIN_PATH:
+            inputf.close()
+
+
+def iter_raw_chunks(
+    path: str, num_threads: int = 1, stats: typing.Optional[DecompressStats] = None
+) -> typing.Iterator[bytes]:
+    """Yield consecutive decompressed chunks of the file at ``path``.
+
+    BGZF input is inflated by ``num_threads`` threads, gzip and uncompressed input are read on
+    the calling thread.  Streams are read with ``iter_stream_chunks()``.
+    """
+    stats = stats or DecompressStats()
+    if is_stream(path):
+        return iter_stream_chunks(path, num_threads, stats)
+    elif not is_gzip(path):
+        return _read_plain_chunks(path, stats)
+    elif is_bgzf(path):
+        return iter_bgzf_chunks(path, num_threads, stats)
+    else:
+        return inflate_gzip_chunks(path, stats)
+
+
+def _record_start(data: bytes) -> typing.Optional[int]:
+    """Return the offset of the first FASTQ record in ``data`` after the first line break.
+
+    A record starts at a line starting with ``@`` that is followed by a line starting with ``+``
+    two lines further.  Quality lines may start with ``@`` but are never followed by a ``+`` line
+    two lines further.
+    """
+    lines = data.split(b"\n")
+    pos = len(lines[0]) + 1
+    for i in range(1, len(lines) - 3):
+        if lines[i].startswith(b"@") and lines[i + 2].startswith(b"+"):
+            return pos
+        pos += len(lines[i]) + 1
+    return None
+
+
+def bgzf_part_offsets(path: str, num_parts: int) -> typing.List[int]:
+    """Return the offsets of the first BGZF blocks of ``num_parts`` evenly sized byte ranges of
+    the BGZF file at ``path``, followed by the file size.
+
+    Parts without a block of their own start at the offset of the following part.
+    """
+    size = os.path.getsize(path)
+    result = [0]
+    with open(path, "rb") as inputf:
+        for i in range(1, num_parts):
+            offset = find_bgzf_block(inputf, i * size // num_parts)
+            result.append(max(result[-1], size if offset is None else offset))
+    return result + [size]
+
+
+def _bgzf_record_start(path: str, offset: int) -> typing.Optional[int]:
+    """Return the ``_record_start()`` of the data decompressed from the BGZF block at ``offset``
+    of the file at ``path``, ``None`` if no record starts after it.
+    """
+    buf = b""
+    with open(path, "rb") as inputf:
+        inputf.seek(offset)
+        for block_offset, data, trailer in iter_bgzf_blocks(inputf):
+            buf += inflate_block(data, trailer, block_offset)[0]
+            start = _record_start(buf)
+            if start is not None:
+                return start
+    return None
+
+
+def iter_bgzf_part_chunks(
+    path: str,
+    part: int,
+    num_parts: int,
+    num_threads: int = 1,
+    stats: typing.Optional[DecompressStats] = None,
+    start: typing.Optional[VirtualOffset] = None,
+    offsets: bool = False,
+) -> typing.Iterator[typing.Any]:
+    """Yield the decompressed chunks of part ``part`` of ``num_parts`` of the BGZF file at
+    ``path``.
+
+    The file is split into byte ranges at BGZF block boundaries (see ``bgzf_part_offsets()``).
+    Each part but the first starts at the first record after the start of its first block (see
+    ``_record_start()``) and each part but the last ends where the following part starts, so
+    every record is read by exactly one part.  A part only inflates its own blocks and the few
+    blocks that its last record extends into.
+
+    With ``start``, the part is read from this virtual offset of a record on, e.g., to resume
+    after the records before it were counted.  With ``offsets``, pairs of the virtual offset of
+    each chunk and the chunk are yielded.
+    """
+    stats = stats or DecompressStats()
+    part_offsets = bgzf_part_offsets(path, num_parts)
+    begin, end = part_offsets[part], part_offsets[part + 1]
+    if begin == end:
+        return
+    if start is None:
+        skip = 0 if part == 0 else _bgzf_record_start(path, begin)
+        if skip is None:
+            return
+        start = VirtualOffset(begin, skip)
+    # Offset of the first record of the next part in the data from the block at ``end``.
+    end_start = _bgzf_record_start(path, end) if end < part_offsets[-1] else None
+    # The end of the part is located from the block at ``end``, which may precede ``start``.
+    first = start.block if end_start is None else min(start.block, end)
+    pos = 0  # offset of the current block in the data from the block at ``first``
+    skip = None  # offset of ``start`` in the data from the block at ``first``
+    stop = None  # offset of the end of the part in the data from the block at ``first``
+    for offset, block in iter_bgzf_offset_chunks(path, num_threads, stats, first):
+        if offset == start.block:
+            skip = pos + start.data
+        if offset >= end and end_start is not None and stop is None:
+            stop = pos + end_start
+        if skip is not None:
+            lo = max(skip - pos, 0)
+            hi = len(block) if stop is None else min(len(block), stop - pos)
+            if lo < hi:
+                yield (VirtualOffset(offset, lo), block[lo:hi]) if offsets else block[lo:hi]
+        pos += len(block)
+        if stop is not None and pos >= stop:
+            break
+
+
+def _read_sampled_chunk(
+    path: str, begin: int, end: int, num_records: int
+) -> typing.Tuple[bytes, int, float]:
+    """Read ``num_records`` complete records from the BGZF blocks starting in ``[begin, end)``.
+
+    Return the records, the number of compressed bytes read, and the time spent inflating.
+    """
+    buf = b""
+    num_lines = 0
+    bytes_in = 0
+    inflate_seconds = 0.0
+    synced = begin == 0
+    with open(path, "rb") as inputf:
+        inputf.seek(begin)
+        for offset, data, trailer in iter_bgzf_blocks(inputf):
+            if offset >= end:
+                break
+            bytes_in += len(data)
+            block, seconds = inflate_block(data, trailer, offset)
+            inflate_seconds += seconds
+            buf += block
+            if not synced:
+                start = _record_start(buf)
+                if start is None:
+                    continue
+                buf, synced = buf[start:], True
+                num_lines = buf.count(b"\n")
+            else:
+                num_lines += block.count(b"\n")
+            if num_lines >= 4 * num_records:
+                break
+    if not synced:
+        return b"", bytes_in, inflate_seconds
+    if buf and not buf.endswith(b"\n") and end == os.path.getsize(path):
+        buf += b"\n"
+    lines = buf.split(b"\n", 4 * num_records)
+    complete = min(4 * num_records, (len(lines) - 1) // 4 * 4)
+    records = b"\n".join(lines[:complete]) + b"\n" if complete else b""
+    return records, bytes_in, inflate_seconds
+
+
+def iter_sampled_chunks(
+    path: str,
+    num_chunks: int,
+    num_records: int,
+    num_threads: int = 1,
+    stats: typing.Optional[DecompressStats] = None,
+) -> typing.Iterator[bytes]:
+    """Yield ``num_records`` FASTQ records from each of ``num_chunks`` evenly spaced positions of
+    the BGZF file at ``path``.
+
+    Each chunk starts at the first BGZF block at or after its position, resynchronizes on the
+    next record boundary, and ends at the block of the following chunk at the latest, so no
+    record is read twice.  Up to ``num_threads`` chunks are read concurrently.
+    """
+    stats = stats or DecompressStats()
+    start = time.perf_counter()
+    size = os.path.getsize(path)
+    begins = []
+    with open(path, "rb") as inputf:
+        for i in range(num_chunks):
+            begin = find_bgzf_block(inputf, i * size // num_chunks)
+            if begin is not None and (not begins or begin > begins[-1]):
+                begins.append(begin)
+    ends = begins[1:] + [size]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+        pending = collections.deque()
+        for begin, end in zip(begins, ends):
+            pending.append(executor.submit(_read_sampled_chunk, path, begin, end, num_records))
+            if len(pending) >= num_threads * CHUNKS_PER_THREAD:
+                yield _finish_sampled_chunk(pending.popleft(), stats)
+        while pending:
+            yield _finish_sampled_chunk(pending.popleft(), stats)
+    stats.wall_seconds = time.perf_counter() - start
+    logger.info(
+        "Sampled %d chunks of %s, read %.1f%% of the compressed input",
+        len(begins),
+        path,
+        100.0 * stats.bytes_in / size if size else 0.0,
+    )
+
+
+def _finish_sampled_chunk(future: concurrent.futures.Future, stats: DecompressStats) -> bytes:
+    records, bytes_in, inflate_seconds = future.result()
+    stats.bytes_in += bytes_in
+    stats.bytes_out += len(records)
+    stats.inflate_seconds += inflate_seconds
+    return records
+
+
+def iter_input_chunks(
+    config: FastqExtractConfig, path: str, stats: typing.Optional[DecompressStats] = None
+) -> typing.Iterator[bytes]:
+    """Yield the decompressed chunks of the input file at ``path`` with the reader strategy of
+    ``config``.
+    """
+    if config.reader == ReaderStrategy.CHUNKS.value:
+        if not is_stream(path) and is_gzip(path) and is_bgzf(path):
+            return iter_sampled_chunks(
+                path, config.sample_chunks, config.chunk_records, config.decompress_threads, stats
+            )
+        logger.warning(
+            "Cannot sample chunks from %s as it is not a BGZF file, reading all of it", path
+        )
+    return iter_raw_chunks(path, config.decompress_threads, stats)
+
+
+def use_mmap(config: FastqExtractConfig, path: str) -> bool:
+    """Return whether to read the input file at ``path`` with ``iter_mmap_sequences()``.
+
+    The ``auto`` strategy selects the memory-mapped parser for uncompressed regular files.
+    Streams and compressed files cannot be mapped and are always parsed sequentially.
+    """
+    if is_alignment_file(path):
+        return False
+    elif is_stream(path):
+        if config.reader == ReaderStrategy.MMAP.value:
+            logger.warning("Cannot memory-map %s as it is a stream, reading sequentially", path)
+        return False
+    elif config.reader == ReaderStrategy.MMAP.value:
+        if is_gzip(path):
+            logger.warning("Cannot memory-map %s as it is compressed, reading sequentially", path)
+            return False
+        return True
+    return (
+        config.reader == ReaderStrategy.AUTO.value
+        and os.path.isfile(path)
+        and not path.endswith(".gz")
+        and not is_gzip(path)
+    )
+
+
+#: Suffixes of the SAM, BAM, and CRAM files read by ``iter_alignment_sequences()``.
+_ALIGNMENT_SUFFIXES = (".sam", ".bam", ".cram")
+
+#: Magic bytes at the start of CRAM files.
+_CRAM_MAGIC = b"CRAM"
+
+#: Magic bytes at the start of the decompressed data of BAM files.
+_BAM_MAGIC = b"BAM\x01"
+
+#: Secondary and supplementary alignments repeat the sequence of the primary alignment.
+_SKIPPED_ALIGNMENT_FLAGS = 0x100 | 0x800
+
+#: Number of records whose names are hashed at once when subsampling alignment files.
+_ALIGNMENT_BATCH_SIZE = 10000
+
+
+def is_alignment_file(path: str) -> bool:
+    """Return whether ``path`` is a SAM, BAM, or CRAM file, by suffix or magic bytes.
+
+    Streams are always taken to be FASTQ.
+    """
+    if is_stream(path):
+        return False
+    elif path.endswith(_ALIGNMENT_SUFFIXES):
+        return True
+    with open(path, "rb") as inputf:
+        head = inputf.read(BGZF_PROBE_SIZE)
+    if head.startswith(_CRAM_MAGIC):
+        return True
+    elif not is_bgzf_header(head):
+        return False
+    try:
+        return zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(head).startswith(_BAM_MAGIC)
+    except zlib.error:  # pragma: no cover
+        return False
+
+
+def iter_alignment_sequences(
+    path: str,
+    num_threads: int = 1,
+    reference: typing.Optional[str] = None,
+    sample_fraction: typing.Optional[float] = None,
+    headers: bool = False,
+) -> typing.Iterator[typing.Any]:
+    """Yield the read sequences of the SAM, BAM, or CRAM file at ``path`` in file order.
+
+    Works for unaligned and aligned files alike; no index is needed.  Aligned reverse-strand
+    reads are stored reverse-complemented, which the canonical marker k-mers account for.
+    Secondary and supplementary alignments are skipped.  ``num_threads`` threads are used for
+    decompression and ``reference`` is needed for CRAM files.  See ``iter_fastq_sequences()``
+    for ``sample_fraction`` and ``headers``, the read name is used as header line.
+    """
+    with pysam.AlignmentFile(
+        path, mode="r", reference_filename=reference, threads=num_threads, check_sq=False
+    ) as alif:
+        records = (
+            record
+            for record in alif.fetch(until_eof=True)
+            if not record.flag & _SKIPPED_ALIGNMENT_FLAGS and record.query_sequence
+        )
+        for batch in batched(records, _ALIGNMENT_BATCH_SIZE):
+            sequences = [record.query_sequence.encode("ascii") for record in batch]
+            if headers or sample_fraction is not None:
+                header_lines = [b"@" + record.query_name.encode("ascii") for record in batch]
+            if headers:
+                sequences = zip(header_lines, sequences)
+            if sample_fraction is not None:
+                sequences = itertools.compress(
+                    sequences, sample_mask(header_lines, sample_fraction)
+                )
+            yield from sequences
+
+
+def iter_mate_pairs(
+    records: typing.Iterable[typing.Tuple[bytes, typing.Any]],
+    mate_records: typing.Iterable[typing.Tuple[bytes, typing.Any]],
+    chunk: InputChunk,
+) -> typing.Iterator[typing.Tuple[bytes, typing.Tuple[typing.Any, typing.Any]]]:
+    """Yield the header line of the first mate and the pair of mate sequences from the R1
+    ``records`` and the R2 ``mate_records`` of ``chunk``, pairs of header and sequence line, in
+    lockstep.
+
+    Raises ``ValueError`` if one file has more reads than the other or if the read names of two
+    mates differ (see ``_read_name()``), i.e., the files are out of sync.
+    """
+    missing = object()
+    for record_no, (record, mate_record) in enumerate(
+        itertools.zip_longest(records, mate_records, fillvalue=missing)
+    ):
+        if record is missing or mate_record is missing:
+            raise ValueError(
+                "Mate files %s and %s have different numbers of reads"
+                % (chunk.path, chunk.mate_path)
+            )
+        header, seq = record
+        mate_header, mate_seq = mate_record
+        if _read_name(header) != _read_name(mate_header):
+            raise ValueError(
+                "Mate files %s and %s are out of sync at read %d: %s and %s"
+                % (
+                    chunk.path,
+                    chunk.mate_path,
+                    record_no + 1,
+                    _read_name(header).decode("ascii", "replace"),
+                    _read_name(mate_header).decode("ascii", "replace"),
+                )
+            )
+        yield header, (seq, mate_seq)
@@ -0,0 +1,92 @@
+"""Contig-wise access to the reference FASTA for ``fastq-kmers``.
+
+Instead of one ``fetch()`` per site, the k-mers of all sites on a contig are sliced at once.
+Uncompressed FASTA files are memory-mapped and the bases are gathered through the line layout
+of the FASTA index, so only the pages around the sites are read.  Compressed files are read one
+contig at a time into a buffer.
+"""
+
+import mmap
+import os
+import typing
+
+import attr
+import numpy as np
+import pysam
+
+from .readers import is_gzip
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class FaiRecord:
+    """A line of a FASTA index."""
+
+    #: Number of bases in the contig.
+    length: int
+    #: Offset of the first base of the contig in the FASTA file.
+    offset: int
+    #: Number of bases per line.
+    line_bases: int
+    #: Number of bytes per line, including the line break.
+    line_width: int
+
+
+def read_fai(path: str) -> typing.Dict[str, FaiRecord]:
+    """Read the FASTA index at ``path``."""
+    result = {}
+    with open(path, "rt") as inputf:
+        for line in inputf:
+            name, *values = line.rstrip("\n").split("\t")[:5]
+            result[name] = FaiRecord(*map(int, values))
+    return result
+
+
+class ReferenceReader:
+    """Read the k-mers of many sites from a reference FASTA file, one contig at a time."""
+
+    def __init__(self, path: str):
+        #: Path to the FASTA file.
+        self.path = path
+        #: The FASTA file, builds the index if missing.
+        self.fastaf = pysam.FastaFile(path)
+        #: The index and memory map of an uncompressed FASTA file, ``None`` otherwise.
+        self.fai: typing.Optional[typing.Dict[str, FaiRecord]] = None
+        self.mm: typing.Optional[mmap.mmap] = None
+        if not is_gzip(path) and os.path.getsize(path):
+            self.fai = read_fai(path + ".fai")
+            with open(path, "rb") as inputf:
+                self.mm = mmap.mmap(inputf.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.close()
+        self.fastaf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def kmers(self, chromosome: str, starts: np.ndarray, length: int) -> np.ndarray:
+        """Return the ``(len(starts), length)`` matrix of the bases of the k-mers on
+        ``chromosome`` starting at the 0-based positions ``starts``.
+        """
+        contig_length = self.fastaf.get_reference_length(chromosome)
+        if len(starts) and (starts.min() < 0 or starts.max() + length > contig_length):
+            bad = starts[(starts < 0) | (starts + length > contig_length)][0]
+            raise ValueError(
+                "k-mer at %s:%d-%d exceeds the contig of length %d"
+                % (chromosome, bad + 1, bad + length, contig_length)
+            )
+        positions = starts.astype(np.int64)[:, np.newaxis] + np.arange(length)
+        if self.mm is not None:
+            record = self.fai[chromosome]
+            offsets = (
+                record.offset
+                + positions // record.line_bases * record.line_width
+                + positions % record.line_bases
+            )
+            return np.frombuffer(self.mm, dtype=np.uint8)[offsets]
+        seq = self.fastaf.fetch(chromosome).encode("ascii")
+        return np.frombuffer(seq, dtype=np.uint8)[positions]
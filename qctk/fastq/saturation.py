@@ -0,0 +1,134 @@
+"""Early stop of ``fastq-extract`` once the marker site coverage saturates.
+
+The counting pipelines report the counts of the reads processed since their last checkpoint
+every ``checkpoint_reads`` reads.  Reading stops once a target fraction of the sites reaches
+the minimal coverage or once the genotype calls did not change over a number of consecutive
+checkpoints.
+"""
+
+import multiprocessing
+import threading
+import typing
+
+from logzero import logger
+import numpy as np
+
+from .calling import genotype_codes
+from .config import FastqExtractConfig, StopCondition
+from .index import MarkerIndex
+
+
+def saturation_enabled(config: FastqExtractConfig) -> bool:
+    """Return whether any early stop condition is configured."""
+    return config.saturation_fraction is not None or config.stable_checkpoints is not None
+
+
+class SaturationMonitor:
+    """Accumulate the counts reported at checkpoints and decide when to stop reading input."""
+
+    def __init__(self, config: FastqExtractConfig, index: MarkerIndex):
+        #: The configuration.
+        self.config = config
+        #: The marker index.
+        self.index = index
+        #: Counts matrix accumulated over all checkpoints.
+        self.counts = index.new_counts()
+        #: Number of reads accumulated over all checkpoints.
+        self.num_reads = 0
+        #: The reason to stop, ``None`` while reading should go on.
+        self.stop_condition: typing.Optional[StopCondition] = None
+        #: Genotype codes of the previous checkpoint.
+        self._calls = None
+        #: Number of consecutive checkpoints without changed calls.
+        self._unchanged = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_condition is not None
+
+    def checkpoint(self, counts: np.ndarray, num_reads: int) -> bool:
+        """Add the ``counts`` of ``num_reads`` reads since the last checkpoint.
+
+        Return whether reading input should stop.
+        """
+        with self._lock:
+            self.counts += counts
+            self.num_reads += num_reads
+            if self.stop_condition is None:
+                self.stop_condition = self._check()
+                if self.stop_condition is not None:
+                    logger.info(
+                        "Stopping to read input after %s reads (%s)",
+                        "{:,}".format(self.num_reads),
+                        self.stop_condition.value,
+                    )
+            return self.stop_condition is not None
+
+    def _check(self) -> typing.Optional[StopCondition]:
+        ref_depths, alt_depths = self.index.site_depths(self.counts)
+        if self.config.saturation_fraction is not None:
+            covered = np.mean(ref_depths + alt_depths >= self.config.min_cov)
+            logger.debug(
+                "%.1f%% of sites covered after %s reads",
+                100.0 * covered,
+                "{:,}".format(self.num_reads),
+            )
+            if covered >= self.config.saturation_fraction:
+                return StopCondition.COVERAGE
+        if self.config.stable_checkpoints is not None:
+            calls = genotype_codes(self.config.threshold, ref_depths, alt_depths)
+            if self._calls is not None and calls.any() and np.array_equal(calls, self._calls):
+                self._unchanged += 1
+            else:
+                self._unchanged = 0
+            self._calls = calls
+            if self._unchanged >= self.config.stable_checkpoints:
+                return StopCondition.STABLE_CALLS
+        return None
+
+
+class RemoteMonitor:
+    """Forward the checkpoints of a worker process to the monitor of the parent process.
+
+    The parent evaluates checkpoints asynchronously, so workers see a stop at their next
+    checkpoint.
+    """
+
+    def __init__(self, queue: multiprocessing.Queue, stop_event: multiprocessing.Event):
+        self.queue = queue
+        self.stop_event = stop_event
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+    def checkpoint(self, counts: np.ndarray, num_reads: int) -> bool:
+        self.queue.put((counts, num_reads))
+        return self.stopped
+
+
+class MonitorServer:
+    """Context manager feeding the checkpoints of ``RemoteMonitor``s into a monitor on a thread
+    of the parent process.
+    """
+
+    def __init__(self, monitor):
+        #: The monitor in the parent process.
+        self.monitor = monitor
+        #: Client to pass to the worker processes.
+        self.client = RemoteMonitor(multiprocessing.Queue(), multiprocessing.Event())
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def _serve(self) -> None:
+        for counts, num_reads in iter(self.client.queue.get, None):
+            if self.monitor.checkpoint(counts, num_reads):
+                self.client.stop_event.set()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.client.queue.put(None)
+        self._thread.join()
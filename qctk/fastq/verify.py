@@ -0,0 +1,290 @@
+"""Implementation of ``fastq-verify``: check that FASTQ files belong to a sample with a stored
+fingerprint.
+
+The genotype calls from the running counts are compared with the stored calls at all sites that
+are called in both.  Matching samples are expected to have a small fraction of discordant calls
+(``error_rate``) while different samples have many (``mismatch_rate``).  At each checkpoint, the
+log-likelihood ratio of the two hypotheses is compared with the bounds of Wald's sequential
+probability ratio test and counting stops as soon as either bound is crossed.
+"""
+
+import argparse
+import enum
+import json
+import math
+import threading
+import typing
+
+import cattr
+from logzero import logger
+import numpy as np
+
+from .calling import GENOTYPE_CODES, genotype_codes
+from .config import FastqVerifyConfig, StopCondition
+from .extract import add_counting_arguments, check_counting_arguments
+from .index import MarkerIndex
+from .panels import load_panels, panel_paths
+from .parallel import count_inputs
+from ..config import (
+    DEFAULT_MIN_COV,
+    DEFAULT_VERIFY_CHECKPOINT_READS,
+    DEFAULT_VERIFY_CONFIDENCE,
+    DEFAULT_VERIFY_ERROR_RATE,
+    DEFAULT_VERIFY_MISMATCH_RATE,
+)
+from ..models.fastq import KmerInfo
+from ..models.vcf import SampleStats, Site, sample_path
+
+
+class Verdict(enum.Enum):
+    """The outcome of ``fastq-verify``."""
+
+    #: The input belongs to the sample.
+    MATCH = "match"
+    #: The input belongs to another sample.
+    MISMATCH = "mismatch"
+    #: The input did not provide enough evidence for either.
+    UNDECIDED = "undecided"
+
+
+#: Exit codes of ``fastq-verify`` by verdict, ``1`` is used for errors.
+_EXIT_CODES = {Verdict.MATCH: 0, Verdict.MISMATCH: 2, Verdict.UNDECIDED: 3}
+
+
+def _site_key(site: Site) -> typing.Tuple[str, int]:
+    chrom = site.chromosome[3:] if site.chromosome.startswith("chr") else site.chromosome
+    return (chrom, site.position)
+
+
+def expected_genotype_codes(
+    kmer_infos: typing.List[KmerInfo], sample_stats: SampleStats, min_cov: int
+) -> np.ndarray:
+    """Return the stored genotype codes (see ``GENOTYPE_CODES``) aligned to ``kmer_infos``.
+
+    Sites that are missing or have less than ``min_cov`` coverage in the stored statistics are
+    no-calls.  Calls without coverage information, e.g., from VCF files without depths, are kept.
+    """
+    codes = {}
+    for site_stats in sample_stats.site_stats:
+        stats = site_stats.stats
+        if stats.genotype is None:
+            continue
+        if stats.total_cov is None or stats.total_cov >= min_cov:
+            codes[_site_key(site_stats.site)] = GENOTYPE_CODES.index(stats.genotype)
+    return np.array(
+        [codes.get(_site_key(kmer_info.site), 0) for kmer_info in kmer_infos], dtype=np.int64
+    )
+
+
+class VerificationMonitor:
+    """Run the sequential test at each checkpoint of the counting pipelines.
+
+    Provides the same interface as ``SaturationMonitor``.
+    """
+
+    def __init__(self, config: FastqVerifyConfig, index: MarkerIndex, expected: np.ndarray):
+        #: The configuration.
+        self.config = config
+        #: The marker index.
+        self.index = index
+        #: The stored genotype codes of the sites.
+        self.expected = expected
+        #: Counts matrix accumulated over all checkpoints.
+        self.counts = index.new_counts()
+        #: Number of reads accumulated over all checkpoints.
+        self.num_reads = 0
+        #: ``StopCondition.DECIDED`` once a verdict was reached.
+        self.stop_condition: typing.Optional[StopCondition] = None
+        #: The current verdict.
+        self.verdict = Verdict.UNDECIDED
+        #: Number of sites compared in the last evaluation.
+        self.num_sites = 0
+        #: Number of discordant sites in the last evaluation.
+        self.num_discordant = 0
+        #: Log-likelihood ratio of mismatch vs. match in the last evaluation.
+        self.llr = 0.0
+        alpha = 1.0 - config.confidence
+        self._upper = math.log((1.0 - alpha) / alpha)
+        self._lower = math.log(alpha / (1.0 - alpha))
+        self._discordant_llr = math.log(config.mismatch_rate / config.error_rate)
+        self._concordant_llr = math.log((1.0 - config.mismatch_rate) / (1.0 - config.error_rate))
+        self._lock = threading.Lock()
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_condition is not None
+
+    def checkpoint(self, counts: np.ndarray, num_reads: int) -> bool:
+        """Add the ``counts`` of ``num_reads`` reads since the last checkpoint.
+
+        Return whether a verdict was reached.
+        """
+        with self._lock:
+            self.counts += counts
+            self.num_reads += num_reads
+            if self.stop_condition is None:
+                self.evaluate(self.counts)
+                if self.verdict != Verdict.UNDECIDED:
+                    self.stop_condition = StopCondition.DECIDED
+            return self.stopped
+
+    def evaluate(self, counts: np.ndarray) -> Verdict:
+        """Update the test statistic and verdict from the ``counts`` matrix."""
+        ref_depths, alt_depths = self.index.site_depths(counts)
+        calls = genotype_codes(self.config.threshold, ref_depths, alt_depths)
+        mask = (
+            (ref_depths + alt_depths >= self.config.min_cov) & (calls != 0) & (self.expected != 0)
+        )
+        self.num_sites = int(np.count_nonzero(mask))
+        self.num_discordant = int(np.count_nonzero(calls[mask] != self.expected[mask]))
+        self.llr = (
+            self.num_discordant * self._discordant_llr
+            + (self.num_sites - self.num_discordant) * self._concordant_llr
+        )
+        if self.llr >= self._upper:
+            self.verdict = Verdict.MISMATCH
+        elif self.llr <= self._lower:
+            self.verdict = Verdict.MATCH
+        else:
+            self.verdict = Verdict.UNDECIDED
+        logger.debug(
+            "%d of %d sites discordant after %s reads, log-likelihood ratio %.2f",
+            self.num_discordant,
+            self.num_sites,
+            "{:,}".format(self.num_reads),
+            self.llr,
+        )
+        return self.verdict
+
+
+def fastq_verify_run(config: FastqVerifyConfig) -> int:
+    """Verify that FASTQ files belong to a sample with stored fingerprint.
+
+    Entry point from configuration.
+    """
+    logger.info("Running fastq-verify")
+    logger.info("Configuration: %s", config)
+
+    if not config.common.storage_path:
+        logger.error("--storage-path must be provided!")
+        return 1
+    if not 0.0 < config.error_rate < config.mismatch_rate < 1.0:
+        logger.error(
+            "--error-rate and --mismatch-rate must satisfy 0 < error rate < mismatch rate < 1, "
+            "got %s and %s!",
+            config.error_rate,
+            config.mismatch_rate,
+        )
+        return 1
+    if not 0.0 < config.confidence < 1.0:
+        logger.error("--confidence must be between 0 and 1, got %s!", config.confidence)
+        return 1
+    path_stats = sample_path(config.common.storage_path, config.sample_id)
+    if not path_stats.exists():
+        logger.error("No stored statistics for sample %s at %s", config.sample_id, path_stats)
+        return 1
+
+    logger.info("Loading stored statistics...")
+    with path_stats.open("rt") as jsonf:
+        sample_stats = cattr.structure(json.load(jsonf), SampleStats)
+
+    logger.info("Loading kmers...")
+    try:
+        panels = load_panels(config)
+    except ValueError as e:
+        logger.error("Could not load k-mer panels: %s", e)
+        return 1
+    if len(panels) != 1:
+        logger.error("fastq-verify needs exactly one k-mer panel, got %d!", len(panels))
+        return 1
+    if not check_counting_arguments(config, panels):
+        return 1
+    kmer_infos = panels[0].kmer_infos
+    expected = expected_genotype_codes(kmer_infos, sample_stats, config.min_cov)
+    logger.info("Stored statistics have calls at %d sites", np.count_nonzero(expected))
+
+    logger.info("Analyzing FASTQ data...")
+    index = MarkerIndex.from_kmer_infos(kmer_infos, config.mismatches, panel_paths(panels))
+    monitor = VerificationMonitor(config, index, expected)
+    result = count_inputs(config, index, monitor)
+    if not monitor.stopped:
+        monitor.evaluate(result.counts)
+
+    logger.info(
+        "Verdict for sample %s: %s after %s reads (%d of %d sites discordant, log-likelihood "
+        "ratio %.2f)",
+        config.sample_id,
+        monitor.verdict.value,
+        "{:,}".format(result.num_reads),
+        monitor.num_discordant,
+        monitor.num_sites,
+        monitor.llr,
+    )
+    return _EXIT_CODES[monitor.verdict]
+
+
+def fastq_verify_main(args: argparse.Namespace) -> int:
+    """Verify that FASTQ files belong to a sample with stored fingerprint.
+
+    Entry point from argparse Namespace.
+    """
+    return fastq_verify_run(FastqVerifyConfig.from_namespace(args))
+
+
+def fastq_verify_config_parser(subparsers: argparse._SubParsersAction) -> None:
+    """Add command "fastq-verify" to argument parser."""
+    parser = subparsers.add_parser(
+        "fastq-verify",
+        help="Verify that FASTQ files belong to a sample with stored fingerprint.  Exits with "
+        "0 on match, 2 on mismatch, and 3 if undecided.",
+    )
+    parser.add_argument(
+        "--hidden-cmd", dest="cmd", default=fastq_verify_main, help=argparse.SUPPRESS
+    )
+
+    parser.add_argument(
+        "--sample-id", required=True, help="ID of the sample that the input is expected to be",
+    )
+    parser.add_argument(
+        "--input-files",
+        action="append",
+        nargs="+",
+        required=True,
+        help="Path(s) to FASTQ or SAM/BAM/CRAM files to process, '-' reads FASTQ from stdin, "
+        "named pipes are supported",
+    )
+    add_counting_arguments(parser)
+    parser.add_argument(
+        "--min-cov",
+        type=int,
+        default=DEFAULT_MIN_COV,
+        help="Minimal depth of a site to compare its calls, default: %d" % DEFAULT_MIN_COV,
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=DEFAULT_VERIFY_CONFIDENCE,
+        help="Confidence at which to decide on match or mismatch, default: %s"
+        % DEFAULT_VERIFY_CONFIDENCE,
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=DEFAULT_VERIFY_ERROR_RATE,
+        help="Fraction of discordant calls expected for the same sample, default: %s"
+        % DEFAULT_VERIFY_ERROR_RATE,
+    )
+    parser.add_argument(
+        "--mismatch-rate",
+        type=float,
+        default=DEFAULT_VERIFY_MISMATCH_RATE,
+        help="Fraction of discordant calls expected for different samples, default: %s"
+        % DEFAULT_VERIFY_MISMATCH_RATE,
+    )
+    parser.add_argument(
+        "--checkpoint-reads",
+        type=int,
+        default=DEFAULT_VERIFY_CHECKPOINT_READS,
+        help="Number of reads between two checks of the test statistic, default: %d"
+        % DEFAULT_VERIFY_CHECKPOINT_READS,
+    )
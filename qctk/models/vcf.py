@@ -67,6 +67,8 @@ class VariantStats:
 
     A missing genotype indicates a "no-call".  Missing coverage information indicates that the
     VCF file that this was generated from did not provide that information or a "no-call".
+    The raw allele counts are kept so the genotype can be called again with other parameters
+    (see ``qctk recall``); they are missing in statistics written by older versions.
     """
 
     #: Genotype at the site.
@@ -75,6 +77,10 @@ class VariantStats:
     total_cov: typing.Optional[int] = None
     #: Variant coverage at the site (alt).
     alt_cov: typing.Optional[int] = None
+    #: Number of observations of the reference allele, not scaled for subsampling.
+    ref_count: typing.Optional[int] = None
+    #: Number of observations of the alternative allele, not scaled for subsampling.
+    alt_count: typing.Optional[int] = None
 
 
 @attr.s(auto_attribs=True, frozen=True)
@@ -103,6 +109,10 @@ class SampleStats:
     sample: Sample
     #: The site-wise variant statistics.
     site_stats: typing.List[SiteStats]
+    #: Number of reads that the statistics were computed from, if known.
+    num_reads: typing.Optional[int] = None
+    #: Why reading the input stopped, if it can stop before the end of the input.
+    stop_condition: typing.Optional[str] = None
 
 
 @attr.s(auto_attribs=True, frozen=True)
@@ -0,0 +1 @@
+"""Functionality for calling genotypes again from the stored allele counts."""
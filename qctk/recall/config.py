@@ -0,0 +1,34 @@
+"""Configuration for the commands implemented in the ``recall`` module."""
+
+import argparse
+import attr
+import cattr
+import types
+import typing
+
+from ..config import CommonConfig, DEFAULT_RECALL_MIN_COV, DEFAULT_THRESHOLD
+
+_TRecallConfig = typing.TypeVar("RecallConfig")
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class RecallConfig:
+    """Configuration for the ``recall`` command."""
+
+    #: Common configuration.
+    common: CommonConfig
+
+    #: IDs of the samples to call again, all samples in the storage if empty.
+    sample_ids: typing.List[str] = attr.Factory(list)
+
+    #: Simple threshold to use for het/hom alt calls.
+    threshold: float = DEFAULT_THRESHOLD
+
+    #: Minimal number of allele observations at a site to call its genotype.
+    min_cov: int = DEFAULT_RECALL_MIN_COV
+
+    @classmethod
+    def from_namespace(
+        cls, ns: typing.Union[argparse.Namespace, types.SimpleNamespace]
+    ) -> _TRecallConfig:
+        return cattr.structure({"common": vars(ns), **vars(ns)}, cls)
@@ -0,0 +1,163 @@
+"""Implementation of the "recall" command.
+
+``fastq-extract`` and ``bam-extract`` store the raw reference and alternative allele counts of
+each site next to the genotype call.  This command calls the genotypes of any number of stored
+samples again with other parameters, in one vectorized pass over the counts of all samples and
+without reading the sequencing data again.  The coverage values are kept as they are.
+"""
+
+import argparse
+import json
+import pathlib
+import typing
+
+import attr
+import cattr
+from logzero import logger
+import numpy as np
+
+from ..config import DEFAULT_RECALL_MIN_COV, DEFAULT_THRESHOLD
+from ..fastq.calling import GENOTYPE_CODES, genotype_codes
+from ..models import vcf
+from .config import RecallConfig
+
+
+def _has_counts(sample_stats: vcf.SampleStats) -> bool:
+    return any(site_stats.stats.ref_count is not None for site_stats in sample_stats.site_stats)
+
+
+def load_sample_stats(config: RecallConfig) -> typing.List[vcf.SampleStats]:
+    """Load the statistics of the samples of ``config`` from the storage.
+
+    Samples that are missing or were stored without allele counts are skipped with a warning.
+    """
+    storage_path = config.common.storage_path
+    if config.sample_ids:
+        paths = [vcf.sample_path(storage_path, sample_id) for sample_id in config.sample_ids]
+    else:
+        paths = sorted(pathlib.Path(storage_path).glob("??/????/*-stats.json"))
+    result = []
+    for path_stats in paths:
+        if not path_stats.exists():
+            logger.warning("No stored statistics at %s", path_stats)
+            continue
+        with path_stats.open("rt") as jsonf:
+            sample_stats = cattr.structure(json.load(jsonf), vcf.SampleStats)
+        if _has_counts(sample_stats):
+            result.append(sample_stats)
+        else:
+            logger.warning(
+                "Skipping sample %s, its statistics have no allele counts",
+                sample_stats.sample.name,
+            )
+    return result
+
+
+def recall_sample_stats(
+    config: RecallConfig, samples: typing.List[vcf.SampleStats]
+) -> typing.List[vcf.SampleStats]:
+    """Call the genotypes of all ``samples`` from their allele counts.
+
+    Sites without allele counts or with fewer than ``min_cov`` observations are no-calls.
+    """
+    site_stats = [site_stats for sample in samples for site_stats in sample.site_stats]
+    ref_counts = np.array([s.stats.ref_count or 0 for s in site_stats], dtype=np.int64)
+    alt_counts = np.array([s.stats.alt_count or 0 for s in site_stats], dtype=np.int64)
+    codes = genotype_codes(config.threshold, ref_counts, alt_counts)
+    codes[ref_counts + alt_counts < config.min_cov] = 0
+    genotypes = iter([GENOTYPE_CODES[code] for code in codes.tolist()])
+    return [
+        attr.evolve(
+            sample,
+            site_stats=[
+                attr.evolve(s, stats=attr.evolve(s.stats, genotype=next(genotypes)))
+                for s in sample.site_stats
+            ],
+        )
+        for sample in samples
+    ]
+
+
+def drop_similarities(storage_path: str, sample_names: typing.Iterable[str]) -> None:
+    """Remove the stored similarities involving any of ``sample_names``, so ``compare``
+    computes them again from the new calls.
+    """
+    names = set(sample_names)
+    for path_sim in sorted(pathlib.Path(storage_path).glob("??/????/*-sim.json")):
+        with path_sim.open("rt") as jsonf:
+            pairs = json.load(jsonf)
+        kept = [pair for pair in pairs if not {pair["sample_i"], pair["sample_j"]} & names]
+        if len(kept) != len(pairs):
+            with path_sim.open("wt") as jsonf:
+                json.dump(kept, jsonf)
+
+
+def recall_run(config: RecallConfig) -> int:
+    """Call genotypes again from stored allele counts.
+
+    Entry point from configuration.
+    """
+    logger.info("Running recall")
+    logger.info("Configuration: %s", config)
+
+    if not config.common.storage_path:
+        logger.error("You must provide --storage-path!")
+        return 1
+    if not pathlib.Path(config.common.storage_path).exists():
+        logger.error("Storage path %s does not exist!", config.common.storage_path)
+        return 1
+
+    logger.info("Loading sample stats...")
+    samples = load_sample_stats(config)
+    if not samples:
+        logger.error("No sample statistics with allele counts found!")
+        return 1
+
+    logger.info("Calling genotypes of %d samples...", len(samples))
+    samples = recall_sample_stats(config, samples)
+
+    logger.info("Writing results...")
+    for sample_stats in samples:
+        vcf.write_site_stats(sample_stats, config.common.storage_path, sample_stats.sample.name)
+    drop_similarities(config.common.storage_path, [s.sample.name for s in samples])
+
+    logger.info("All done. Have a nice day!")
+    return 0
+
+
+def recall_main(args: argparse.Namespace) -> int:
+    """Call genotypes again from stored allele counts.
+
+    Entry point from argparse Namespace.
+    """
+    return recall_run(RecallConfig.from_namespace(args))
+
+
+def recall_config_parser(subparsers: argparse._SubParsersAction) -> None:
+    """Add command "recall" to argument parser."""
+    parser = subparsers.add_parser(
+        "recall",
+        help="Call genotypes of stored samples again from their allele counts, without reading "
+        "the sequencing data.",
+    )
+    parser.add_argument("--hidden-cmd", dest="cmd", default=recall_main, help=argparse.SUPPRESS)
+
+    parser.add_argument(
+        "--sample-ids",
+        nargs="+",
+        default=[],
+        help="ID(s) of the samples to call again, default: all samples in the storage",
+    )
+    parser.add_argument(
+        "--threshold",
+        default=DEFAULT_THRESHOLD,
+        type=float,
+        help="Simple threshold to use for het/hom alt calls, default: %s" % DEFAULT_THRESHOLD,
+    )
+    parser.add_argument(
+        "--min-cov",
+        type=int,
+        default=DEFAULT_RECALL_MIN_COV,
+        help="Minimal number of allele observations to call a site, default: %d"
+        % DEFAULT_RECALL_MIN_COV,
+    )
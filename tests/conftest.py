@@ -1,5 +1,10 @@
+import gzip
+import random
+
+import pysam
 import pytest
 
+from qctk.common import revcomp
 from qctk.config import CommonConfig
 from qctk.fastq import kmers
 from qctk.fastq.config import FastqKmersConfig
@@ -47,3 +52,143 @@ def small_kmers_info_path(tmp_path):
 
     assert res == 0
     return str(path_out)
+
+
+#: Genotypes simulated in the synthetic data set, cycled over the sites.
+SYNTHETIC_GENOTYPES = (vcf.Genotype.REF, vcf.Genotype.HET, vcf.Genotype.HOM)
+
+
+@pytest.fixture
+def synthetic_kmer_infos():
+    """K-mer infos for sites every 2kbp on the small reference."""
+    with pysam.FastaFile("tests/data/small/ref.fasta") as fastaf:
+        seq = fastaf.fetch("contig")
+    result = []
+    for position in range(1001, len(seq) - 1000, 2000):
+        reference = seq[position - 1]
+        alternative = "ACGT"[("ACGT".index(reference) + 1) % 4]
+        result.append(
+            fastq.KmerInfo(
+                site=vcf.Site(
+                    genome_release="test-small",
+                    chromosome="contig",
+                    position=position,
+                    reference=reference,
+                    alternative=alternative,
+                ),
+                ref_kmer=seq[position - 11 : position + 10],
+            )
+        )
+    return result
+
+
+@pytest.fixture
+def synthetic_kmer_infos_path(tmp_path, synthetic_kmer_infos):
+    path_out = tmp_path / "kmers" / "synthetic.tsv"
+    path_out.parent.mkdir(exist_ok=True)
+    fastq.write_kmer_infos(synthetic_kmer_infos, path=path_out)
+    return str(path_out)
+
+
+def _write_fastq(path, records):
+    with gzip.open(str(path), "wt") as outputf:
+        for name, seq in records:
+            print("@%s\n%s\n+\n%s" % (name, seq, "I" * len(seq)), file=outputf)
+
+
+@pytest.fixture
+def synthetic_fastq_paths(tmp_path, synthetic_kmer_infos):
+    """Paired-end reads at ~20x simulated from two haplotypes of the small reference."""
+    with pysam.FastaFile("tests/data/small/ref.fasta") as fastaf:
+        seq = fastaf.fetch("contig")
+    haplotypes = [list(seq), list(seq)]
+    for i, kmer_info in enumerate(synthetic_kmer_infos):
+        genotype = SYNTHETIC_GENOTYPES[i % len(SYNTHETIC_GENOTYPES)]
+        if genotype != vcf.Genotype.REF:
+            haplotypes[0][kmer_info.site.position - 1] = kmer_info.site.alternative
+        if genotype == vcf.Genotype.HOM:
+            haplotypes[1][kmer_info.site.position - 1] = kmer_info.site.alternative
+    haplotypes = ["".join(hap) for hap in haplotypes]
+
+    rng = random.Random(42)
+    read_length, fragment_length = 100, 300
+    records_1, records_2 = [], []
+    for i in range(len(seq) * 20 // (2 * read_length)):
+        hap = haplotypes[rng.randrange(2)]
+        begin = rng.randrange(len(seq) - fragment_length)
+        fragment = hap[begin : begin + fragment_length]
+        if rng.randrange(2):
+            fragment = revcomp(fragment)
+        read_1, read_2 = fragment[:read_length], revcomp(fragment[-read_length:])
+        if i % 50 == 0:
+            read_1 = read_1[:40] + "N" + read_1[41:]
+        records_1.append(("read%d/1" % i, read_1))
+        records_2.append(("read%d/2" % i, read_2))
+
+    paths = [tmp_path / "reads" / "synthetic_1.fq.gz", tmp_path / "reads" / "synthetic_2.fq.gz"]
+    paths[0].parent.mkdir(exist_ok=True)
+    _write_fastq(paths[0], records_1)
+    _write_fastq(paths[1], records_2)
+    return list(map(str, paths))
+
+
+@pytest.fixture
+def synthetic_lane_fastq_paths(tmp_path, synthetic_fastq_paths):
+    """The synthetic reads with Illumina read names, alternating between two flow cell lanes."""
+    result = []
+    for mate, path in enumerate(synthetic_fastq_paths, 1):
+        with pysam.FastxFile(path) as inputf:
+            records = [
+                ("M1:7:FC1:%d:1101:%d:1000 %d:N:0" % (i % 2 + 1, i, mate), record.sequence)
+                for i, record in enumerate(inputf)
+            ]
+        path_lanes = tmp_path / "reads" / ("lanes_%d.fq.gz" % mate)
+        _write_fastq(path_lanes, records)
+        result.append(str(path_lanes))
+    return result
+
+
+@pytest.fixture
+def synthetic_plain_fastq_paths(tmp_path, synthetic_fastq_paths):
+    """The synthetic reads, uncompressed."""
+    result = []
+    for path in synthetic_fastq_paths:
+        path_plain = path.replace(".fq.gz", ".fq")
+        with gzip.open(path, "rb") as inputf, open(path_plain, "wb") as outputf:
+            outputf.write(inputf.read())
+        result.append(path_plain)
+    return result
+
+
+@pytest.fixture
+def synthetic_bgzf_fastq_paths(tmp_path, synthetic_plain_fastq_paths):
+    """The synthetic reads, recompressed with BGZF."""
+    result = []
+    for path_plain in synthetic_plain_fastq_paths:
+        path_bgzf = path_plain.replace(".fq", ".bgzf.fq.gz")
+        pysam.tabix_compress(path_plain, path_bgzf)
+        result.append(path_bgzf)
+    return result
+
+
+@pytest.fixture
+def synthetic_bam_path(tmp_path, synthetic_plain_fastq_paths):
+    """The synthetic reads of both mates in a BAM file, with every other read stored as aligned
+    to the reverse strand and every tenth read with an additional secondary alignment.
+    """
+    header = {"HD": {"VN": "1.6", "SO": "unsorted"}, "SQ": [{"SN": "contig", "LN": 100000}]}
+    path = tmp_path / "reads" / "synthetic.bam"
+    with pysam.AlignmentFile(str(path), "wb", header=header) as outputf:
+        for path_fastq in synthetic_plain_fastq_paths:
+            with pysam.FastxFile(path_fastq) as inputf:
+                for i, entry in enumerate(inputf):
+                    for secondary in (False, True) if i % 10 == 0 else (False,):
+                        record = pysam.AlignedSegment(outputf.header)
+                        record.query_name = entry.name[:-2]
+                        record.reference_id = 0
+                        record.reference_start = i
+                        record.cigarstring = "%dM" % len(entry.sequence)
+                        record.flag = (0x10 if i % 2 else 0) | (0x100 if secondary else 0)
+                        record.query_sequence = revcomp(entry.sequence) if i % 2 else entry.sequence
+                        outputf.write(record)
+    return str(path)
@@ -0,0 +1,369 @@
+"""Tests for the k-mer encoding, marker index, and counting engines of ``fastq-extract``"""
+
+import itertools
+import pathlib
+import pickle
+
+import numpy as np
+import pysam
+import pytest
+
+from qctk.common import GenomeRelease, revcomp
+from qctk.config import CommonConfig
+from qctk.fastq import aho, encode, engines, minimizer, panels
+from qctk.fastq.config import FastqExtractConfig, KmerEngine
+from qctk.fastq.aho import AhoCorasickAutomaton, load_or_build_automaton, AUTOMATON_SUFFIX
+from qctk.fastq.index import MarkerIndex
+from qctk.fastq.mphf import MinimalPerfectHash
+from qctk.fastq.minimizer import MinimizerPrefilter, panel_table, sampled_codes
+
+
+def _naive_counts(kmer_infos, sequences):
+    """Reference implementation based on string slicing."""
+    kmer_length = len(kmer_infos[0].ref_kmer)
+    counts = {}
+    for seq in sequences:
+        for i in range(len(seq) - kmer_length + 1):
+            kmer = seq[i : i + kmer_length]
+            counts[kmer] = counts.get(kmer, 0) + 1
+    result = []
+    for kmer_info in kmer_infos:
+        depths = []
+        for kmer in (kmer_info.ref_kmer, kmer_info.alt_kmer):
+            depths.append(counts.get(kmer, 0) + counts.get(revcomp(kmer), 0))
+        result.append(tuple(depths))
+    return result
+
+
+def _read_sequences(paths):
+    result = []
+    for path in paths:
+        with pysam.FastxFile(path) as inputf:
+            result += [record.sequence for record in inputf]
+    return result
+
+
+def test_encode_decode_kmer():
+    assert encode.encode_kmer("ACGT") == 0b00011011
+    assert encode.encode_kmer("acgt") == 0b00011011
+    assert encode.encode_kmer("ACNT") is None
+    assert encode.decode_kmer(0b00011011, 4) == "ACGT"
+
+
+def test_revcomp_code():
+    for kmer in ("ACGTTGCAAAC", "AAAAAAAAAAA", "GATTACAGATT"):
+        code = encode.revcomp_code(encode.encode_kmer(kmer), len(kmer))
+        assert encode.decode_kmer(code, len(kmer)) == revcomp(kmer)
+
+
+@pytest.mark.parametrize("kmer_length", [1, 5, 16, 21, 32])
+def test_forward_codes(kmer_length):
+    seq = b"ACGTTGCAANCCGTAGGATTACATNNACGGTCAGTCATGACAGTCTTTGACNGTA"
+    buf = np.frombuffer(seq, dtype=np.uint8)
+    codes, invalid = encode.forward_codes(buf, kmer_length)
+    windows = encode.valid_windows(np.arange(len(codes)), invalid, kmer_length)
+    expected = [encode.encode_kmer(seq[i : i + kmer_length]) for i in range(len(codes))]
+    assert codes[windows].tolist() == [code for code in expected if code is not None]
+
+
+def test_marker_index(synthetic_kmer_infos):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    assert index.kmer_length == 21
+    assert index.num_sites == len(synthetic_kmer_infos)
+    assert index.num_kmers == 2 * len(synthetic_kmer_infos)
+    assert sorted(index.cells.tolist()) == list(range(2 * len(synthetic_kmer_infos)))
+    kmer_info = synthetic_kmer_infos[3]
+    code = encode.canonical_code(encode.encode_kmer(kmer_info.alt_kmer), 21)
+    positions, slots = index.locate(np.array([code, code + 1], dtype=np.uint64))
+    assert positions.tolist() == [0]
+    assert index.cells[slots[0]] == 2 * 3 + 1
+
+
+def test_marker_index_code_filter(synthetic_kmer_infos):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    # The filter passes all marker k-mers in both orientations, and rejects most other codes.
+    assert index.may_contain(index.codes).all()
+    assert index.may_contain(encode.revcomp_codes(index.codes, 21)).all()
+    codes = np.random.RandomState(42).randint(0, 4 ** 21, size=10000, dtype=np.int64)
+    assert index.may_contain(codes.astype(np.uint64)).mean() < 0.05
+
+
+def test_marker_index_shared_kmer(synthetic_kmer_infos):
+    kmer_infos = synthetic_kmer_infos[:2] + synthetic_kmer_infos[:1]
+    index = MarkerIndex.from_kmer_infos(kmer_infos)
+    assert index.num_kmers == 4
+    counts = index.new_counts()
+    code = encode.canonical_code(encode.encode_kmer(kmer_infos[0].ref_kmer), 21)
+    index.add_hits(counts, index.locate(np.array([code, code], dtype=np.uint64))[1])
+    ref_depths, alt_depths = index.site_depths(counts)
+    assert ref_depths.tolist() == [2, 0, 2]
+    assert alt_depths.tolist() == [0, 0, 0]
+
+
+def test_revcomp_codes():
+    codes = np.random.RandomState(42).randint(0, 4 ** 21, size=100, dtype=np.int64)
+    assert encode.revcomp_codes(codes.astype(np.uint64), 21).tolist() == [
+        encode.revcomp_code(code, 21) for code in codes.tolist()
+    ]
+
+
+def test_marker_index_mismatches(synthetic_kmer_infos):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos, mismatches=1)
+    # 63 neighbours per allele, minus the other allele and the two other bases at the site.
+    assert index.num_neighbours == 2 * 60 * len(synthetic_kmer_infos)
+    assert index.num_kmers == 2 * len(synthetic_kmer_infos) + index.num_neighbours
+
+    kmer_info = synthetic_kmer_infos[3]
+    ref_kmer, alt_kmer = kmer_info.ref_kmer, kmer_info.alt_kmer
+    pos = next(i for i in range(21) if ref_kmer[i] != alt_kmer[i])
+    other = next(b for b in "ACGT" if b not in (ref_kmer[pos], alt_kmer[pos]))
+    flip = {"A": "C", "C": "G", "G": "T", "T": "A"}
+    error = (pos + 5) % 21
+    sequences = [
+        ref_kmer[:error] + flip[ref_kmer[error]] + ref_kmer[error + 1 :],
+        revcomp(alt_kmer[:error] + flip[alt_kmer[error]] + alt_kmer[error + 1 :]),
+        ref_kmer[:pos] + other + ref_kmer[pos + 1 :],
+    ]
+    counts = index.new_counts()
+    engines.BatchEngine(index).count(sequences, counts)
+    assert counts.tolist()[3] == [1, 1]
+    assert counts.sum() == 2
+    exact = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    counts = exact.new_counts()
+    engines.BatchEngine(exact).count(sequences, counts)
+    assert counts.sum() == 0
+
+    with pytest.raises(ValueError):
+        MarkerIndex.from_kmer_infos(synthetic_kmer_infos, mismatches=2)
+
+
+def test_minimal_perfect_hash():
+    keys = np.random.RandomState(42).randint(0, 2 ** 62, size=10000, dtype=np.int64)
+    keys = np.unique(keys).astype(np.uint64)
+    mphf = MinimalPerfectHash.build(keys)
+    assert sorted(mphf.lookup(keys).tolist()) == list(range(len(keys)))
+    assert mphf.num_levels > 1
+
+
+@pytest.mark.parametrize(
+    "build_engine",
+    [
+        engines.RollingEngine,
+        engines.BatchEngine,
+        lambda index: engines.BatchEngine(index, 7),
+        lambda index: engines.AhoCorasickEngine(index, AhoCorasickAutomaton.from_index(index), 7),
+        lambda index: MinimizerPrefilter(engines.BatchEngine(index), 15, 7, 100),
+        lambda index: MinimizerPrefilter(engines.RollingEngine(index), 11, 11, 100),
+    ],
+)
+def test_engine_matches_naive(build_engine, synthetic_kmer_infos, synthetic_fastq_paths):
+    sequences = _read_sequences(synthetic_fastq_paths)[:2000]
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    counts = index.new_counts()
+    build_engine(index).count(sequences, counts)
+    ref_depths, alt_depths = index.site_depths(counts)
+    expected = _naive_counts(synthetic_kmer_infos, sequences)
+    assert list(zip(ref_depths.tolist(), alt_depths.tolist())) == expected
+    assert any(itertools.chain.from_iterable(expected))
+
+
+@pytest.mark.parametrize(
+    "build_engine",
+    [
+        engines.RollingEngine,
+        lambda index: engines.BatchEngine(index, 7),
+        lambda index: engines.AhoCorasickEngine(index, AhoCorasickAutomaton.from_index(index), 7),
+        lambda index: MinimizerPrefilter(engines.BatchEngine(index), 15, 7, 100),
+    ],
+)
+def test_engine_count_fragments(build_engine, synthetic_kmer_infos, synthetic_fastq_paths):
+    sequences_1 = _read_sequences(synthetic_fastq_paths[:1])[:500]
+    sequences_2 = _read_sequences(synthetic_fastq_paths[1:])[:500]
+    # Every other fragment is fully overlapping: the mates are reverse complements.
+    fragments = [
+        (seq_1, revcomp(seq_1) if i % 2 else seq_2)
+        for i, (seq_1, seq_2) in enumerate(zip(sequences_1, sequences_2))
+    ]
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    counts = index.new_counts()
+    build_engine(index).count_fragments(fragments, counts)
+    ref_depths, alt_depths = index.site_depths(counts)
+    expected = np.zeros((len(synthetic_kmer_infos), 2), dtype=np.int64)
+    for fragment in fragments:
+        expected += np.array(_naive_counts(synthetic_kmer_infos, fragment)) > 0
+    assert ref_depths.tolist() == expected[:, 0].tolist()
+    assert alt_depths.tolist() == expected[:, 1].tolist()
+
+    single_counts = index.new_counts()
+    engines.BatchEngine(index).count(encode.flatten_fragments(fragments)[0], single_counts)
+    assert 0 < counts.sum() < single_counts.sum()
+
+
+@pytest.mark.parametrize(
+    "build_engine",
+    [
+        lambda index: engines.RollingEngine(index, 50),
+        lambda index: engines.AhoCorasickEngine(index, AhoCorasickAutomaton.from_index(index), 50),
+    ],
+)
+def test_lock_step_engine_mixed_lengths(build_engine, synthetic_kmer_infos, synthetic_fastq_paths):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    engine = build_engine(index)
+    # Reads of very different lengths, including empty reads, in the same block.
+    sequences = [
+        seq[: (i * 37) % (len(seq) + 1)] + ("N" if i % 3 else "")
+        for i, seq in enumerate(_read_sequences(synthetic_fastq_paths)[:1000])
+    ]
+    counts = index.new_counts()
+    engine.count(sequences, counts)
+    ref_depths, alt_depths = index.site_depths(counts)
+    expected = _naive_counts(synthetic_kmer_infos, sequences)
+    assert list(zip(ref_depths.tolist(), alt_depths.tolist())) == expected
+    assert any(itertools.chain.from_iterable(expected))
+
+
+@pytest.mark.parametrize(
+    "build_engine",
+    [
+        lambda index: engines.RollingEngine(index, 7),
+        lambda index: engines.AhoCorasickEngine(index, AhoCorasickAutomaton.from_index(index), 7),
+    ],
+)
+def test_lock_step_engine_empty_reads(build_engine, synthetic_kmer_infos):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    engine = build_engine(index)
+    for sequences in ([], ["", ""]):
+        read_nos, slots = engine.block_hits(sequences)
+        assert (read_nos.tolist(), slots.tolist()) == ([], [])
+        assert read_nos.dtype.kind == slots.dtype.kind == "i"
+    counts = index.new_counts()
+    engine.count(["", "", ""], counts)
+    assert not counts.any()
+
+
+def test_batch_engine_window_hits(synthetic_kmer_infos):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    ref_kmer, alt_kmer = synthetic_kmer_infos[3].ref_kmer, synthetic_kmer_infos[5].alt_kmer
+    # An N inside a marker k-mer hides it, the reverse complement of a marker k-mer is found.
+    seq = "ACGT" + ref_kmer + "N" + revcomp(alt_kmer) + alt_kmer[:10] + "N" + alt_kmer[11:]
+    buf = np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
+    windows, slots = engines.BatchEngine(index).window_hits(buf)
+    assert windows.tolist() == [4, 4 + 21 + 1]
+    assert index.cells[slots].tolist() == [2 * 3, 2 * 5 + 1]
+
+
+def test_aho_corasick_automaton_cache(
+    synthetic_kmer_infos, synthetic_kmer_infos_path, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    index = MarkerIndex.from_kmer_infos(
+        synthetic_kmer_infos, source_paths=[synthetic_kmer_infos_path]
+    )
+    automaton = load_or_build_automaton(index)
+    assert automaton.num_states > 4 * index.num_kmers
+    assert pathlib.Path(synthetic_kmer_infos_path + AUTOMATON_SUFFIX).exists()
+
+    loaded = load_or_build_automaton(index)
+    assert loaded.digest == automaton.digest
+    assert (loaded.transitions == automaton.transitions).all()
+    assert (loaded.outputs == automaton.outputs).all()
+
+
+def test_aho_corasick_automaton_not_cached_without_source(
+    synthetic_kmer_infos, tmp_path, monkeypatch, mocker
+):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    spy = mocker.spy(aho.AhoCorasickAutomaton, "save")
+    load_or_build_automaton(MarkerIndex.from_kmer_infos(synthetic_kmer_infos))
+    assert spy.call_count == 0
+    assert not (tmp_path / "cache").exists()
+
+
+def test_aho_corasick_automaton_cache_builtin_panel(
+    synthetic_kmer_infos_path, tmp_path, monkeypatch, mocker
+):
+    monkeypatch.setitem(panels.KMER_FILES, GenomeRelease.GRCH37, synthetic_kmer_infos_path)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=None),
+        sample_id="synthetic",
+        input_files=[],
+        kmer_infos=[],
+        genome_release=[GenomeRelease.GRCH37.value],
+        engine=KmerEngine.AHO_CORASICK.value,
+    )
+    marker_panels = panels.load_panels(config)
+    index = MarkerIndex.from_kmer_infos(
+        panels.merge_panels(marker_panels), source_paths=panels.panel_paths(marker_panels)
+    )
+    assert index.source_paths == (synthetic_kmer_infos_path,)
+    local_path, user_path = aho.automaton_cache_paths(index.source_paths)
+    assert user_path.parent == tmp_path / "cache" / "qctk"
+
+    # The k-mer infos directory is read-only, the automaton goes to the user cache directory.
+    save = aho.AhoCorasickAutomaton.save
+
+    def save_outside_panel_dir(automaton, path):
+        if pathlib.Path(path) == local_path:
+            raise PermissionError("read-only")
+        save(automaton, path)
+
+    mocker.patch.object(aho.AhoCorasickAutomaton, "save", save_outside_panel_dir)
+    engines.build_engine(config, index)
+    assert not local_path.exists() and user_path.exists()
+
+    # The next run loads it instead of building the automaton again.
+    spy = mocker.spy(aho.AhoCorasickAutomaton, "from_index")
+    engine = engines.build_engine(config, index)
+    assert spy.call_count == 0
+    assert engine.automaton.digest == aho.index_digest(index)
+
+
+def test_minimizer_prefilter_rejects_reads(synthetic_kmer_infos, synthetic_fastq_paths):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    prefilter = MinimizerPrefilter(engines.BatchEngine(index), 15, 7, 500)
+    sequences = _read_sequences(synthetic_fastq_paths)[:2000]
+    prefilter.count(sequences, index.new_counts())
+    stats = prefilter.take_stats()
+    assert stats.reads_in == 2000
+    assert 0 < stats.reads_passed < 500
+    assert prefilter.take_stats().reads_in == 0
+
+
+def test_minimizer_prefilter_pickle(synthetic_kmer_infos, synthetic_fastq_paths):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    prefilter = MinimizerPrefilter(engines.BatchEngine(index), 15, 7, 500)
+    sequences = _read_sequences(synthetic_fastq_paths)[:1000]
+    prefilter.count(sequences, index.new_counts())
+    loaded = pickle.loads(pickle.dumps(prefilter))
+    assert loaded.take_stats() == prefilter.take_stats()
+    counts, loaded_counts = index.new_counts(), index.new_counts()
+    prefilter.count(sequences, counts)
+    loaded.count(sequences, loaded_counts)
+    assert (counts == loaded_counts).all()
+    assert loaded.take_stats().reads_in == 1000
+
+
+def test_sampled_codes():
+    seq = b"ACGTTGCAANCCGTAGGATTACATGGCA"
+    starts, codes = sampled_codes(np.frombuffer(seq, dtype=np.uint8), 5, 4)
+    assert starts.tolist() == list(range(0, len(seq) - 4, 4))
+    # The N is encoded as A.
+    expected = [seq[i : i + 5].replace(b"N", b"A").decode("ascii") for i in starts.tolist()]
+    assert codes.tolist() == [encode.encode_kmer(mmer) for mmer in expected]
+    assert len(sampled_codes(np.frombuffer(seq[:4], dtype=np.uint8), 5, 4)[1]) == 0
+
+
+def test_panel_table(synthetic_kmer_infos):
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    table = panel_table(index, 15, 7)
+    num_bits = len(table).bit_length() - 1
+    # All m-mers of the marker k-mers are in the table, in both orientations.
+    for kmer_info in synthetic_kmer_infos[:10]:
+        for kmer in (kmer_info.ref_kmer, kmer_info.alt_kmer):
+            for strand in (kmer, revcomp(kmer)):
+                buf = np.frombuffer(strand.encode("ascii"), dtype=np.uint8)
+                _, codes = sampled_codes(buf, 15, 1)
+                assert table[minimizer._panel_positions(codes, num_bits)].all()
+    with pytest.raises(ValueError):
+        panel_table(index, 15, 8)
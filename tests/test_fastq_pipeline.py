@@ -0,0 +1,287 @@
+"""Tests for the streaming pipeline of ``fastq-extract``"""
+
+import attr
+import numpy as np
+import pytest
+
+from qctk.config import CommonConfig
+from qctk.fastq import checkpoint, readers
+from qctk.fastq.config import FastqExtractConfig, StopCondition
+from qctk.fastq.engines import BatchEngine, build_engine
+from qctk.fastq.index import MarkerIndex
+from qctk.fastq.partitions import Partition, file_partition_names
+from qctk.fastq.pipeline import Pipeline
+from qctk.fastq.saturation import SaturationMonitor
+
+
+def _config(**kwargs):
+    return FastqExtractConfig(
+        common=CommonConfig(storage_path=None),
+        sample_id="synthetic",
+        input_files=[],
+        kmer_infos=None,
+        **kwargs
+    )
+
+
+def _read_sequences(path):
+    """Read the sequences of ``path`` without the pipeline, for comparison."""
+    return readers.iter_fastq_sequences(readers.iter_raw_chunks(path))
+
+
+@pytest.mark.parametrize("count_threads", [1, 3])
+def test_pipeline_counts(synthetic_kmer_infos, synthetic_bgzf_fastq_paths, count_threads):
+    config = _config(batch_size=50, queue_depth=2, count_threads=count_threads)
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    engine = BatchEngine(index, config.batch_size)
+    chunk = readers.InputChunk(path=synthetic_bgzf_fastq_paths[0])
+
+    pipeline = Pipeline(config, engine, chunk)
+    counts = pipeline.run()
+
+    expected = index.new_counts()
+    engine.count(_read_sequences(chunk.path), expected)
+    assert counts.tolist() == expected.tolist()
+    assert [stats.name for stats in pipeline.stage_stats][:2] == ["decompress", "parse"]
+    assert sum(stats.items for stats in pipeline.stage_stats[2:]) == pipeline.stage_stats[1].items
+
+
+@pytest.mark.parametrize("engine", ["batch", "aho-corasick"])
+def test_pipeline_counts_mmap(
+    synthetic_kmer_infos,
+    synthetic_plain_fastq_paths,
+    synthetic_fastq_paths,
+    engine,
+    tmp_path,
+    monkeypatch,
+):
+    # The index is not built from files, so no automaton is cached, neither here nor anywhere.
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = _config(batch_size=50, engine=engine)
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    engine = build_engine(config, index)
+
+    pipeline = Pipeline(config, engine, readers.InputChunk(path=synthetic_plain_fastq_paths[0]))
+    counts = pipeline.run()
+
+    expected = index.new_counts()
+    engine.count(_read_sequences(synthetic_fastq_paths[0]), expected)
+    assert counts.tolist() == expected.tolist()
+    assert pipeline.stage_stats[0].items == 0
+    assert not (tmp_path / "cache").exists()
+
+
+def test_pipeline_propagates_errors(synthetic_kmer_infos, tmp_path):
+    config = _config()
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    chunk = readers.InputChunk(path=str(tmp_path / "missing.fq.gz"))
+    with pytest.raises(FileNotFoundError):
+        Pipeline(config, BatchEngine(index), chunk).run()
+
+
+def test_pipeline_stops_on_coverage(synthetic_kmer_infos, synthetic_bgzf_fastq_paths):
+    config = _config(batch_size=50, saturation_fraction=0.5, checkpoint_reads=500)
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    monitor = SaturationMonitor(config, index)
+    chunk = readers.InputChunk(path=synthetic_bgzf_fastq_paths[0])
+
+    pipeline = Pipeline(config, BatchEngine(index, config.batch_size), chunk, monitor)
+    counts = pipeline.run()
+
+    assert pipeline.stopped
+    assert monitor.stop_condition == StopCondition.COVERAGE
+    assert 0 < pipeline.num_reads < sum(1 for _ in _read_sequences(chunk.path))
+    assert monitor.num_reads <= pipeline.num_reads
+    assert (monitor.counts <= counts).all()
+
+
+def test_pipeline_resume_after_stop(synthetic_kmer_infos, synthetic_bgzf_fastq_paths, tmp_path):
+    config = attr.evolve(
+        _config(batch_size=50, saturation_fraction=0.5, checkpoint_reads=500),
+        common=CommonConfig(storage_path=str(tmp_path)),
+        checkpoint_seconds=0.0,
+    )
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    engine = BatchEngine(index, config.batch_size)
+    chunk = readers.InputChunk(path=synthetic_bgzf_fastq_paths[0])
+    pipeline = Pipeline(config, engine, chunk, SaturationMonitor(config, index))
+    pipeline.run()
+    assert pipeline.stopped
+
+    # A stopped chunk is not complete, resuming with the same options continues reading it.
+    pipeline = Pipeline(attr.evolve(config, resume=True), engine, chunk)
+    assert 0 < pipeline.num_reads
+    assert not pipeline.progress.complete
+
+    # Checkpoints of other stop settings are ignored.
+    for changes in ({"saturation_fraction": 0.9}, {"min_cov": 2}, {"stable_checkpoints": 2}):
+        pipeline = Pipeline(attr.evolve(config, resume=True, **changes), engine, chunk)
+        assert pipeline.num_reads == 0
+
+
+def test_saturation_monitor_stable_calls(synthetic_kmer_infos):
+    config = _config(stable_checkpoints=2)
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    monitor = SaturationMonitor(config, index)
+    counts = index.new_counts()
+    assert not monitor.checkpoint(counts, 100)
+    counts[:, 0] = 10
+    assert not monitor.checkpoint(counts, 100)
+    assert not monitor.checkpoint(counts, 100)
+    assert monitor.checkpoint(counts, 100)
+    assert monitor.stop_condition == StopCondition.STABLE_CALLS
+    assert monitor.num_reads == 400
+
+
+def test_pipeline_counts_bam(
+    synthetic_kmer_infos, synthetic_plain_fastq_paths, synthetic_bam_path, tmp_path
+):
+    config = _config(batch_size=50, decompress_threads=2)
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    engine = build_engine(config, index)
+
+    expected, num_reads = index.new_counts(), 0
+    for path in synthetic_plain_fastq_paths:
+        pipeline = Pipeline(config, engine, readers.InputChunk(path=path))
+        expected += pipeline.run()
+        num_reads += pipeline.num_reads
+
+    path_ubam = str(tmp_path / "reads.unaligned")  # detected by content
+    with open(synthetic_bam_path, "rb") as inputf, open(path_ubam, "wb") as outputf:
+        outputf.write(inputf.read())
+    for path in (synthetic_bam_path, path_ubam):
+        pipeline = Pipeline(config, engine, readers.InputChunk(path=path))
+        assert pipeline.run().tolist() == expected.tolist()
+        assert pipeline.num_reads == num_reads
+
+
+class _FailingEngine:
+    """Engine that fails after counting ``num_batches`` batches."""
+
+    def __init__(self, engine, num_batches):
+        self.engine = engine
+        self.index = engine.index
+        self.num_batches = num_batches
+
+    def count(self, sequences, counts):
+        if self.num_batches == 0:
+            raise RuntimeError("preempted")
+        self.num_batches -= 1
+        self.engine.count(sequences, counts)
+
+    def count_fragments(self, fragments, counts):
+        if self.num_batches == 0:
+            raise RuntimeError("preempted")
+        self.num_batches -= 1
+        self.engine.count_fragments(fragments, counts)
+
+
+@pytest.mark.parametrize("count_threads", [1, 3])
+def test_pipeline_resume(synthetic_kmer_infos, synthetic_fastq_paths, tmp_path, count_threads):
+    config = attr.evolve(
+        _config(batch_size=50, count_threads=count_threads),
+        common=CommonConfig(storage_path=str(tmp_path)),
+    )
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    engine = build_engine(config, index)
+    chunk = readers.InputChunk(path=synthetic_fastq_paths[0])
+    expected = Pipeline(config, engine, chunk)
+    expected_counts = expected.run()
+
+    config = attr.evolve(config, checkpoint_seconds=0.0)
+    with pytest.raises(RuntimeError):
+        Pipeline(config, _FailingEngine(engine, 20), chunk).run()
+    path = checkpoint.checkpoint_path(config, chunk)
+    assert path.exists()
+
+    pipeline = Pipeline(attr.evolve(config, resume=True), engine, chunk)
+    assert pipeline.num_reads == 20 * 50
+    assert pipeline.run().tolist() == expected_counts.tolist()
+    assert pipeline.num_reads == expected.num_reads
+    assert (
+        sum(stats.items for stats in pipeline.stage_stats[2:]) == -(-expected.num_reads // 50) - 20
+    )
+
+    # Completed chunks are not read again.
+    pipeline = Pipeline(attr.evolve(config, resume=True), _FailingEngine(engine, 0), chunk)
+    assert pipeline.run().tolist() == expected_counts.tolist()
+    assert pipeline.num_reads == expected.num_reads
+
+    # Checkpoints of other options are ignored.
+    pipeline = Pipeline(attr.evolve(config, resume=True, batch_size=40), engine, chunk)
+    assert pipeline.num_reads == 0
+
+
+@pytest.mark.parametrize(
+    "num_parts,paired,sample_fraction", [(1, False, None), (3, False, 0.5), (1, True, None)]
+)
+def test_pipeline_resume_bgzf(
+    synthetic_kmer_infos, synthetic_bgzf_fastq_paths, tmp_path, num_parts, paired, sample_fraction
+):
+    config = attr.evolve(
+        _config(batch_size=50, count_threads=3, sample_fraction=sample_fraction),
+        common=CommonConfig(storage_path=str(tmp_path)),
+        checkpoint_seconds=0.0,
+    )
+    index = MarkerIndex.from_kmer_infos(synthetic_kmer_infos)
+    engine = build_engine(config, index)
+    mate_path = synthetic_bgzf_fastq_paths[1] if paired else None
+    for part in range(num_parts):
+        chunk = readers.InputChunk(synthetic_bgzf_fastq_paths[0], part, num_parts, mate_path)
+        expected = Pipeline(config, engine, chunk)
+        expected_counts = expected.run()
+        checkpoint.checkpoint_path(config, chunk).unlink()
+        with pytest.raises(RuntimeError):
+            Pipeline(config, _FailingEngine(engine, 10), chunk).run()
+
+        # Reading resumes at the offsets following the leading counted batches.
+        pipeline = Pipeline(attr.evolve(config, resume=True), engine, chunk)
+        assert pipeline.progress.done_prefix > 0
+        assert pipeline.run().tolist() == expected_counts.tolist()
+        assert pipeline.num_reads == expected.num_reads
+        assert pipeline.decompress_stats.bytes_in < expected.decompress_stats.bytes_in
+        assert pipeline.stage_stats[1].items < expected.stage_stats[1].items
+
+
+def test_chunk_progress():
+    progress = checkpoint.ChunkProgress()
+    offsets = [(readers.VirtualOffset(batch_no, 1),) for batch_no in range(4)]
+    for batch_no in (1, 3, 0):
+        progress.add(batch_no, 10, offsets[batch_no])
+    assert (progress.done_prefix, progress.num_reads) == (2, 30)
+    assert (progress.done_batches, progress.offsets) == ({3: offsets[3]}, offsets[1])
+    assert [progress.is_done(i) for i in range(5)] == [True, True, False, True, False]
+
+
+def test_checkpoint_offsets(tmp_path):
+    counts = np.zeros((3, 2), dtype=np.int32)
+    path = tmp_path / "checkpoint.npz"
+    for offsets in (None, (readers.VirtualOffset(10, 2), readers.VirtualOffset(20, 70000))):
+        progress = checkpoint.ChunkProgress(10, 2, {3: offsets, 5: offsets}, offsets=offsets)
+        checkpoint.write_checkpoint(path, "digest", counts, progress)
+        _, loaded, _ = checkpoint.read_checkpoint(path, "digest")
+        assert (loaded.done_prefix, loaded.done_batches) == (2, {3: offsets, 5: offsets})
+        assert loaded.offsets == offsets
+
+
+def test_checkpoint_partitions(tmp_path):
+    counts = np.arange(6, dtype=np.int32).reshape(3, 2)
+    partitions = {"FC1-1": Partition(counts - 1, 4), "FC1-2": Partition(counts + 1, 6)}
+    path = tmp_path / "checkpoint.npz"
+    checkpoint.write_checkpoint(path, "digest", counts, checkpoint.ChunkProgress(10), partitions)
+    _, progress, loaded = checkpoint.read_checkpoint(path, "digest")
+    assert progress.num_reads == 10
+    assert sorted(loaded) == sorted(partitions)
+    for name, partition in partitions.items():
+        assert loaded[name].num_reads == partition.num_reads
+        assert (loaded[name].counts == partition.counts).all()
+
+
+def test_file_partition_names():
+    paths = ["a/S1_L001_R1.fastq.gz", "b/S1_L001_R1.fastq.gz", "c/S2.bam", readers.STDIN_PATH]
+    assert file_partition_names(paths + paths[:1]) == {
+        paths[0]: "S1_L001_R1",
+        paths[1]: "S1_L001_R1-2",
+        paths[2]: "S2",
+        paths[3]: "stdin",
+    }
@@ -0,0 +1,422 @@
+"""Tests for the input readers and decompression of ``fastq-extract``"""
+
+import gzip
+import io
+import itertools
+import os
+import struct
+import sys
+import threading
+import zlib
+
+import attr
+import pysam
+import pytest
+
+from qctk.common import revcomp
+from qctk.config import CommonConfig
+from qctk.fastq import decompress, readers
+from qctk.fastq.config import FastqExtractConfig
+
+
+def _pysam_sequences(path):
+    with pysam.FastxFile(path) as inputf:
+        return [record.sequence.encode("ascii") for record in inputf]
+
+
+def _pysam_records(path):
+    """Return the pairs of header line and sequence of the records in the FASTQ file at ``path``."""
+    with pysam.FastxFile(path) as inputf:
+        return [
+            (
+                ("@%s %s" % (record.name, record.comment or "")).rstrip().encode("ascii"),
+                record.sequence.encode("ascii"),
+            )
+            for record in inputf
+        ]
+
+
+def test_is_bgzf(synthetic_fastq_paths, synthetic_bgzf_fastq_paths):
+    assert not decompress.is_bgzf(synthetic_fastq_paths[0])
+    assert decompress.is_bgzf(synthetic_bgzf_fastq_paths[0])
+
+
+def test_iter_bgzf_chunks(synthetic_bgzf_fastq_paths):
+    path = synthetic_bgzf_fastq_paths[0]
+    stats = decompress.DecompressStats()
+    chunks = list(decompress.iter_bgzf_chunks(path, 3, stats))
+    with gzip.open(path, "rb") as inputf:
+        expected = inputf.read()
+    assert len(chunks) > 1
+    assert b"".join(chunks) == expected
+    assert stats.bytes_out == len(expected)
+
+
+def test_iter_bgzf_chunks_corrupt(tmp_path, synthetic_bgzf_fastq_paths):
+    with open(synthetic_bgzf_fastq_paths[0], "rb") as inputf:
+        data = bytearray(inputf.read())
+        inputf.seek(0)
+        offsets = [offset for offset, _, _ in decompress.iter_bgzf_blocks(inputf)]
+    # Flip a bit in the CRC32 of the second block.
+    corrupt = bytearray(data)
+    corrupt[offsets[2] - 8] ^= 1
+    path = tmp_path / "corrupt.fq.gz"
+    path.write_bytes(bytes(corrupt))
+    with pytest.raises(ValueError, match="offset %d" % offsets[1]):
+        list(decompress.iter_bgzf_chunks(str(path), 2))
+
+
+def test_iter_bgzf_chunks_missing_eof_block(tmp_path, synthetic_bgzf_fastq_paths, mocker):
+    with open(synthetic_bgzf_fastq_paths[0], "rb") as inputf:
+        data = inputf.read()
+        inputf.seek(0)
+        offsets = [offset for offset, _, _ in decompress.iter_bgzf_blocks(inputf)]
+    warning = mocker.patch.object(decompress.logger, "warning")
+    list(decompress.iter_bgzf_chunks(synthetic_bgzf_fastq_paths[0], 2))
+    assert not warning.called
+    # Cut the file after a complete block.
+    path = tmp_path / "truncated.fq.gz"
+    path.write_bytes(data[: offsets[2]])
+    chunks = list(decompress.iter_bgzf_chunks(str(path), 2))
+    assert chunks
+    assert warning.called
+
+
+def test_inflate_gzip_chunks_truncated(tmp_path, synthetic_fastq_paths):
+    with open(synthetic_fastq_paths[0], "rb") as inputf:
+        data = inputf.read()
+    path = tmp_path / "truncated.fq.gz"
+    path.write_bytes(data[: len(data) // 2])
+    with pytest.raises(EOFError):
+        list(decompress.inflate_gzip_chunks(str(path)))
+    with pytest.raises(EOFError):
+        list(readers.iter_fastq_sequences(readers.iter_raw_chunks(str(path))))
+    # Complete multi-member files are read to the end.
+    path.write_bytes(data + data)
+    chunks = list(decompress.inflate_gzip_chunks(str(path)))
+    with gzip.open(synthetic_fastq_paths[0], "rb") as inputf:
+        assert b"".join(chunks) == 2 * inputf.read()
+
+
+def test_find_bgzf_block(synthetic_bgzf_fastq_paths):
+    path = synthetic_bgzf_fastq_paths[0]
+    with open(path, "rb") as inputf:
+        offsets = [offset for offset, _, _ in decompress.iter_bgzf_blocks(inputf)]
+        assert decompress.find_bgzf_block(inputf, 0) == 0
+        assert decompress.find_bgzf_block(inputf, offsets[2] - 10) == offsets[2]
+        assert decompress.find_bgzf_block(inputf, offsets[2] + 1) == offsets[3]
+        assert decompress.find_bgzf_block(inputf, offsets[-1] + 1) is None
+
+
+def test_iter_sampled_chunks(synthetic_bgzf_fastq_paths):
+    path = synthetic_bgzf_fastq_paths[0]
+    whole = _pysam_sequences(path)
+    stats = decompress.DecompressStats()
+    sampled = list(
+        readers.iter_fastq_sequences(readers.iter_sampled_chunks(path, 4, 100, 2, stats))
+    )
+    assert len(sampled) == 400
+    assert len(set(sampled)) == 400
+    assert set(sampled) <= set(whole)
+    assert sampled[:100] == whole[:100]
+    assert stats.bytes_in < 0.5 * os.path.getsize(path)
+    # Chunks are cut short where the following chunk starts.
+    assert len(
+        list(readers.iter_fastq_sequences(readers.iter_sampled_chunks(path, 50, 10000)))
+    ) < len(whole)
+
+
+def test_iter_mmap_sequences(synthetic_plain_fastq_paths):
+    path = synthetic_plain_fastq_paths[0]
+    chunks = list(readers.iter_raw_chunks(path))
+    sequences = list(readers.iter_mmap_sequences(path))
+    assert all(isinstance(seq, memoryview) for seq in sequences)
+    assert [bytes(seq) for seq in sequences] == list(readers.iter_fastq_sequences(chunks))
+    assert [bytes(seq) for seq in readers.iter_mmap_sequences(path, 0.3)] == list(
+        readers.iter_fastq_sequences(chunks, 0.3)
+    )
+
+
+#: FASTA and multi-line FASTQ data that the FASTQ parsers reject.
+NOT_FASTQ = [
+    b">r1\nACGTACGTAC\n>r2\nGGGGCCCCAA\n>r3\nTTTT\n>r4\nAAAA\n",
+    b"@r1\nACGT\nACGT\n+\nIIII\nIIII\n@r2\nGGCC\n+\nIIII\n",
+    b"@r1\nACGT\n+\nIIII\n>r2\nGGCC\n",
+]
+
+
+@pytest.mark.parametrize("data", NOT_FASTQ)
+def test_iter_mmap_sequences_not_fastq(tmp_path, data):
+    path = tmp_path / "reads.fa"
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match="reads.fa"):
+        list(readers.iter_mmap_sequences(str(path)))
+
+
+def test_iter_mmap_sequences_edge_cases(tmp_path):
+    path = tmp_path / "reads.fq"
+    path.write_bytes(b"")
+    assert list(readers.iter_mmap_sequences(str(path))) == []
+    path.write_bytes(b"@r1\nACGT\n+\nIIII\n@r2\nGGCC\n+\nIIII")
+    assert list(map(bytes, readers.iter_mmap_sequences(str(path)))) == [b"ACGT", b"GGCC"]
+    path.write_bytes(b"@r1\nACGT\n+\nIII\n@r2\nGGCC\n+\nIIII\n")
+    with pytest.raises(ValueError):
+        list(readers.iter_mmap_sequences(str(path)))
+
+
+def test_use_mmap(synthetic_fastq_paths, synthetic_plain_fastq_paths):
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=None), sample_id="x", input_files=[], kmer_infos=None
+    )
+    assert readers.use_mmap(config, synthetic_plain_fastq_paths[0])
+    assert not readers.use_mmap(config, synthetic_fastq_paths[0])
+    config = attr.evolve(config, reader="sequential")
+    assert not readers.use_mmap(config, synthetic_plain_fastq_paths[0])
+    # Compressed files are read sequentially even if memory-mapping is requested.
+    config = attr.evolve(config, reader="mmap")
+    assert readers.use_mmap(config, synthetic_plain_fastq_paths[0])
+    assert not readers.use_mmap(config, synthetic_fastq_paths[0])
+
+
+def test_iter_fastq_sequences():
+    data = b"@r1\nACGT\n+\nIIII\n@r2\nGGCC\n+\nIIII\n@r3\nTTAA\n+\nIIII"
+    for size in (1, 3, 7, 100):
+        chunks = [data[i : i + size] for i in range(0, len(data), size)]
+        assert list(readers.iter_fastq_sequences(chunks)) == [b"ACGT", b"GGCC", b"TTAA"]
+
+
+@pytest.mark.parametrize("data", NOT_FASTQ)
+def test_iter_fastq_sequences_not_fastq(data):
+    with pytest.raises(ValueError, match="reads.fa"):
+        list(readers.iter_fastq_sequences([data], path="reads.fa"))
+
+
+def test_iter_fastq_sequences_headers(synthetic_lane_fastq_paths, tmp_path):
+    chunks = list(readers.iter_raw_chunks(synthetic_lane_fastq_paths[0]))
+    records = list(readers.iter_fastq_sequences(chunks, 0.5, headers=True))
+    assert [seq for _, seq in records] == list(readers.iter_fastq_sequences(chunks, 0.5))
+    assert records[0][0].startswith(b"@M1:7:FC1:")
+
+    path_plain = str(tmp_path / "lanes.fq")
+    with open(path_plain, "wb") as outputf:
+        outputf.write(b"".join(chunks))
+    mmap_records = readers.iter_mmap_sequences(path_plain, 0.5, headers=True)
+    assert [(header, bytes(seq)) for header, seq in mmap_records] == records
+
+
+def test_read_group():
+    assert readers.read_group(b"@M1:7:FC1:2:1101:5:1000 1:N:0") == "FC1-2"
+    assert readers.read_group(b"@HWI-ST1:3:1:5:1000/1") == "HWI-ST1-3"
+    assert readers.read_group(b"@read1/1") == readers.UNKNOWN_READ_GROUP
+
+
+def test_sample_mask_keeps_mates_together():
+    headers = [b"@read%d/1 extra" % i for i in range(10000)]
+    mates = [b"@read%d/2" % i for i in range(10000)]
+    mask = readers.sample_mask(headers, 0.25)
+    assert mask.tolist() == readers.sample_mask(mates, 0.25).tolist()
+    assert 2200 < mask.sum() < 2800
+    assert readers.sample_mask(headers, 1.0).all()
+
+
+def test_iter_fastq_sequences_sampled(synthetic_fastq_paths):
+    chunks = list(readers.iter_raw_chunks(synthetic_fastq_paths[0]))
+    whole = list(readers.iter_fastq_sequences(chunks))
+    sampled = list(readers.iter_fastq_sequences(chunks, 0.5))
+    assert sampled == list(readers.iter_fastq_sequences(chunks, 0.5))
+    assert 0.45 * len(whole) < len(sampled) < 0.55 * len(whole)
+    assert set(sampled) <= set(whole)
+
+
+def test_iter_raw_chunks_gzip_and_bgzf(synthetic_fastq_paths, synthetic_bgzf_fastq_paths):
+    expected = _pysam_sequences(synthetic_fastq_paths[0])
+    for path in (synthetic_fastq_paths[0], synthetic_bgzf_fastq_paths[0]):
+        chunks = readers.iter_raw_chunks(path, 2)
+        assert list(readers.iter_fastq_sequences(chunks)) == expected
+
+
+def test_split_inputs_bgzf_parts(synthetic_fastq_paths, synthetic_bgzf_fastq_paths):
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=None),
+        sample_id="synthetic",
+        input_files=synthetic_bgzf_fastq_paths[:1],
+        kmer_infos=None,
+        num_procs=3,
+    )
+    chunks = readers.split_inputs(config)
+    assert [(chunk.part, chunk.num_parts) for chunk in chunks] == [(0, 3), (1, 3), (2, 3)]
+    # Plain gzip files are not split.
+    config = attr.evolve(config, input_files=synthetic_fastq_paths[:1])
+    assert [chunk.num_parts for chunk in readers.split_inputs(config)] == [1]
+
+
+@pytest.mark.parametrize("num_parts", [1, 2, 3, 7, 100])
+def test_iter_bgzf_part_chunks(synthetic_bgzf_fastq_paths, num_parts):
+    path = synthetic_bgzf_fastq_paths[0]
+    whole = list(readers.iter_fastq_sequences(readers.iter_raw_chunks(path)))
+    parts, bytes_in = [], 0
+    for part in range(num_parts):
+        stats = decompress.DecompressStats()
+        chunks = readers.iter_bgzf_part_chunks(path, part, num_parts, 2, stats)
+        parts.append(list(readers.iter_fastq_sequences(chunks)))
+        bytes_in += stats.bytes_in
+    assert list(itertools.chain(*parts)) == whole
+    if num_parts <= 7:
+        assert all(len(part) < len(whole) for part in parts[: num_parts - 1] if num_parts > 1)
+    # Each part only inflates its own blocks and the ones its last record extends into.
+    assert bytes_in < 1.1 * os.path.getsize(path) + num_parts * 65536
+
+
+def _bgzf_block(data):
+    deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+    payload = deflate.compress(data) + deflate.flush()
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+    trailer = struct.pack("<II", zlib.crc32(data), len(data))
+    return header + struct.pack("<H", len(header) + 2 + len(payload) + 7) + payload + trailer
+
+
+def test_iter_bgzf_part_chunks_small_blocks(tmp_path):
+    # Quality lines starting with "@" and "+", records spanning many tiny blocks.
+    records = [
+        b"@r%d\n%s\n+\n%s\n" % (i, b"ACGT"[i % 4 :] * 10, (b"@+" if i % 2 else b"+@") * 20)
+        for i in range(300)
+    ]
+    data = b"".join(records)
+    path = tmp_path / "reads.fq.gz"
+    path.write_bytes(
+        b"".join(_bgzf_block(data[i : i + 37]) for i in range(0, len(data), 37)) + _bgzf_block(b"")
+    )
+    whole = list(readers.iter_fastq_sequences([data]))
+    for num_parts in (2, 5, 13, 64):
+        parts = [
+            list(
+                readers.iter_fastq_sequences(readers.iter_bgzf_part_chunks(str(path), i, num_parts))
+            )
+            for i in range(num_parts)
+        ]
+        assert list(itertools.chain(*parts)) == whole
+
+
+@pytest.mark.parametrize("sample_fraction", [None, 0.5])
+def test_iter_bgzf_part_chunks_resume(tmp_path, sample_fraction):
+    records = [b"@r%d\n%s\n+\n%s\n" % (i, b"ACGT" * 10, b"I" * 40) for i in range(300)]
+    data = b"".join(records)
+    path = tmp_path / "reads.fq.gz"
+    path.write_bytes(
+        b"".join(_bgzf_block(data[i : i + 37]) for i in range(0, len(data), 37)) + _bgzf_block(b"")
+    )
+
+    def read_part(part, num_parts, start=None):
+        position = readers.VirtualOffset()
+        chunks = readers.iter_bgzf_part_chunks(
+            str(path), part, num_parts, start=start, offsets=True
+        )
+        return [
+            (seq, attr.evolve(position))
+            for seq in readers.iter_fastq_sequences(chunks, sample_fraction, position=position)
+        ]
+
+    for num_parts in (1, 5, 13):
+        for part in range(num_parts):
+            expected = read_part(part, num_parts)
+            # Reading from the offset following a record yields the records after it.
+            for i, (_, position) in enumerate(expected):
+                assert read_part(part, num_parts, position) == expected[i + 1 :]
+
+
+def _write_fifo(path, data):
+    with open(path, "wb") as outputf:
+        outputf.write(data)
+
+
+@pytest.mark.parametrize("fixture", ["synthetic_fastq_paths", "synthetic_bgzf_fastq_paths"])
+def test_iter_raw_chunks_fifo(request, tmp_path, synthetic_plain_fastq_paths, fixture):
+    with open(request.getfixturevalue(fixture)[0], "rb") as inputf:
+        data = inputf.read()
+    for payload in (data, open(synthetic_plain_fastq_paths[0], "rb").read()):
+        path = str(tmp_path / "reads.fifo")
+        os.mkfifo(path)
+        writer = threading.Thread(target=_write_fifo, args=(path, payload))
+        writer.start()
+        assert readers.is_stream(path)
+        chunks = list(readers.iter_raw_chunks(path, 2))
+        writer.join()
+        os.unlink(path)
+        assert list(readers.iter_fastq_sequences(chunks)) == _pysam_sequences(
+            synthetic_plain_fastq_paths[0]
+        )
+
+
+def test_iter_raw_chunks_stdin(monkeypatch, synthetic_fastq_paths):
+    with open(synthetic_fastq_paths[0], "rb") as inputf:
+        monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(inputf.read())))
+    chunks = list(readers.iter_raw_chunks(readers.STDIN_PATH))
+    assert list(readers.iter_fastq_sequences(chunks)) == _pysam_sequences(synthetic_fastq_paths[0])
+
+
+def test_split_inputs_streams(synthetic_bgzf_fastq_paths):
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=None),
+        sample_id="x",
+        input_files=[readers.STDIN_PATH, synthetic_bgzf_fastq_paths[0]],
+        kmer_infos=None,
+        num_procs=4,
+    )
+    assert [(chunk.path, chunk.num_parts) for chunk in readers.split_inputs(config)] == [
+        (readers.STDIN_PATH, 1)
+    ] + [(synthetic_bgzf_fastq_paths[0], 2)] * 2
+    assert not readers.use_mmap(attr.evolve(config, reader="mmap"), readers.STDIN_PATH)
+
+
+def test_iter_alignment_sequences(synthetic_plain_fastq_paths, synthetic_bam_path):
+    assert readers.is_alignment_file(synthetic_bam_path)
+    assert not readers.is_alignment_file(synthetic_plain_fastq_paths[0])
+    sequences = list(readers.iter_alignment_sequences(synthetic_bam_path, 2))
+    expected = _pysam_sequences(synthetic_plain_fastq_paths[0])
+    assert sequences[:2] == expected[:1] + [revcomp(expected[1].decode()).encode()]
+    assert len(sequences) == 2 * len(expected)
+    sampled = readers.iter_alignment_sequences(synthetic_bam_path, sample_fraction=0.5)
+    expected_sampled = []
+    for path in synthetic_plain_fastq_paths:
+        with open(path, "rb") as inputf:
+            expected_sampled += readers.iter_fastq_sequences([inputf.read()], 0.5)
+    canonical = lambda seq: min(seq, revcomp(seq.decode()).encode())  # noqa: E731
+    assert list(map(canonical, sampled)) == list(map(canonical, expected_sampled))
+
+
+def test_split_inputs_paired(synthetic_fastq_paths, synthetic_bam_path):
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=None),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=None,
+        paired=True,
+        num_procs=2,
+    )
+    chunks = readers.split_inputs(config)
+    assert [(chunk.paths, chunk.part, chunk.num_parts) for chunk in chunks] == [
+        (synthetic_fastq_paths, 0, 1),
+    ]
+    for input_files in (
+        synthetic_fastq_paths[:1],
+        [readers.STDIN_PATH, synthetic_fastq_paths[1]],
+        [synthetic_bam_path, synthetic_fastq_paths[1]],
+    ):
+        with pytest.raises(ValueError):
+            readers.split_inputs(attr.evolve(config, input_files=input_files))
+
+
+def test_iter_mate_pairs(synthetic_fastq_paths, synthetic_lane_fastq_paths):
+    for paths in (synthetic_fastq_paths, synthetic_lane_fastq_paths):
+        chunk = readers.InputChunk(path=paths[0], mate_path=paths[1])
+        records = [_pysam_records(path) for path in chunk.paths]
+        pairs = list(readers.iter_mate_pairs(*records, chunk))
+        assert pairs == [
+            (header, (seq, mate_seq)) for (header, seq), (_, mate_seq) in zip(*records)
+        ]
+    with pytest.raises(ValueError, match="different numbers"):
+        list(readers.iter_mate_pairs(records[0], records[1][:-1], chunk))
+    # Same number of reads, but one R2 record missing and another one added at the end.
+    with pytest.raises(ValueError, match="out of sync at read 3"):
+        shifted = records[1][:2] + records[1][3:] + records[1][2:3]
+        list(readers.iter_mate_pairs(records[0], shifted, chunk))
@@ -43,7 +43,14 @@ def test_bam_extract_run_smoke_test(tmp_path):
         "reference": "A",
         "alternative": "T",
     }
-    assert data["site_stats"][1]["stats"] == {"genotype": "1/1", "total_cov": 76, "alt_cov": 73}
+    stats = data["site_stats"][1]["stats"]
+    assert {key: stats[key] for key in ("genotype", "total_cov", "alt_cov")} == {
+        "genotype": "1/1",
+        "total_cov": 76,
+        "alt_cov": 73,
+    }
+    assert stats["alt_count"] == 73
+    assert stats["ref_count"] + stats["alt_count"] <= stats["total_cov"]
 
 
 def test_bam_extract_via_args(mocker):
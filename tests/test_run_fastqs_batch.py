@@ -0,0 +1,141 @@
+"""Test for ``fastq-extract-batch``"""
+
+import json
+
+import pytest
+
+from qctk.config import (
+    CommonConfig,
+    StorageEngine,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHECKPOINT_READS,
+    DEFAULT_CHUNK_RECORDS,
+    DEFAULT_DECOMPRESS_THREADS,
+    DEFAULT_METRICS_SECONDS,
+    DEFAULT_MIN_COV,
+    DEFAULT_MINIMIZER_LENGTH,
+    DEFAULT_MINIMIZER_WINDOW,
+    DEFAULT_QUEUE_DEPTH,
+    DEFAULT_SAMPLE_CHUNKS,
+    DEFAULT_THRESHOLD,
+)
+from qctk.common import GenomeRelease
+from qctk.fastq import batch
+from qctk.fastq.config import (
+    FastqExtractBatchConfig,
+    DEFAULT_KMER_ENGINE,
+    DEFAULT_READER_STRATEGY,
+)
+from qctk.models import vcf
+from qctk.__main__ import main
+
+from .conftest import SYNTHETIC_GENOTYPES
+
+
+def test_fastq_extract_batch_via_args(mocker):
+    mocker.patch.object(batch, "fastq_extract_batch_run")
+    main(
+        [
+            "--storage-path",
+            "/path/storage",
+            "fastq-extract-batch",
+            "--sample-sheet",
+            "/path/samples.tsv",
+        ]
+    )
+    batch.fastq_extract_batch_run.assert_called_once_with(
+        FastqExtractBatchConfig(
+            common=CommonConfig(
+                storage_path="/path/storage",
+                verbose=False,
+                quiet=False,
+                storage_engine=StorageEngine.AUTO,
+                reference=None,
+            ),
+            sample_sheet="/path/samples.tsv",
+            kmer_infos=[],
+            genome_release=[GenomeRelease.GRCH37.value],
+            threshold=DEFAULT_THRESHOLD,
+            engine=DEFAULT_KMER_ENGINE.value,
+            mismatches=0,
+            paired=False,
+            batch_size=DEFAULT_BATCH_SIZE,
+            num_procs=1,
+            decompress_threads=DEFAULT_DECOMPRESS_THREADS,
+            queue_depth=DEFAULT_QUEUE_DEPTH,
+            count_threads=1,
+            minimizer_prefilter=False,
+            minimizer_length=DEFAULT_MINIMIZER_LENGTH,
+            minimizer_window=DEFAULT_MINIMIZER_WINDOW,
+            sample_fraction=None,
+            reader=DEFAULT_READER_STRATEGY.value,
+            sample_chunks=DEFAULT_SAMPLE_CHUNKS,
+            chunk_records=DEFAULT_CHUNK_RECORDS,
+            metrics_seconds=DEFAULT_METRICS_SECONDS,
+            partition_by=None,
+            min_cov=DEFAULT_MIN_COV,
+            saturation_fraction=None,
+            stable_checkpoints=None,
+            checkpoint_reads=DEFAULT_CHECKPOINT_READS,
+            checkpoint_seconds=None,
+            resume=False,
+        )
+    )
+
+
+def test_read_sample_sheet(tmp_path):
+    path = tmp_path / "samples.tsv"
+    path.write_text("sample_id\tpaths\n# comment\n\nS1\ta_1.fq.gz\ta_2.fq.gz\nS2\tb.bam\n")
+    assert batch.read_sample_sheet(str(path)) == [
+        ("S1", ["a_1.fq.gz", "a_2.fq.gz"]),
+        ("S2", ["b.bam"]),
+    ]
+    for content in ("S1\n", "S1\ta.fq\nS1\tb.fq\n", "S1\t-\n"):
+        path.write_text(content)
+        with pytest.raises(ValueError):
+            batch.read_sample_sheet(str(path))
+
+
+@pytest.mark.parametrize("num_procs", [1, 2])
+def test_fastq_extract_batch_run(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths, synthetic_bam_path, num_procs
+):
+    path_storage = tmp_path / "storage"
+    path_sheet = tmp_path / "samples.tsv"
+    path_sheet.write_text(
+        "S1\t%s\nS2\t%s\n" % ("\t".join(synthetic_fastq_paths), synthetic_bam_path)
+    )
+    config = FastqExtractBatchConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_sheet=str(path_sheet),
+        kmer_infos=synthetic_kmer_infos_path,
+        num_procs=num_procs,
+    )
+    assert batch.fastq_extract_batch_run(config) == 0
+
+    expected = [SYNTHETIC_GENOTYPES[i % len(SYNTHETIC_GENOTYPES)].value for i in range(49)]
+    num_reads = set()
+    for sample_id in ("S1", "S2"):
+        with vcf.sample_path(str(path_storage), sample_id).open("rt") as jsonf:
+            data = json.load(jsonf)
+        assert data["sample"]["name"] == sample_id
+        genotypes = [site_stats["stats"]["genotype"] for site_stats in data["site_stats"]]
+        assert sum(a == b for a, b in zip(genotypes, expected)) >= 45
+        num_reads.add(data["num_reads"])
+    assert len(num_reads) == 1
+
+
+def test_fastq_extract_batch_run_failed_sample(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths
+):
+    path_storage = tmp_path / "storage"
+    path_sheet = tmp_path / "samples.tsv"
+    path_sheet.write_text("S1\t%s\nS2\t%s\n" % (synthetic_fastq_paths[0], tmp_path / "missing"))
+    config = FastqExtractBatchConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_sheet=str(path_sheet),
+        kmer_infos=synthetic_kmer_infos_path,
+    )
+    assert batch.fastq_extract_batch_run(config) == 1
+    assert vcf.sample_path(str(path_storage), "S1").exists()
+    assert not vcf.sample_path(str(path_storage), "S2").exists()
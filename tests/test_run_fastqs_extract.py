@@ -1,14 +1,45 @@
 """Test for ``fastq-extract``"""
 
+import gzip
 import hashlib
+import io
 import json
+import os
+import sys
 
-from qctk.config import CommonConfig, StorageEngine, DEFAULT_THRESHOLD
-from qctk.common import GenomeRelease
-from qctk.fastq import extract
-from qctk.fastq.config import FastqExtractConfig
+import attr
+import numpy as np
+import pysam
+import pytest
+
+from qctk.config import (
+    CommonConfig,
+    StorageEngine,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHECKPOINT_READS,
+    DEFAULT_CHUNK_RECORDS,
+    DEFAULT_DECOMPRESS_THREADS,
+    DEFAULT_METRICS_SECONDS,
+    DEFAULT_MIN_COV,
+    DEFAULT_MINIMIZER_LENGTH,
+    DEFAULT_MINIMIZER_WINDOW,
+    DEFAULT_QUEUE_DEPTH,
+    DEFAULT_SAMPLE_CHUNKS,
+    DEFAULT_THRESHOLD,
+)
+from qctk.common import GenomeRelease, revcomp
+from qctk.fastq import checkpoint, extract, metrics
+from qctk.fastq.config import (
+    FastqExtractConfig,
+    KmerEngine,
+    DEFAULT_KMER_ENGINE,
+    DEFAULT_READER_STRATEGY,
+)
+from qctk.models import fastq, vcf
 from qctk.__main__ import main
 
+from .conftest import SYNTHETIC_GENOTYPES
+
 
 def test_fastq_extract_run_smoke_test(tmp_path, small_kmers_info_path):
     path_storage = tmp_path / "storage"
@@ -37,7 +68,7 @@ def test_fastq_extract_run_smoke_test(tmp_path, small_kmers_info_path):
     assert output_path.exists()
     with output_path.open("rt") as jsonf:
         data = json.load(jsonf)
-    assert len(data) == 2
+    assert len(data) == 4
     assert len(data["site_stats"]) == 84
     assert data["site_stats"][1]["site"] == {
         "genome_release": "test-small",
@@ -46,7 +77,53 @@ def test_fastq_extract_run_smoke_test(tmp_path, small_kmers_info_path):
         "reference": "A",
         "alternative": "T",
     }
-    assert data["site_stats"][1]["stats"] == {"genotype": "1/1", "total_cov": 29, "alt_cov": 29}
+    # The 29 forward-strand reads of the baseline all carry the alternative allele, counting the
+    # reverse strand too can only add to them.  Exact depths are checked on synthetic reads in
+    # ``test_fastq_extract_run_both_strands``.
+    stats = data["site_stats"][1]["stats"]
+    assert stats["genotype"] == "1/1"
+    assert stats["total_cov"] == stats["alt_cov"] >= 29
+    # Without subsampling, the raw allele counts are the depths.
+    assert stats["ref_count"] + stats["alt_count"] == stats["total_cov"]
+    assert stats["alt_count"] == stats["alt_cov"]
+
+
+def test_fastq_extract_run_both_strands(tmp_path, synthetic_kmer_infos, synthetic_kmer_infos_path):
+    with pysam.FastaFile("tests/data/small/ref.fasta") as fastaf:
+        seq = fastaf.fetch("contig")
+    site = synthetic_kmer_infos[0].site
+    ref_read = seq[site.position - 41 : site.position + 40]
+    alt_read = ref_read[:40] + site.alternative + ref_read[41:]
+    # Forward and reverse reads of each allele, at a single site.
+    reads = [ref_read] * 7 + [revcomp(ref_read)] * 5 + [alt_read] * 4 + [revcomp(alt_read)] * 6
+    path_reads = tmp_path / "reads" / "strands.fq"
+    path_reads.parent.mkdir()
+    with path_reads.open("wt") as outputf:
+        for i, read in enumerate(reads):
+            print("@read%d\n%s\n+\n%s" % (i, read, "I" * len(read)), file=outputf)
+    path_storage = tmp_path / "storage"
+
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="strands",
+        input_files=[str(path_reads)],
+        kmer_infos=synthetic_kmer_infos_path,
+        genome_release="test-small",
+    )
+    assert extract.fastq_extract_run(config) == 0
+
+    with vcf.sample_path(str(path_storage), "strands").open("rt") as jsonf:
+        data = json.load(jsonf)
+    assert data["num_reads"] == 22
+    assert data["site_stats"][0]["site"]["position"] == site.position
+    assert data["site_stats"][0]["stats"] == {
+        "genotype": "0/1",
+        "total_cov": 22,
+        "alt_cov": 10,
+        "ref_count": 12,
+        "alt_count": 10,
+    }
+    assert all(s["stats"]["total_cov"] == 0 for s in data["site_stats"][1:])
 
 
 def test_fastq_extract_via_args(mocker):
@@ -73,8 +150,458 @@ def test_fastq_extract_via_args(mocker):
             ),
             input_files=["/path/input.fastq.gz"],
             sample_id="test-sample",
-            kmer_infos=None,
-            genome_release=GenomeRelease.GRCH37.value,
+            kmer_infos=[],
+            genome_release=[GenomeRelease.GRCH37.value],
             threshold=DEFAULT_THRESHOLD,
+            engine=DEFAULT_KMER_ENGINE.value,
+            mismatches=0,
+            paired=False,
+            batch_size=DEFAULT_BATCH_SIZE,
+            num_procs=1,
+            decompress_threads=DEFAULT_DECOMPRESS_THREADS,
+            queue_depth=DEFAULT_QUEUE_DEPTH,
+            count_threads=1,
+            minimizer_prefilter=False,
+            minimizer_length=DEFAULT_MINIMIZER_LENGTH,
+            minimizer_window=DEFAULT_MINIMIZER_WINDOW,
+            sample_fraction=None,
+            reader=DEFAULT_READER_STRATEGY.value,
+            sample_chunks=DEFAULT_SAMPLE_CHUNKS,
+            chunk_records=DEFAULT_CHUNK_RECORDS,
+            metrics_seconds=DEFAULT_METRICS_SECONDS,
+            partition_by=None,
+            min_cov=DEFAULT_MIN_COV,
+            saturation_fraction=None,
+            stable_checkpoints=None,
+            checkpoint_reads=DEFAULT_CHECKPOINT_READS,
+            checkpoint_seconds=None,
+            resume=False,
         )
     )
+
+
+@pytest.mark.parametrize(
+    "engine,num_procs", [(e.value, 1) for e in KmerEngine] + [(KmerEngine.BATCH.value, 3)]
+)
+def test_fastq_extract_run_synthetic(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths, engine, num_procs
+):
+    path_storage = tmp_path / "storage"
+
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        genome_release="test-small",
+        engine=engine,
+        num_procs=num_procs,
+    )
+    res = extract.fastq_extract_run(config)
+
+    assert res == 0
+    with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        data = json.load(jsonf)
+    genotypes = [site_stats["stats"]["genotype"] for site_stats in data["site_stats"]]
+    assert len(genotypes) == 49
+    expected = [SYNTHETIC_GENOTYPES[i % len(SYNTHETIC_GENOTYPES)].value for i in range(49)]
+    assert sum(a == b for a, b in zip(genotypes, expected)) >= 45
+
+
+def test_fastq_extract_run_bgzf_parts(
+    tmp_path, synthetic_kmer_infos_path, synthetic_bgzf_fastq_paths
+):
+    results = []
+    for num_procs in (1, 3):
+        path_storage = tmp_path / ("storage-%d" % num_procs)
+        config = FastqExtractConfig(
+            common=CommonConfig(storage_path=str(path_storage)),
+            sample_id="synthetic",
+            input_files=synthetic_bgzf_fastq_paths,
+            kmer_infos=synthetic_kmer_infos_path,
+            genome_release="test-small",
+            num_procs=num_procs,
+        )
+        assert extract.fastq_extract_run(config) == 0
+        with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+            data = json.load(jsonf)
+        results.append((data["num_reads"], data["site_stats"]))
+
+    # Splitting the BGZF files by block offsets reads each record exactly once.
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("num_procs", [1, 2])
+def test_fastq_extract_run_saturation(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths, num_procs
+):
+    path_storage = tmp_path / "storage"
+
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        genome_release="test-small",
+        num_procs=num_procs,
+        saturation_fraction=0.5,
+        checkpoint_reads=1000,
+    )
+    res = extract.fastq_extract_run(config)
+
+    assert res == 0
+    with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        data = json.load(jsonf)
+    assert data["stop_condition"] == "coverage"
+    assert 0 < data["num_reads"] < 2 * 9900
+
+
+def test_fastq_extract_run_sample_fraction(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths
+):
+    depths = {}
+    for sample_fraction in (None, 0.5):
+        path_storage = tmp_path / str(sample_fraction)
+        config = FastqExtractConfig(
+            common=CommonConfig(storage_path=str(path_storage)),
+            sample_id="synthetic",
+            input_files=synthetic_fastq_paths,
+            kmer_infos=synthetic_kmer_infos_path,
+            sample_fraction=sample_fraction,
+        )
+        assert extract.fastq_extract_run(config) == 0
+        with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+            data = json.load(jsonf)
+        depths[sample_fraction] = sum(s["stats"]["total_cov"] for s in data["site_stats"])
+        if sample_fraction:
+            assert 0.45 * 2 * 9900 < data["num_reads"] < 0.55 * 2 * 9900
+            # The raw allele counts are not scaled to the full input.
+            counts = sum(
+                s["stats"]["ref_count"] + s["stats"]["alt_count"] for s in data["site_stats"]
+            )
+            assert 0.45 < counts / depths[sample_fraction] < 0.55
+    assert 0.9 < depths[0.5] / depths[None] < 1.1
+
+
+def test_fastq_extract_run_chunks_reader(
+    tmp_path, synthetic_kmer_infos_path, synthetic_bgzf_fastq_paths
+):
+    path_storage = tmp_path / "storage"
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_bgzf_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        reader="chunks",
+        sample_chunks=4,
+        chunk_records=1000,
+    )
+    assert extract.fastq_extract_run(config) == 0
+    with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        data = json.load(jsonf)
+    assert data["num_reads"] == 2 * 4 * 1000
+    assert sum(s["stats"]["total_cov"] for s in data["site_stats"]) > 0
+
+
+def test_fastq_extract_run_mmap_reader_gzip(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths, synthetic_plain_fastq_paths
+):
+    results = []
+    for input_files in (synthetic_fastq_paths, synthetic_plain_fastq_paths):
+        path_storage = tmp_path / ("storage-%d" % len(results))
+        config = FastqExtractConfig(
+            common=CommonConfig(storage_path=str(path_storage)),
+            sample_id="synthetic",
+            input_files=input_files,
+            kmer_infos=synthetic_kmer_infos_path,
+            reader="mmap",
+        )
+        # The gzip files are read sequentially.
+        assert extract.fastq_extract_run(config) == 0
+        with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+            results.append(json.load(jsonf)["site_stats"])
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("num_procs", [1, 2])
+def test_fastq_extract_run_stdin(
+    tmp_path, monkeypatch, synthetic_kmer_infos_path, synthetic_fastq_paths, num_procs
+):
+    with open(synthetic_fastq_paths[0], "rb") as inputf:
+        monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(inputf.read())))
+    path_storage = tmp_path / "storage"
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=["-", synthetic_fastq_paths[1]],
+        kmer_infos=synthetic_kmer_infos_path,
+        num_procs=num_procs,
+    )
+    assert extract.fastq_extract_run(config) == 0
+    with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        data = json.load(jsonf)
+    num_lines = 0
+    for path in synthetic_fastq_paths:
+        with gzip.open(path, "rb") as inputf:
+            num_lines += sum(1 for _ in inputf)
+    assert data["num_reads"] == num_lines // 4
+
+    config = attr.evolve(config, input_files=["-", "-"])
+    assert extract.fastq_extract_run(config) == 1
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [
+        {"batch_size": 0},
+        {"batch_size": -1},
+        {"decompress_threads": 0},
+        {"queue_depth": 0},
+        {"count_threads": 0},
+        {"minimizer_prefilter": True, "minimizer_window": 10},
+        {"minimizer_prefilter": True, "minimizer_length": 0},
+        {"paired": True, "reader": "chunks"},
+        {"reader": "chunks", "sample_chunks": 0},
+        {"reader": "chunks", "chunk_records": -1},
+        {"saturation_fraction": 0.0},
+        {"saturation_fraction": 1.5},
+        {"stable_checkpoints": 0},
+    ],
+)
+def test_fastq_extract_run_invalid_counting_arguments(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths, arguments
+):
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(tmp_path / "storage")),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        **arguments,
+    )
+    assert extract.fastq_extract_run(config) == 1
+    assert not vcf.sample_path(str(tmp_path / "storage"), "synthetic").exists()
+
+
+def test_fastq_extract_run_bam(tmp_path, synthetic_kmer_infos_path, synthetic_bam_path):
+    path_storage = tmp_path / "storage"
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=[synthetic_bam_path],
+        kmer_infos=synthetic_kmer_infos_path,
+        num_procs=2,
+    )
+    assert extract.fastq_extract_run(config) == 0
+    with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        data = json.load(jsonf)
+    genotypes = [site_stats["stats"]["genotype"] for site_stats in data["site_stats"]]
+    expected = [SYNTHETIC_GENOTYPES[i % len(SYNTHETIC_GENOTYPES)].value for i in range(49)]
+    assert sum(a == b for a, b in zip(genotypes, expected)) >= 45
+
+
+def test_fastq_extract_run_resume(tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths):
+    path_storage = tmp_path / "storage"
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        num_procs=2,
+    )
+    assert extract.fastq_extract_run(config) == 0
+    with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        expected = json.load(jsonf)
+
+    config = attr.evolve(config, checkpoint_seconds=0.0, resume=True)
+    assert extract.fastq_extract_run(config) == 0
+    with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        assert json.load(jsonf) == expected
+    assert not checkpoint.checkpoint_dir(config).exists()
+
+
+def test_fastq_extract_run_mismatches(tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths):
+    depths = {}
+    for engine, mismatches in (("batch", 0), ("batch", 1), ("aho-corasick", 1)):
+        path_storage = tmp_path / engine / str(mismatches)
+        config = FastqExtractConfig(
+            common=CommonConfig(storage_path=str(path_storage)),
+            sample_id="synthetic",
+            input_files=synthetic_fastq_paths,
+            kmer_infos=synthetic_kmer_infos_path,
+            engine=engine,
+            mismatches=mismatches,
+        )
+        assert extract.fastq_extract_run(config) == 0
+        with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+            data = json.load(jsonf)
+        depths[engine, mismatches] = [s["stats"]["total_cov"] for s in data["site_stats"]]
+    assert depths["batch", 1] == depths["aho-corasick", 1]
+    assert all(a >= b for a, b in zip(depths["batch", 1], depths["batch", 0]))
+    assert sum(depths["batch", 1]) > sum(depths["batch", 0])
+
+
+def test_fastq_extract_run_metrics(tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths):
+    path_storage = tmp_path / "storage"
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        num_procs=2,
+        metrics_seconds=0.0,
+    )
+    assert extract.fastq_extract_run(config) == 0
+    with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        data = json.load(jsonf)
+    with metrics.metrics_path(str(path_storage), "synthetic").open("rt") as jsonf:
+        run_metrics = json.load(jsonf)
+
+    run = run_metrics["run"]
+    assert run["num_reads"] == data["num_reads"]
+    assert run["num_bases"] == 100 * run["num_reads"]
+    assert run["num_windows"] == (100 - 20) * run["num_reads"]
+    assert run["num_hits"] == sum(s["stats"]["total_cov"] for s in data["site_stats"])
+    assert run["bytes_in"] == sum(os.path.getsize(path) for path in synthetic_fastq_paths)
+    assert run["reads_per_second"] > 0
+    assert run["peak_rss_bytes"] > 0
+    assert sorted(chunk["path"] for chunk in run_metrics["files"]) == sorted(synthetic_fastq_paths)
+    assert sum(chunk["num_reads"] for chunk in run_metrics["files"]) == run["num_reads"]
+
+
+@pytest.mark.parametrize("num_procs", [1, 2])
+def test_fastq_extract_run_paired(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths, synthetic_bam_path, num_procs
+):
+    results = {}
+    for paired in (False, True):
+        path_storage = tmp_path / str(paired)
+        config = FastqExtractConfig(
+            common=CommonConfig(storage_path=str(path_storage)),
+            sample_id="synthetic",
+            input_files=synthetic_fastq_paths,
+            kmer_infos=synthetic_kmer_infos_path,
+            paired=paired,
+            num_procs=num_procs,
+            checkpoint_seconds=0.0 if paired else None,
+        )
+        assert extract.fastq_extract_run(config) == 0
+        with vcf.sample_path(str(path_storage), "synthetic").open("rt") as jsonf:
+            results[paired] = json.load(jsonf)
+    # The mates of the synthetic fragments do not overlap, so no marker k-mer is deduplicated.
+    assert results[True] == results[False]
+
+    config = attr.evolve(config, input_files=synthetic_fastq_paths[:1])
+    assert extract.fastq_extract_run(config) == 1
+    config = attr.evolve(config, input_files=[synthetic_bam_path, synthetic_fastq_paths[1]])
+    assert extract.fastq_extract_run(config) == 1
+
+
+def test_fastq_extract_run_panels(
+    tmp_path, synthetic_kmer_infos, synthetic_kmer_infos_path, synthetic_fastq_paths
+):
+    # A second panel holds every other site under another genome release.
+    path_other = tmp_path / "kmers" / "other.tsv"
+    fastq.write_kmer_infos(
+        [
+            attr.evolve(kmer_info, site=attr.evolve(kmer_info.site, genome_release="test-other"))
+            for kmer_info in synthetic_kmer_infos[::2]
+        ],
+        path=path_other,
+    )
+    path_storage = tmp_path / "storage"
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+    )
+    assert extract.fastq_extract_run(config) == 0
+    config = attr.evolve(config, kmer_infos=[synthetic_kmer_infos_path, str(path_other)])
+    assert extract.fastq_extract_run(config) == 0
+
+    data = {}
+    for sample_id in ("synthetic", "synthetic.test-small", "synthetic.test-other"):
+        with vcf.sample_path(str(path_storage), sample_id).open("rt") as jsonf:
+            data[sample_id] = json.load(jsonf)
+    assert data["synthetic.test-small"]["site_stats"] == data["synthetic"]["site_stats"]
+    assert data["synthetic.test-small"]["num_reads"] == data["synthetic"]["num_reads"]
+    other = data["synthetic.test-other"]["site_stats"]
+    assert {s["site"]["genome_release"] for s in other} == {"test-other"}
+    assert [s["stats"] for s in other] == [s["stats"] for s in data["synthetic"]["site_stats"][::2]]
+
+    config = attr.evolve(config, kmer_infos=[synthetic_kmer_infos_path] * 2)
+    assert extract.fastq_extract_run(config) == 1
+
+
+def _read_partition_stats(path_storage, sample_ids):
+    result = {}
+    for sample_id in sample_ids:
+        with vcf.sample_path(str(path_storage), sample_id).open("rt") as jsonf:
+            data = json.load(jsonf)
+        result[sample_id] = (
+            data["num_reads"],
+            np.array([s["stats"]["total_cov"] for s in data["site_stats"]]),
+        )
+    return result
+
+
+@pytest.mark.parametrize("num_procs", [1, 2])
+def test_fastq_extract_run_partition_by_file(
+    tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths, num_procs
+):
+    path_storage = tmp_path / "storage"
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        num_procs=num_procs,
+        partition_by="file",
+    )
+    assert extract.fastq_extract_run(config) == 0
+    stats = _read_partition_stats(
+        path_storage, ["synthetic", "synthetic.synthetic_1", "synthetic.synthetic_2"]
+    )
+    assert stats["synthetic.synthetic_1"][0] == stats["synthetic.synthetic_2"][0]
+    assert stats["synthetic"][0] == 2 * stats["synthetic.synthetic_1"][0]
+    assert (
+        stats["synthetic"][1]
+        == stats["synthetic.synthetic_1"][1] + stats["synthetic.synthetic_2"][1]
+    ).all()
+
+
+@pytest.mark.parametrize("paired,checkpoint_seconds", [(False, None), (True, 0.0)])
+def test_fastq_extract_run_partition_by_read_group(
+    tmp_path, synthetic_kmer_infos_path, synthetic_lane_fastq_paths, paired, checkpoint_seconds
+):
+    path_storage = tmp_path / "storage"
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_lane_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        paired=paired,
+        count_threads=2,
+        partition_by="read-group",
+        checkpoint_seconds=checkpoint_seconds,
+    )
+    assert extract.fastq_extract_run(config) == 0
+    stats = _read_partition_stats(path_storage, ["synthetic", "synthetic.FC1-1", "synthetic.FC1-2"])
+    assert stats["synthetic"][0] == stats["synthetic.FC1-1"][0] + stats["synthetic.FC1-2"][0]
+    assert abs(stats["synthetic.FC1-1"][0] - stats["synthetic.FC1-2"][0]) <= 2
+    assert (
+        stats["synthetic"][1] == stats["synthetic.FC1-1"][1] + stats["synthetic.FC1-2"][1]
+    ).all()
+    assert stats["synthetic.FC1-1"][1].sum() > 0
+
+
+def test_call_genotypes():
+    ref_depths = np.array([0, 10, 5, 1, 0], dtype=np.int32)
+    alt_depths = np.array([0, 0, 5, 9, 3], dtype=np.int32)
+    assert extract.call_genotypes(0.1, ref_depths, alt_depths) == [
+        None,
+        vcf.Genotype.REF,
+        vcf.Genotype.HET,
+        vcf.Genotype.HET,
+        vcf.Genotype.HOM,
+    ]
@@ -1,10 +1,18 @@
 """Test for ``fastq-kmers``"""
 
+import io
+import random
+
+import numpy as np
+import pysam
+import pytest
+
 from qctk.config import CommonConfig, StorageEngine
 from qctk.common import GenomeRelease
 from qctk.fastq.config import FastqKmersConfig
 from qctk.fastq import kmers
-from qctk.models import fastq
+from qctk.fastq.reference import ReferenceReader
+from qctk.models import fastq, vcf
 from qctk.__main__ import main
 
 
@@ -34,6 +42,101 @@ def test_fastq_kmers_run_smoke_test(tmp_path):
     assert lines[-1] == ""
 
 
+@pytest.fixture
+def two_contigs_reference(tmp_path):
+    """The small reference split into two contigs with different line widths."""
+    with pysam.FastaFile("tests/data/small/ref.fasta") as fastaf:
+        seq = fastaf.fetch("contig")
+    contigs = {"chr1": seq[:40000], "chr2": seq[40000:]}
+    path_plain = tmp_path / "ref" / "ref.fasta"
+    path_plain.parent.mkdir()
+    with path_plain.open("wt") as outputf:
+        for (name, contig), width in zip(contigs.items(), (60, 77)):
+            print(">%s" % name, file=outputf)
+            for i in range(0, len(contig), width):
+                print(contig[i : i + width], file=outputf)
+    path_bgzf = tmp_path / "ref" / "ref.fasta.gz"
+    pysam.tabix_compress(str(path_plain), str(path_bgzf))
+    return contigs, str(path_plain), str(path_bgzf)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_reference_reader_kmers(two_contigs_reference, compressed):
+    contigs, path_plain, path_bgzf = two_contigs_reference
+    starts = [0, 59, 60, 119, 1234, len(contigs["chr1"]) - 21]
+    with ReferenceReader(path_bgzf if compressed else path_plain) as reader:
+        assert (reader.mm is None) == compressed
+        for name, contig in contigs.items():
+            kmers = reader.kmers(name, np.array(starts), 21)
+            assert [bytes(kmer).decode() for kmer in kmers] == [
+                contig[start : start + 21] for start in starts
+            ]
+        with pytest.raises(ValueError):
+            reader.kmers("chr1", np.array([len(contigs["chr1"]) - 20]), 21)
+
+
+@pytest.mark.parametrize("compressed,num_procs", [(False, 1), (True, 1), (False, 2), (True, 2)])
+def test_fastq_kmers_run_contigs(tmp_path, two_contigs_reference, compressed, num_procs):
+    contigs, path_plain, path_bgzf = two_contigs_reference
+    sites = [
+        vcf.Site(
+            genome_release="test-small",
+            chromosome=name,
+            position=position,
+            reference=contig[position - 1],
+            alternative="N",
+        )
+        for name, contig in contigs.items()
+        for position in range(11, len(contig) - 10, 997)
+    ]
+    shuffled = list(sites)
+    random.Random(42).shuffle(shuffled)
+
+    # Exercise the code.
+    config = FastqKmersConfig(
+        common=CommonConfig(storage_path=None, reference=path_bgzf if compressed else path_plain),
+        output_tsv=str(tmp_path / "out.tsv"),
+        genome_release="test-small",
+        num_procs=num_procs,
+    )
+    outputf = io.StringIO()
+    assert kmers._fastq_kmers_run(config, shuffled, outputf) == 0
+
+    # Check results, the sites are written in input order.
+    lines = outputf.getvalue().split("\n")
+    assert lines[0] == "#" + "\t".join(fastq.KmerInfo.headers())
+    assert lines[1:-1] == [
+        "\t".join(
+            map(
+                str,
+                (
+                    "test-small",
+                    site.chromosome,
+                    site.position,
+                    site.reference,
+                    "N",
+                    contigs[site.chromosome][site.position - 11 : site.position + 10],
+                ),
+            )
+        )
+        for site in shuffled
+    ]
+
+
+def test_group_sites():
+    sites = [
+        vcf.Site(
+            genome_release="test-small",
+            chromosome=chromosome,
+            position=position,
+            reference="A",
+            alternative="C",
+        )
+        for chromosome, position in [("2", 30), ("1", 20), ("2", 10), ("1", 5), ("X", 1)]
+    ]
+    assert kmers.group_sites(sites) == {"2": [2, 0], "1": [3, 1], "X": [4]}
+
+
 def test_fastq_kmers_via_args(mocker):
     mocker.patch.object(kmers, "fastq_kmers_run")
     main(
@@ -60,5 +163,6 @@ def test_fastq_kmers_via_args(mocker):
             output_tsv="/path/output.tsv.gz",
             max_sites=None,
             genome_release=GenomeRelease.GRCH37.value,
+            num_procs=1,
         )
     )
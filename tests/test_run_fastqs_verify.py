@@ -0,0 +1,225 @@
+"""Test for ``fastq-verify``"""
+
+import pytest
+
+from qctk.config import (
+    CommonConfig,
+    StorageEngine,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHECKPOINT_READS,
+    DEFAULT_CHUNK_RECORDS,
+    DEFAULT_DECOMPRESS_THREADS,
+    DEFAULT_METRICS_SECONDS,
+    DEFAULT_MIN_COV,
+    DEFAULT_MINIMIZER_LENGTH,
+    DEFAULT_MINIMIZER_WINDOW,
+    DEFAULT_QUEUE_DEPTH,
+    DEFAULT_SAMPLE_CHUNKS,
+    DEFAULT_THRESHOLD,
+    DEFAULT_VERIFY_CHECKPOINT_READS,
+    DEFAULT_VERIFY_CONFIDENCE,
+    DEFAULT_VERIFY_ERROR_RATE,
+    DEFAULT_VERIFY_MISMATCH_RATE,
+)
+from qctk.common import GenomeRelease
+from qctk.fastq import verify
+from qctk.fastq.config import FastqVerifyConfig, DEFAULT_KMER_ENGINE, DEFAULT_READER_STRATEGY
+from qctk.models import vcf
+from qctk.__main__ import main
+
+from .conftest import SYNTHETIC_GENOTYPES
+
+
+def test_fastq_verify_via_args(mocker):
+    mocker.patch.object(verify, "fastq_verify_run")
+    main(
+        [
+            "--storage-path",
+            "/path/storage",
+            "fastq-verify",
+            "--sample-id",
+            "test-sample",
+            "--input-files",
+            "/path/input.fastq.gz",
+        ]
+    )
+    verify.fastq_verify_run.assert_called_once_with(
+        FastqVerifyConfig(
+            common=CommonConfig(
+                storage_path="/path/storage",
+                verbose=False,
+                quiet=False,
+                storage_engine=StorageEngine.AUTO,
+                reference=None,
+            ),
+            input_files=["/path/input.fastq.gz"],
+            sample_id="test-sample",
+            kmer_infos=[],
+            genome_release=[GenomeRelease.GRCH37.value],
+            threshold=DEFAULT_THRESHOLD,
+            engine=DEFAULT_KMER_ENGINE.value,
+            mismatches=0,
+            paired=False,
+            batch_size=DEFAULT_BATCH_SIZE,
+            num_procs=1,
+            decompress_threads=DEFAULT_DECOMPRESS_THREADS,
+            queue_depth=DEFAULT_QUEUE_DEPTH,
+            count_threads=1,
+            minimizer_prefilter=False,
+            minimizer_length=DEFAULT_MINIMIZER_LENGTH,
+            minimizer_window=DEFAULT_MINIMIZER_WINDOW,
+            sample_fraction=None,
+            reader=DEFAULT_READER_STRATEGY.value,
+            sample_chunks=DEFAULT_SAMPLE_CHUNKS,
+            chunk_records=DEFAULT_CHUNK_RECORDS,
+            metrics_seconds=DEFAULT_METRICS_SECONDS,
+            partition_by=None,
+            min_cov=DEFAULT_MIN_COV,
+            saturation_fraction=None,
+            stable_checkpoints=None,
+            confidence=DEFAULT_VERIFY_CONFIDENCE,
+            error_rate=DEFAULT_VERIFY_ERROR_RATE,
+            mismatch_rate=DEFAULT_VERIFY_MISMATCH_RATE,
+            checkpoint_reads=DEFAULT_VERIFY_CHECKPOINT_READS,
+        )
+    )
+    assert DEFAULT_VERIFY_CHECKPOINT_READS < DEFAULT_CHECKPOINT_READS
+
+
+def _store_stats(path_storage, kmer_infos, shift):
+    site_stats = [
+        vcf.SiteStats(
+            site=kmer_info.site,
+            stats=vcf.VariantStats(
+                genotype=SYNTHETIC_GENOTYPES[(i + shift) % len(SYNTHETIC_GENOTYPES)], total_cov=20,
+            ),
+        )
+        for i, kmer_info in enumerate(kmer_infos)
+    ]
+    sample_stats = vcf.SampleStats(sample=vcf.Sample(name="synthetic"), site_stats=site_stats)
+    vcf.write_site_stats(sample_stats, str(path_storage), "synthetic")
+
+
+def test_expected_genotype_codes(synthetic_kmer_infos):
+    genotype = SYNTHETIC_GENOTYPES[0]
+    site_stats = [
+        vcf.SiteStats(
+            site=kmer_info.site, stats=vcf.VariantStats(genotype=genotype, total_cov=total_cov)
+        )
+        for kmer_info, total_cov in zip(synthetic_kmer_infos, [20, 5, 4, 0, None])
+    ]
+    sample_stats = vcf.SampleStats(sample=vcf.Sample(name="synthetic"), site_stats=site_stats)
+    codes = verify.expected_genotype_codes(synthetic_kmer_infos[:6], sample_stats, 5)
+    # Sites below the minimal coverage, including zero, and missing sites are no-calls; calls
+    # without coverage information are kept.
+    expected_code = verify.GENOTYPE_CODES.index(genotype)
+    assert codes.tolist() == [expected_code, expected_code, 0, 0, expected_code, 0]
+
+
+@pytest.mark.parametrize("shift,exit_code", [(0, 0), (1, 2)])
+def test_fastq_verify_run_synthetic(
+    tmp_path,
+    synthetic_kmer_infos,
+    synthetic_kmer_infos_path,
+    synthetic_fastq_paths,
+    shift,
+    exit_code,
+    mocker,
+):
+    path_storage = tmp_path / "storage"
+    _store_stats(path_storage, synthetic_kmer_infos, shift)
+    spy = mocker.spy(verify.VerificationMonitor, "evaluate")
+
+    config = FastqVerifyConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        checkpoint_reads=1000,
+    )
+    assert verify.fastq_verify_run(config) == exit_code
+    # Decided well before the end of the ~20k reads.
+    assert 1 <= spy.call_count < 10
+
+
+def test_fastq_verify_run_undecided(
+    tmp_path, synthetic_kmer_infos, synthetic_kmer_infos_path, synthetic_fastq_paths
+):
+    path_storage = tmp_path / "storage"
+    _store_stats(path_storage, synthetic_kmer_infos[:3], 0)
+
+    config = FastqVerifyConfig(
+        common=CommonConfig(storage_path=str(path_storage)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths[:1],
+        kmer_infos=synthetic_kmer_infos_path,
+    )
+    assert verify.fastq_verify_run(config) == 3
+
+
+def test_fastq_verify_run_missing_stats(tmp_path, synthetic_kmer_infos_path):
+    config = FastqVerifyConfig(
+        common=CommonConfig(storage_path=str(tmp_path)),
+        sample_id="synthetic",
+        input_files=[],
+        kmer_infos=synthetic_kmer_infos_path,
+    )
+    assert verify.fastq_verify_run(config) == 1
+
+
+@pytest.mark.parametrize(
+    "rates",
+    [
+        {"confidence": 0.0},
+        {"confidence": 1.0},
+        {"error_rate": 0.0},
+        {"error_rate": 0.3, "mismatch_rate": 0.2},
+        {"error_rate": 0.2, "mismatch_rate": 0.2},
+        {"mismatch_rate": 1.0},
+    ],
+)
+def test_fastq_verify_run_invalid_rates(tmp_path, synthetic_kmer_infos_path, rates):
+    config = FastqVerifyConfig(
+        common=CommonConfig(storage_path=str(tmp_path)),
+        sample_id="synthetic",
+        input_files=[],
+        kmer_infos=synthetic_kmer_infos_path,
+        **rates,
+    )
+    assert verify.fastq_verify_run(config) == 1
+
+
+@pytest.mark.parametrize(
+    "input_files,paired", [(["-", "-"], False), (["a.fq.gz"], True), (["a.bam", "b.fq.gz"], True)],
+)
+def test_fastq_verify_run_invalid_inputs(
+    tmp_path, synthetic_kmer_infos, synthetic_kmer_infos_path, input_files, paired
+):
+    _store_stats(tmp_path, synthetic_kmer_infos, 0)
+    config = FastqVerifyConfig(
+        common=CommonConfig(storage_path=str(tmp_path)),
+        sample_id="synthetic",
+        input_files=input_files,
+        kmer_infos=synthetic_kmer_infos_path,
+        paired=paired,
+    )
+    assert verify.fastq_verify_run(config) == 1
+
+
+@pytest.mark.parametrize("sample_fraction", [0.0, -0.5, 1.5])
+def test_fastq_verify_run_invalid_sample_fraction(
+    tmp_path,
+    synthetic_kmer_infos,
+    synthetic_kmer_infos_path,
+    synthetic_fastq_paths,
+    sample_fraction,
+):
+    _store_stats(tmp_path, synthetic_kmer_infos, 0)
+    config = FastqVerifyConfig(
+        common=CommonConfig(storage_path=str(tmp_path)),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+        sample_fraction=sample_fraction,
+    )
+    assert verify.fastq_verify_run(config) == 1
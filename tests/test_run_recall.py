@@ -0,0 +1,158 @@
+"""Test for ``recall``"""
+
+import json
+
+import cattr
+
+from qctk.fastq import extract
+from qctk.fastq.config import FastqExtractConfig
+from qctk.config import CommonConfig, StorageEngine, DEFAULT_RECALL_MIN_COV, DEFAULT_THRESHOLD
+from qctk.recall.config import RecallConfig
+from qctk.recall import recall
+from qctk.models import vcf
+from qctk.__main__ import main
+
+
+#: Reference and alternative allele counts of the sites of the test samples.
+COUNTS = [(20, 0), (16, 4), (10, 10), (1, 19), (0, 2), (0, 0)]
+
+
+def _write_sample(storage_path, sample_id, with_counts=True):
+    sample_stats = vcf.SampleStats(
+        sample=vcf.Sample(name=sample_id),
+        site_stats=[
+            vcf.SiteStats(
+                site=vcf.Site(
+                    genome_release="GRCh37",
+                    chromosome="1",
+                    position=j + 1,
+                    reference="A",
+                    alternative="T",
+                ),
+                stats=vcf.VariantStats(
+                    genotype=vcf.Genotype.REF,
+                    total_cov=ref_count + alt_count,
+                    alt_cov=alt_count,
+                    ref_count=ref_count if with_counts else None,
+                    alt_count=alt_count if with_counts else None,
+                ),
+            )
+            for j, (ref_count, alt_count) in enumerate(COUNTS)
+        ],
+        num_reads=1000,
+    )
+    return vcf.write_site_stats(sample_stats, storage_path, sample_id)
+
+
+def _read_genotypes(path):
+    with path.open("rt") as jsonf:
+        sample_stats = cattr.structure(json.load(jsonf), vcf.SampleStats)
+    return [site_stats.stats.genotype for site_stats in sample_stats.site_stats]
+
+
+def test_recall_run(tmp_path):
+    storage_path = str(tmp_path / "storage")
+    paths = [_write_sample(storage_path, sample_id) for sample_id in ("sample1", "sample2")]
+    path_old = _write_sample(storage_path, "old-sample", with_counts=False)
+    path_sim = paths[0].with_name(paths[0].name.replace("-stats.json", "-sim.json"))
+    with path_sim.open("wt") as jsonf:
+        json.dump(
+            [
+                {"sample_i": "old-sample", "sample_j": "sample1"},
+                {"sample_i": "old-sample", "sample_j": "zzz"},
+            ],
+            jsonf,
+        )
+
+    # Exercise the code.
+    config = RecallConfig(
+        common=CommonConfig(storage_path=storage_path), threshold=0.25, min_cov=3,
+    )
+    res = recall.recall_run(config)
+
+    # Check results.
+    assert res == 0
+    for path in paths:
+        assert _read_genotypes(path) == [
+            vcf.Genotype.REF,
+            vcf.Genotype.REF,
+            vcf.Genotype.HET,
+            vcf.Genotype.HOM,
+            None,
+            None,
+        ]
+    assert _read_genotypes(path_old) == [vcf.Genotype.REF] * len(COUNTS)
+    with path_sim.open("rt") as jsonf:
+        assert json.load(jsonf) == [{"sample_i": "old-sample", "sample_j": "zzz"}]
+
+
+def test_recall_run_sample_ids(tmp_path):
+    storage_path = str(tmp_path / "storage")
+    path1 = _write_sample(storage_path, "sample1")
+    path2 = _write_sample(storage_path, "sample2")
+
+    # Exercise the code.
+    config = RecallConfig(common=CommonConfig(storage_path=storage_path), sample_ids=["sample2"])
+    res = recall.recall_run(config)
+
+    # Check results.
+    assert res == 0
+    assert _read_genotypes(path1) == [vcf.Genotype.REF] * len(COUNTS)
+    assert _read_genotypes(path2) == [
+        vcf.Genotype.REF,
+        vcf.Genotype.HET,
+        vcf.Genotype.HET,
+        vcf.Genotype.HOM,
+        vcf.Genotype.HOM,
+        None,
+    ]
+
+
+def test_recall_run_without_counts(tmp_path):
+    storage_path = str(tmp_path / "storage")
+    _write_sample(storage_path, "old-sample", with_counts=False)
+
+    config = RecallConfig(common=CommonConfig(storage_path=storage_path))
+    assert recall.recall_run(config) == 1
+
+
+def test_recall_run_after_fastq_extract(tmp_path, synthetic_kmer_infos_path, synthetic_fastq_paths):
+    storage_path = str(tmp_path / "storage")
+    config = FastqExtractConfig(
+        common=CommonConfig(storage_path=storage_path),
+        sample_id="synthetic",
+        input_files=synthetic_fastq_paths,
+        kmer_infos=synthetic_kmer_infos_path,
+    )
+    assert extract.fastq_extract_run(config) == 0
+    path = vcf.sample_path(storage_path, "synthetic")
+    genotypes = _read_genotypes(path)
+
+    # Calling again with the same threshold gives the same genotypes.
+    config = RecallConfig(common=CommonConfig(storage_path=storage_path))
+    assert recall.recall_run(config) == 0
+    assert _read_genotypes(path) == genotypes
+
+    # Calling again with a high minimal coverage gives no-calls only.
+    config = RecallConfig(common=CommonConfig(storage_path=storage_path), min_cov=10000)
+    assert recall.recall_run(config) == 0
+    assert set(_read_genotypes(path)) == {None}
+
+
+def test_recall_via_args(mocker):
+    mocker.patch.object(recall, "recall_run")
+    main(["--storage-path", "/path/storage", "recall", "--sample-ids", "sample1", "sample2"])
+    recall.recall_run.assert_called_once_with(
+        RecallConfig(
+            common=CommonConfig(
+                storage_path="/path/storage",
+                verbose=False,
+                quiet=False,
+                storage_engine=StorageEngine.AUTO,
+                reference=None,
+            ),
+            sample_ids=["sample1", "sample2"],
+            threshold=DEFAULT_THRESHOLD,
+            min_cov=DEFAULT_RECALL_MIN_COV,
+        )
+    )